@@ -1,12 +1,20 @@
 
+import asyncio
 from modules.extract_signature import extract_signature
 from modules.fuse_perspectives import fuse_perspectives
-from modules.generate_binders import generate_binders
+from modules.generate_binders import AntibodyGenerator, generate_binders
 from modules.run_simulations import run_simulations
 from modules.validate_ethics import validate_ethics
 from modules.personalize_binders import personalize_binders
 from modules.exporter import export_designs
 
+PATIENT_DATA = {
+    "immune_profile": ["A*24:02", "B*27:05"],
+    "metabolic_rate": 1.2,
+    "prior_exposure": ["SARS-CoV-2", "Influenza-B"],
+    "ancestry_profile": ["Native", "Irish"]
+}
+
 def codette_pipeline(target_input):
     # Stage 1: Extract Signature
     sig = extract_signature(target_input)
@@ -24,17 +32,37 @@ def codette_pipeline(target_input):
     ethics_checked = validate_ethics(scored)
 
     # Stage 6: Personalization
-    personalized = personalize_binders(ethics_checked, patient_data={
-        "immune_profile": ["A*24:02", "B*27:05"],
-        "metabolic_rate": 1.2,
-        "prior_exposure": ["SARS-CoV-2", "Influenza-B"],
-        "ancestry_profile": ["Native", "Irish"]
-    })
+    personalized = personalize_binders(ethics_checked, patient_data=PATIENT_DATA)
 
     # Stage 7: Export
     result = export_designs(personalized)
     return result
 
+def _screen_binder(binder):
+    # Stages 4-5 for a single binder
+    return validate_ethics(run_simulations({"generated_binders": [binder]}))
+
+async def codette_pipeline_stream(target_input, num_candidates=10):
+    # Stages 1-2 as in codette_pipeline
+    sig = extract_signature(target_input)
+    context = fuse_perspectives(sig)
+
+    # Stages 3-5: screen each binder as soon as it is generated
+    generator = AntibodyGenerator()
+    screening = []
+    async for binder in generator.agenerate_binders(context, num_candidates):
+        screening.append(asyncio.create_task(asyncio.to_thread(_screen_binder, binder)))
+    screened = await asyncio.gather(*screening)
+
+    ethics_checked = {
+        "validated_binders": [b for result in screened for b in result["validated_binders"]],
+        "ethics_rejections": [b for result in screened for b in result["ethics_rejections"]]
+    }
+
+    # Stages 6-7 as in codette_pipeline
+    personalized = personalize_binders(ethics_checked, patient_data=PATIENT_DATA)
+    return export_designs(personalized)
+
 if __name__ == "__main__":
     # Example input
     test_seq = "MVLSPADKTNVKAAWGKVGAHAGEYGAEALERMFLSFPTTKTYFPHFD"
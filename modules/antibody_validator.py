@@ -3,33 +3,33 @@ Enhanced sequence validation module for antibody therapeutics.
 """
 
 import json
-import os
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 import numpy as np
 from Bio.SeqUtils.ProtParam import ProteinAnalysis
+from .similarity_service import get_similarity_service
 
 class AntibodyValidator:
-    def __init__(self, validation_data_path: str = None):
+    def __init__(self, validation_data_path: str = None, similarity: str = 'prefix'):
         """
         Initialize validator with therapeutic antibody dataset.
         
         Args:
-            validation_data_path: Path to validation dataset JSON file
+            validation_data_path: Path to validation dataset JSON file or compiled
+                reference database (.refdb)
+            similarity: Similarity backend, 'prefix' for position-by-position
+                comparison or 'alignment' for banded Smith-Waterman with BLOSUM62
         """
-        if validation_data_path is None:
-            validation_data_path = os.path.join(
-                os.path.dirname(__file__), 
-                'data', 
-                'therapeutic_antibodies.json'
-            )
-        
-        with open(validation_data_path, 'r') as f:
-            self.validation_data = json.load(f)
+        # Dataset and reference index are loaded once per process and shared
+        self.similarity_service = get_similarity_service(validation_data_path, similarity)
+        self.validation_data = self.similarity_service.data
         
         # Extract validation metrics and data
         self.metrics = self.validation_data['validation_metrics']
         self.antibodies = self.validation_data['therapeutic_antibodies']
         
+        # Reference chains pre-encoded for one-pass similarity search
+        self.reference_index = self.similarity_service.index
+        
         # Default configuration
         self.config = {
             "sequence_properties": {
@@ -63,31 +63,7 @@ class AntibodyValidator:
         Returns:
             Similarity score between 0 and 1
         """
-        # Define amino acid similarity groups
-        similar_groups = [
-            set('ILVM'),   # Aliphatic
-            set('FYW'),    # Aromatic
-            set('KRH'),    # Basic
-            set('DE'),     # Acidic
-            set('STNQ'),   # Polar
-            set('AG'),     # Small
-            set('C'),      # Cysteine
-            set('P')       # Proline
-        ]
-        
-        def aa_similarity(aa1: str, aa2: str) -> float:
-            if aa1 == aa2:
-                return 1.0
-            for group in similar_groups:
-                if aa1 in group and aa2 in group:
-                    return 0.5
-            return 0.0
-        
-        min_length = min(len(seq1), len(seq2))
-        scores = [aa_similarity(a, b) for a, b in zip(seq1[:min_length], seq2[:min_length])]
-        length_penalty = abs(len(seq1) - len(seq2)) * 0.1
-        
-        return max(0.0, min(1.0, sum(scores) / len(scores) - length_penalty)) if scores else 0.0
+        return self.similarity_service.chain_similarity(seq1, seq2)
 
     def analyze_sequence(self, sequence: str) -> Dict:
         """
@@ -174,12 +150,14 @@ class AntibodyValidator:
         
         return results
 
-    def validate_antibody(self, sequence: Dict[str, str]) -> Dict:
+    def validate_antibody(self, sequence: Dict[str, str], find_similar: bool = True) -> Dict:
         """
         Perform comprehensive antibody validation.
         
         Args:
             sequence: Dictionary with 'heavy_chain' and 'light_chain' sequences
+            find_similar: Search the reference set for similar antibodies; batch
+                callers pass False and add hits with add_similar_antibodies
             
         Returns:
             Validation results
@@ -211,20 +189,29 @@ class AntibodyValidator:
                 )
         
         # Find similar antibodies
-        if results["valid"]:
-            similar = self.find_similar_antibodies(sequence)
-            if similar:
-                results["similar_antibodies"] = similar
-                
-                # Warning if too similar to existing antibody
-                if similar[0]["similarity_score"] > 0.9:
-                    results["warnings"].append(
-                        f"Very high similarity ({similar[0]['similarity_score']:.3f}) "
-                        f"to existing antibody {similar[0]['name']}"
-                    )
+        if results["valid"] and find_similar:
+            self.add_similar_antibodies(results, self.find_similar_antibodies(sequence))
         
         return results
 
+    def add_similar_antibodies(self, results: Dict, similar: List[Dict]):
+        """
+        Attach similar reference antibodies to validation results.
+        
+        Args:
+            results: Results of validate_antibody, updated in place
+            similar: Similar antibodies, most similar first
+        """
+        if similar:
+            results["similar_antibodies"] = similar
+            
+            # Warning if too similar to existing antibody
+            if similar[0]["similarity_score"] > 0.9:
+                results["warnings"].append(
+                    f"Very high similarity ({similar[0]['similarity_score']:.3f}) "
+                    f"to existing antibody {similar[0]['name']}"
+                )
+
     def find_similar_antibodies(self, sequence: Dict[str, str], threshold: float = 0.7) -> List[Dict]:
         """
         Find similar therapeutic antibodies in the validation set.
@@ -236,47 +223,36 @@ class AntibodyValidator:
         Returns:
             List of similar antibodies with similarity scores
         """
-        similar_antibodies = []
-        
-        for antibody in self.antibodies:
-            heavy_similarity = self.calculate_similarity(
-                sequence['heavy_chain'],
-                antibody['sequence']['heavy_chain']
-            )
-            
-            light_similarity = self.calculate_similarity(
-                sequence['light_chain'],
-                antibody['sequence']['light_chain']
-            )
-            
-            # Weight heavy chain more in similarity calculation
-            overall_similarity = (0.6 * heavy_similarity + 0.4 * light_similarity)
-            
-            if overall_similarity >= threshold:
-                similar_antibodies.append({
-                    'name': antibody['name'],
-                    'similarity_score': round(overall_similarity, 3),
-                    'heavy_chain_similarity': round(heavy_similarity, 3),
-                    'light_chain_similarity': round(light_similarity, 3),
-                    'target': antibody['target'],
-                    'antibody_type': antibody['antibody_type']
-                })
-        
-        return sorted(similar_antibodies, key=lambda x: x['similarity_score'], reverse=True)
+        return self.reference_index.find_similar(sequence, threshold)
 
 def validate_generated_sequences(sequences: List[Dict[str, str]], 
-                              output_file: str = None) -> Dict:
+                              output_file: str = None, top_k: Optional[int] = None,
+                              chunk_size: int = 256, similarity: str = 'prefix') -> Dict:
     """
     Validate a set of generated sequences against therapeutic antibody dataset.
     
+    Similar antibodies are retrieved for all valid sequences in one batch
+    instead of re-scoring the reference set once per sequence.
+    
     Args:
         sequences: List of sequences to validate
         output_file: Optional path to save validation results
+        top_k: Maximum similar antibodies reported per sequence; None reports all
+        chunk_size: Sequences scored per similarity tile, bounding memory use
+        similarity: Similarity backend, 'prefix' or 'alignment'
         
     Returns:
         Dictionary containing validation results
     """
-    validator = AntibodyValidator()
+    validator = AntibodyValidator(similarity=similarity)
+    
+    validations = [validator.validate_antibody(sequence, find_similar=False) for sequence in sequences]
+    valid = [i for i, validation in enumerate(validations) if validation['valid']]
+    hits = validator.reference_index.top_k(
+        [sequences[i] for i in valid], k=top_k, threshold=0.7, query_chunk=chunk_size
+    )
+    for i, similar in zip(valid, hits):
+        validator.add_similar_antibodies(validations[i], similar)
     
     results = {
         'validated_sequences': [],
@@ -288,9 +264,7 @@ def validate_generated_sequences(sequences: List[Dict[str, str]],
         }
     }
     
-    for sequence in sequences:
-        validation = validator.validate_antibody(sequence)
-        
+    for sequence, validation in zip(sequences, validations):
         results['validated_sequences'].append({
             'sequence': sequence,
             'validation': validation
@@ -0,0 +1,90 @@
+"""
+Asynchronous streaming of generation attempts.
+
+Generation attempts run back to back in a worker thread and every accepted
+binder is handed to the consumer as soon as it passes validation, so
+downstream stages can start on early binders while later ones are still
+being generated.
+"""
+
+import asyncio
+import threading
+from typing import AsyncIterator, Callable, Dict, Optional
+
+_DONE = object()
+
+
+async def stream_attempts(attempt: Callable[[], Optional[Dict]], num_candidates: int,
+                          max_attempts: int, stats: Optional[Dict] = None,
+                          should_stop: Optional[Callable[[], bool]] = None,
+                          on_finish: Optional[Callable[[], None]] = None) -> AsyncIterator[Dict]:
+    """
+    Run generation attempts in a background thread and yield accepted binders.
+
+    Attempts stop once ``num_candidates`` binders are accepted, once
+    ``max_attempts`` is reached, when ``should_stop`` returns True, or when
+    the consumer stops iterating (``break``, ``aclose()`` or task
+    cancellation). A stop request takes effect after the attempt currently
+    in progress.
+
+    Args:
+        attempt: Callable running one generation attempt; returns the
+            accepted binder or None
+        num_candidates: Number of binders to accept before stopping
+        max_attempts: Maximum number of attempts
+        stats: Optional dictionary updated in place with attempts and
+            success_rate
+        should_stop: Optional callable checked after every attempt; returning
+            True ends generation early, e.g. when yield has collapsed
+        on_finish: Optional callable run in the worker thread after the last
+            attempt, before iteration ends, e.g. to add run summaries to stats
+
+    Yields:
+        Accepted binder dictionaries in acceptance order
+    """
+    loop = asyncio.get_running_loop()
+    results = asyncio.Queue()
+    stop = threading.Event()
+    stats = stats if stats is not None else {}
+    stats.update({"attempts": 0, "success_rate": 0})
+
+    def put(item):
+        try:
+            loop.call_soon_threadsafe(results.put_nowait, item)
+        except RuntimeError:
+            pass  # Event loop already closed after the consumer went away
+
+    def produce():
+        accepted = 0
+        try:
+            while accepted < num_candidates and stats["attempts"] < max_attempts and not stop.is_set():
+                stats["attempts"] += 1
+                binder = attempt()
+                if binder is not None:
+                    accepted += 1
+                    put(binder)
+                stats["success_rate"] = accepted / stats["attempts"]
+                if should_stop is not None and should_stop():
+                    break
+        except Exception as e:
+            put(e)
+        finally:
+            try:
+                if on_finish is not None:
+                    on_finish()
+            except Exception as e:
+                put(e)
+            put(_DONE)
+
+    producer = loop.run_in_executor(None, produce)
+    try:
+        while True:
+            item = await results.get()
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+        await producer
+    finally:
+        stop.set()
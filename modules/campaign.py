@@ -0,0 +1,200 @@
+"""
+Resumable generation campaigns backed by an append-only checkpoint log.
+
+A campaign is a generate_binders run whose progress is appended to a JSONL
+log: a header naming the target, then one record per accepted binder and
+every few attempts without one. Each record holds the attempt counter, the
+oversampler state and the seed Python, NumPy and torch were reset to right
+after it, so a restarted campaign continues exactly where the log ends
+without regenerating accepted binders. A torn last line from a crash is
+dropped. Once the quota is reached the log is compacted into the normal
+generate_binders output JSON and removed.
+
+Usage:
+    python -m modules.campaign MVLSPADKTNVKAAWGKVGAHAGEYGAEALERMFLSFPTTKTYFPHFD \
+        --num-candidates 5000 --checkpoint output/campaign.jsonl
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .parallel_generation import load_generator, seed_everything
+
+logger = logging.getLogger(__name__)
+
+
+def _json_default(value):
+    """Convert NumPy scalars and arrays found in binder analyses."""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class CampaignCheckpoint:
+    """Append-only JSONL checkpoint of a generation campaign."""
+
+    def __init__(self, path: str, output_path: Optional[str] = None, seed: int = 42, every: int = 25):
+        """
+        Args:
+            path: Checkpoint log; an existing log is resumed
+            output_path: Compacted result file; defaults to the log path with a .json suffix
+            seed: Campaign seed for new logs; resumed logs keep their own
+            every: Attempts between progress records when no binder is accepted
+        """
+        self.path = path
+        self.output_path = output_path or os.path.splitext(path)[0] + '.json'
+        self.seed = seed
+        self.every = every
+        self.resumed_attempts = 0
+        self.resumed_binders = 0
+
+    def _attempt_seed(self, attempts: int) -> int:
+        return int(np.random.SeedSequence(self.seed, spawn_key=(attempts,)).generate_state(1)[0])
+
+    def _read(self) -> List[Dict]:
+        """Parse the log, truncating a torn last line left by a crash."""
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        complete = data.rfind(b'\n') + 1
+        if complete < len(data):
+            logger.warning(f"Dropping incomplete checkpoint record in {self.path}")
+            with open(self.path, 'r+b') as f:
+                f.truncate(complete)
+        return [json.loads(line) for line in data[:complete].decode().splitlines() if line.strip()]
+
+    def _append(self, record: Dict):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record, default=_json_default) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def resume(self, fusion_context: Dict, num_candidates: int, oversampler,
+               seen_filter=None) -> Tuple[List[Dict], int]:
+        """
+        Start a new campaign or restore the state at the end of an existing log.
+
+        Args:
+            fusion_context: Fusion context of the campaign's target
+            num_candidates: Campaign quota
+            oversampler: Generator's AdaptiveOversampler, restored in place
+            seen_filter: Optional SeenSequenceFilter that restored binders are added to
+
+        Returns:
+            Accepted binders and the attempt counter to continue from
+        """
+        target = fusion_context.get('cleaned_sequence', '')
+        records = self._read()
+        if not records:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._append({"campaign": {"target": target, "num_candidates": num_candidates,
+                                       "seed": self.seed, "started": time.time()}})
+            seed_everything(self._attempt_seed(0))
+            return [], 0
+
+        header = records[0]["campaign"]
+        if header["target"] != target or header["num_candidates"] != num_candidates:
+            raise ValueError(f"Checkpoint {self.path} belongs to a different campaign")
+        self.seed = header["seed"]
+
+        progress = records[1:]
+        binders = [record["binder"] for record in progress if record.get("binder") is not None]
+        attempts = progress[-1]["attempts"] if progress else 0
+        if progress:
+            oversampler.load_state(progress[-1]["oversampler"])
+        if seen_filter is not None:
+            for binder in binders:
+                seen_filter.seen_binder(binder["sequence"])
+        seed_everything(progress[-1]["seed"] if progress else self._attempt_seed(0))
+
+        self.resumed_attempts, self.resumed_binders = attempts, len(binders)
+        logger.info(f"Resumed campaign at attempt {attempts} with {len(binders)} binders")
+        return binders, attempts
+
+    def record(self, attempts: int, binder: Optional[Dict], oversampler):
+        """
+        Append progress after an attempt and reseed from the new record.
+
+        Records are written for every accepted binder and every ``every``
+        attempts otherwise.
+
+        Args:
+            attempts: Attempts made so far
+            binder: Binder accepted by this attempt, if any
+            oversampler: Generator's AdaptiveOversampler
+        """
+        if binder is None and attempts % self.every:
+            return
+        seed = self._attempt_seed(attempts)
+        self._append({"attempts": attempts, "seed": seed, "binder": binder,
+                      "oversampler": oversampler.state()})
+        seed_everything(seed)
+
+    def summary(self) -> Dict:
+        """Campaign seed, files and the progress restored from the log."""
+        return {
+            "checkpoint": self.path,
+            "output": self.output_path,
+            "seed": self.seed,
+            "resumed_attempts": self.resumed_attempts,
+            "resumed_binders": self.resumed_binders
+        }
+
+    def compact(self, result: Dict) -> str:
+        """
+        Write the finished campaign as generate_binders output and remove the log.
+
+        Args:
+            result: Final generate_binders result
+
+        Returns:
+            Path of the compacted result
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.output_path)), exist_ok=True)
+        temp_path = self.output_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(result, f, indent=2, default=_json_default)
+        os.replace(temp_path, self.output_path)
+        os.remove(self.path)
+        return self.output_path
+
+
+def main():
+    """Run or resume a checkpointed generation campaign."""
+    parser = argparse.ArgumentParser(description='Resumable generation campaign')
+    parser.add_argument('sequence', help='Target amino acid sequence')
+    parser.add_argument('--num-candidates', type=int, default=1000, help='Campaign quota')
+    parser.add_argument('--checkpoint', default='output/campaign.jsonl', help='Checkpoint log')
+    parser.add_argument('--output', help='Compacted result file (default: checkpoint with .json suffix)')
+    parser.add_argument('--seed', type=int, default=42, help='Seed for a new campaign')
+    parser.add_argument('--every', type=int, default=25,
+                        help='Attempts between progress records without accepted binders')
+    parser.add_argument('--generator', choices=['original', 'revised'], default='original',
+                        help='Generator implementation to run')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    checkpoint = CampaignCheckpoint(args.checkpoint, args.output, args.seed, args.every)
+    if os.path.exists(checkpoint.output_path) and not os.path.exists(checkpoint.path):
+        logger.info(f"Campaign already complete: {checkpoint.output_path}")
+        return
+
+    generator = load_generator(args.generator)
+    result = generator.generate_binders({'cleaned_sequence': args.sequence}, args.num_candidates,
+                                        checkpoint=checkpoint)
+    logger.info(f"Generated {len(result['generated_binders'])} binders in "
+                f"{result['stats']['attempts']} attempts; wrote {checkpoint.output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Decoding helpers for CDR generation with ProtGPT2.
+
+ProtGPT2 uses a byte-level BPE vocabulary in which a single token can
+carry several residues, whitespace or non-residue symbols. The helpers
+here precompute per-token residue counts once per tokenizer so decoding
+controls (such as stopping on CDR length) can work on token ids directly
+instead of decoding text at every step. They also precompute the set of
+tokens whose text is purely amino acids, which is used as a static logit
+mask so the CDR segment only ever decodes to usable residues.
+"""
+
+import hashlib
+import os
+import weakref
+from typing import List, Optional
+
+import numpy as np
+import torch
+from transformers import StoppingCriteria, StoppingCriteriaList
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+
+# Directory for amino acid token masks of tokenizers not loaded from a local snapshot
+DEFAULT_MASK_DIR = 'models/token_masks'
+
+# Residue count tables and amino acid masks, computed once per tokenizer instance
+_RESIDUE_COUNT_CACHE = weakref.WeakKeyDictionary()
+_AMINO_ACID_MASK_CACHE = weakref.WeakKeyDictionary()
+_SUPPRESS_CACHE = weakref.WeakKeyDictionary()
+
+
+def token_residue_counts(tokenizer) -> torch.Tensor:
+    """
+    Count the amino acid residues contributed by every token id.
+
+    Args:
+        tokenizer: Hugging Face tokenizer used for generation
+
+    Returns:
+        Long tensor of shape (vocab_size,) with the number of residue
+        characters in the decoded text of each token
+    """
+    counts = _RESIDUE_COUNT_CACHE.get(tokenizer)
+    if counts is None:
+        texts = tokenizer.batch_decode(
+            [[token_id] for token_id in range(len(tokenizer))],
+            skip_special_tokens=True
+        )
+        counts = torch.tensor(
+            [sum(ch in AMINO_ACIDS for ch in text) for text in texts],
+            dtype=torch.long
+        )
+        _RESIDUE_COUNT_CACHE[tokenizer] = counts
+    return counts
+
+
+def _mask_cache_path(tokenizer, cache_dir: Optional[str]) -> Optional[str]:
+    """Location of the on-disk amino acid mask for a tokenizer, if it can be cached."""
+    name = getattr(tokenizer, 'name_or_path', '')
+    if cache_dir is None:
+        if not name:
+            return None
+        # Keep the mask next to a local model snapshot when there is one
+        cache_dir = name if os.path.isdir(name) else DEFAULT_MASK_DIR
+    key = hashlib.sha1(f"{name}:{len(tokenizer)}".encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, f"amino_acid_tokens-{key}.npy")
+
+
+def amino_acid_token_mask(tokenizer, cache_dir: Optional[str] = None) -> torch.Tensor:
+    """
+    Mark the token ids whose decoded text consists only of amino acids.
+
+    The mask is computed once per tokenizer and cached on disk, next to the
+    model when the tokenizer was loaded from a local directory and under
+    models/token_masks otherwise.
+
+    Args:
+        tokenizer: Hugging Face tokenizer used for generation
+        cache_dir: Directory for the on-disk cache, overriding the default
+
+    Returns:
+        Bool tensor of shape (vocab_size,)
+    """
+    mask = _AMINO_ACID_MASK_CACHE.get(tokenizer)
+    if mask is not None:
+        return mask
+
+    path = _mask_cache_path(tokenizer, cache_dir)
+    if path is not None and os.path.exists(path):
+        mask = torch.from_numpy(np.load(path))
+    else:
+        texts = tokenizer.batch_decode(
+            [[token_id] for token_id in range(len(tokenizer))],
+            skip_special_tokens=True
+        )
+        mask = torch.tensor([bool(text) and all(ch in AMINO_ACIDS for ch in text) for text in texts])
+        if path is not None:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                np.save(path, mask.numpy())
+            except OSError:
+                pass  # Read-only model directory; the mask stays cached in memory
+
+    _AMINO_ACID_MASK_CACHE[tokenizer] = mask
+    return mask
+
+
+def non_amino_acid_token_ids(tokenizer, cache_dir: Optional[str] = None) -> List[int]:
+    """
+    Token ids to suppress while decoding a CDR.
+
+    Every token that is not purely amino acids is listed except the end of
+    sequence token, so samples can still finish early. Pass the result as
+    ``suppress_tokens`` to ``generate``.
+
+    Args:
+        tokenizer: Hugging Face tokenizer used for generation
+        cache_dir: Directory for the on-disk mask cache
+
+    Returns:
+        Sorted list of token ids
+    """
+    suppress = _SUPPRESS_CACHE.get(tokenizer)
+    if suppress is None:
+        mask = amino_acid_token_mask(tokenizer, cache_dir)
+        eos_token_id = getattr(tokenizer, 'eos_token_id', None)
+        suppress = [i for i in torch.nonzero(~mask).flatten().tolist() if i != eos_token_id]
+        _SUPPRESS_CACHE[tokenizer] = suppress
+    return suppress
+
+
+class CDRLengthStoppingCriteria(StoppingCriteria):
+    """
+    Stop each sampled sequence once its CDR reaches the maximum length.
+
+    Residues are counted over the tokens generated after the prompt, which
+    always ends with the ``<CDR>`` marker. Rows are reported as finished
+    individually, so ``generate`` pads them from that point and returns as
+    soon as every beam or sample is done.
+    """
+
+    def __init__(self, residue_counts: torch.Tensor, prompt_length: int, max_residues: int):
+        """
+        Args:
+            residue_counts: Per-token residue counts from token_residue_counts
+            prompt_length: Number of prompt tokens preceding the CDR segment
+            max_residues: Maximum number of CDR residues to decode
+        """
+        self.residue_counts = residue_counts
+        self.prompt_length = prompt_length
+        self.max_residues = max_residues
+
+    def __call__(self, input_ids: torch.LongTensor, scores: Optional[torch.FloatTensor] = None,
+                 **kwargs) -> torch.BoolTensor:
+        generated = input_ids[:, self.prompt_length:]
+        table = self.residue_counts.to(generated.device)
+        # Ids past the tokenizer vocabulary (embedding padding) never decode to residues
+        in_vocab = generated < len(table)
+        per_token = torch.where(in_vocab, table[generated.clamp(max=len(table) - 1)], 0)
+        return per_token.sum(dim=1) >= self.max_residues
+
+
+def cdr_stopping_criteria(tokenizer, prompt_length: int, max_residues: int) -> StoppingCriteriaList:
+    """
+    Build the stopping criteria list used for CDR generation.
+
+    Args:
+        tokenizer: Hugging Face tokenizer used for generation
+        prompt_length: Number of prompt tokens preceding the CDR segment
+        max_residues: Maximum number of CDR residues to decode
+
+    Returns:
+        StoppingCriteriaList to pass to ``model.generate``
+    """
+    return StoppingCriteriaList([
+        CDRLengthStoppingCriteria(token_residue_counts(tokenizer), prompt_length, max_residues)
+    ])
@@ -0,0 +1,263 @@
+"""
+Persistent CDR library and combinatorial antibody assembly.
+
+Every CDR that passes the generators' quality filters can be recorded in a
+local SQLite library together with its germline template, generation
+context and quality metrics. Full VH/VL candidates are then assembled
+combinatorially from stored CDRs without calling the language model, which
+turns expensive generation into a periodic library refresh.
+"""
+
+import json
+import random
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+CHAINS = ('VH', 'VL')
+CDR_POSITIONS = (1, 2, 3)
+
+
+class CDRLibrary:
+    """Indexed SQLite store of generated CDR sequences."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS cdrs (
+            id INTEGER PRIMARY KEY,
+            sequence TEXT NOT NULL,
+            chain TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            template TEXT NOT NULL,
+            context TEXT NOT NULL,
+            metrics TEXT NOT NULL,
+            times_seen INTEGER NOT NULL DEFAULT 1,
+            created_at TEXT NOT NULL,
+            UNIQUE (sequence, chain, position, template, context)
+        );
+        CREATE INDEX IF NOT EXISTS idx_cdrs_slot ON cdrs (chain, position, template);
+        CREATE INDEX IF NOT EXISTS idx_cdrs_context ON cdrs (context);
+    """
+
+    def __init__(self, path: str = 'output/cdr_library.sqlite'):
+        """
+        Open (or create) a CDR library.
+
+        Args:
+            path: SQLite database file, or ':memory:' for a temporary library
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._conn:
+            self._conn.executescript(self.SCHEMA)
+
+    def close(self):
+        """Close the underlying database connection."""
+        self._conn.close()
+
+    def add(self, sequence: str, chain: str, position: int, template: str,
+            context: str = '', metrics: Optional[Dict] = None):
+        """
+        Record an accepted CDR.
+
+        Re-adding a known CDR for the same slot, template and context only
+        increments its ``times_seen`` counter.
+
+        Args:
+            sequence: CDR amino acid sequence
+            chain: 'VH' or 'VL'
+            position: CDR number (1, 2 or 3)
+            template: Germline template name the CDR was generated for
+            context: Generation context used in the prompt
+            metrics: Quality metrics for the CDR
+        """
+        self.add_many([{
+            'sequence': sequence, 'chain': chain, 'position': position,
+            'template': template, 'context': context, 'metrics': metrics or {}
+        }])
+
+    def add_many(self, records: List[Dict]):
+        """
+        Record several accepted CDRs in one transaction.
+
+        Args:
+            records: Dictionaries with the arguments accepted by add()
+        """
+        now = datetime.now(timezone.utc).isoformat()
+        rows = []
+        for record in records:
+            if record['chain'] not in CHAINS or record['position'] not in CDR_POSITIONS:
+                raise ValueError(f"Invalid CDR slot {record['chain']} CDR{record['position']}")
+            rows.append((
+                record['sequence'], record['chain'], record['position'], record['template'],
+                record.get('context', ''), json.dumps(record.get('metrics') or {}), now
+            ))
+
+        with self._lock, self._conn:
+            self._conn.executemany(
+                """INSERT INTO cdrs (sequence, chain, position, template, context, metrics, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (sequence, chain, position, template, context)
+                   DO UPDATE SET times_seen = times_seen + 1""",
+                rows
+            )
+
+    def query(self, chain: str, position: int, template: Optional[str] = None,
+              context: Optional[str] = None, limit: Optional[int] = None) -> List[Dict]:
+        """
+        Fetch stored CDRs for one slot.
+
+        Args:
+            chain: 'VH' or 'VL'
+            position: CDR number (1, 2 or 3)
+            template: Restrict to CDRs generated for this template
+            context: Restrict to CDRs generated with this context
+            limit: Maximum number of records to return
+
+        Returns:
+            List of CDR records with decoded metrics
+        """
+        sql = "SELECT * FROM cdrs WHERE chain = ? AND position = ?"
+        params = [chain, position]
+        if template is not None:
+            sql += " AND template = ?"
+            params.append(template)
+        if context is not None:
+            sql += " AND context = ?"
+            params.append(context)
+        sql += " ORDER BY id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+
+        records = []
+        for row in rows:
+            record = dict(row)
+            record['metrics'] = json.loads(record['metrics'])
+            records.append(record)
+        return records
+
+    def templates(self, chain: str) -> List[str]:
+        """Return templates that have CDRs stored for all three positions of a chain."""
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT template FROM cdrs WHERE chain = ?
+                   GROUP BY template HAVING COUNT(DISTINCT position) = 3
+                   ORDER BY template""",
+                (chain,)
+            ).fetchall()
+        return [row['template'] for row in rows]
+
+    def count(self, chain: Optional[str] = None) -> int:
+        """Return the number of distinct CDR records, optionally for one chain."""
+        sql, params = "SELECT COUNT(*) FROM cdrs", ()
+        if chain is not None:
+            sql, params = sql + " WHERE chain = ?", (chain,)
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()[0]
+
+
+class CombinatorialAssembler:
+    """
+    Assemble VH/VL candidates from library CDRs without the language model.
+
+    Each CDR slot is sampled from the library records for the chosen
+    template. Sampling weights decay with how often a CDR has already been
+    used in the current batch, which spreads candidates across the library,
+    and assembled sequences are deduplicated.
+    """
+
+    def __init__(self, library: CDRLibrary, templates: Dict[str, Dict[str, Dict[str, str]]],
+                 diversity: float = 1.0, seed: Optional[int] = None):
+        """
+        Args:
+            library: CDR library to draw from
+            templates: Germline templates as {'VH': {name: FRs}, 'VL': {name: FRs}}
+            diversity: Strength of the reuse penalty; 0 samples uniformly
+            seed: Seed for reproducible sampling
+        """
+        self.library = library
+        self.templates = templates
+        self.diversity = diversity
+        self.rng = random.Random(seed)
+
+    def _slot_pools(self, chain: str, context: Optional[str]) -> Dict[str, List[List[str]]]:
+        """Load distinct CDR sequences per position for every usable template."""
+        pools = {}
+        for template in self.library.templates(chain):
+            if template not in self.templates[chain]:
+                continue
+            slots = []
+            for position in CDR_POSITIONS:
+                records = self.library.query(chain, position, template, context)
+                slots.append(sorted({record['sequence'] for record in records}))
+            if all(slots):
+                pools[template] = slots
+        return pools
+
+    def _pick(self, pool: List[str], usage: Dict[str, int]) -> str:
+        weights = [1.0 / (1 + usage.get(seq, 0)) ** self.diversity for seq in pool]
+        choice = self.rng.choices(pool, weights=weights)[0]
+        usage[choice] = usage.get(choice, 0) + 1
+        return choice
+
+    @staticmethod
+    def _assemble_chain(framework: Dict[str, str], cdrs: List[str]) -> str:
+        return (framework['FR1'] + cdrs[0] + framework['FR2'] + cdrs[1] +
+                framework['FR3'] + cdrs[2] + framework['FR4'])
+
+    def assemble(self, num_candidates: int, context: Optional[str] = None,
+                 exclude: Optional[set] = None, max_draws: Optional[int] = None) -> List[Dict]:
+        """
+        Assemble unique antibody candidates from library CDRs.
+
+        Args:
+            num_candidates: Number of unique candidates to return
+            context: Only use CDRs generated with this context
+            exclude: Assembled sequences to skip, e.g. from earlier batches
+            max_draws: Maximum number of combinations to draw; defaults to
+                20 times num_candidates
+
+        Returns:
+            List of candidates with sequence, CDRs and template names; fewer
+            than requested when the library cannot supply enough unique ones
+        """
+        vh_pools = self._slot_pools('VH', context)
+        vl_pools = self._slot_pools('VL', context)
+        if not vh_pools or not vl_pools:
+            return []
+
+        seen = set(exclude or ())
+        usage = {}
+        candidates = []
+        max_draws = max_draws if max_draws is not None else num_candidates * 20
+
+        for _ in range(max_draws):
+            if len(candidates) >= num_candidates:
+                break
+
+            vh_name = self.rng.choice(sorted(vh_pools))
+            vl_name = self.rng.choice(sorted(vl_pools))
+            heavy_cdrs = [self._pick(pool, usage) for pool in vh_pools[vh_name]]
+            light_cdrs = [self._pick(pool, usage) for pool in vl_pools[vl_name]]
+
+            sequence = (self._assemble_chain(self.templates['VH'][vh_name], heavy_cdrs) +
+                        self._assemble_chain(self.templates['VL'][vl_name], light_cdrs))
+            if sequence in seen:
+                continue
+            seen.add(sequence)
+
+            candidates.append({
+                "sequence": sequence,
+                "heavy_cdrs": heavy_cdrs,
+                "light_cdrs": light_cdrs,
+                "template_vh": vh_name,
+                "template_vl": vl_name
+            })
+
+        return candidates
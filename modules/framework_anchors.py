@@ -0,0 +1,245 @@
+"""
+Framework anchor index for bulk CDR extraction.
+
+CDRs lie between the four framework regions of a V domain. Instead of
+searching for one hard-coded framework exactly, every framework region of
+every germline template in the library is used as an anchor pattern and
+located approximately, so somatic mutations and other germlines of the same
+chain type are tolerated.
+
+Anchors are found with Myers' bit-parallel approximate matching (in
+Hyyrö's formulation): each pattern of up to 64 residues is a set of uint64
+bit vectors, and one step per residue of the chain updates the edit
+distance of the best pattern match ending there. The steps are vectorized
+with NumPy over all chains of a batch and all anchor patterns at once. A
+second pass over the reversed chains with reversed patterns gives the
+distance of the best match starting at each position, which places the
+start of FR2-FR4 exactly even across indels.
+
+FR1 to FR4 are then placed left to right: each region takes its lowest
+distance end after the previous region (the rightmost on ties), and its
+start is the lowest distance start between the two ends (the leftmost on
+ties). A region is accepted if its distance is at most max_error_rate of
+the pattern length. A region that misses this but lies in order between the
+accepted regions around it (or the chain ends) is accepted up to
+max_flanked_error_rate, since its position confirms the weaker match; this
+covers frameworks of germlines outside the library, such as mouse V genes.
+"""
+
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .germline_templates import GermlineTemplate, TemplateLibrary
+from .reference_index import OTHER, encode
+
+REGIONS = ('FR1', 'FR2', 'FR3', 'FR4')
+CHAIN_TYPES = ('VH', 'VL')
+
+# Code of positions past the end of a chain in a padded batch; matches nothing
+PAD = OTHER + 1
+
+MAX_PATTERN_LENGTH = 64
+
+_ONE = np.uint64(1)
+
+
+def _myers_distances(codes: np.ndarray, peq: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    Edit distance of the best match of each pattern ending at each chain position.
+
+    Args:
+        codes: Padded residue codes, shape (chains, positions)
+        peq: Match bit vectors per residue code and pattern, shape (PAD + 1, patterns)
+        lengths: Pattern lengths
+
+    Returns:
+        int16 array of shape (chains, patterns, positions)
+    """
+    chains, positions = codes.shape
+    patterns = len(lengths)
+    high = (_ONE << (lengths.astype(np.uint64) - _ONE))[None, :]
+    # Bits above each pattern's length carry garbage, but carries and shifts only
+    # move upwards, so they never reach the bits that are read
+    pv = np.full((chains, patterns), np.iinfo(np.uint64).max, dtype=np.uint64)
+    mv = np.zeros((chains, patterns), dtype=np.uint64)
+    score = np.broadcast_to(lengths.astype(np.int16), (chains, patterns)).copy()
+    distances = np.empty((chains, patterns, positions), dtype=np.int16)
+
+    for j in range(positions):
+        eq = peq[codes[:, j]]
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | ~(xh | pv)
+        mh = pv & xh
+        score += (ph & high).astype(bool)
+        score -= (mh & high).astype(bool)
+        # Matches may start anywhere, so no carry-in bit is shifted into ph
+        ph <<= _ONE
+        mh <<= _ONE
+        pv = mh | ~(xv | ph)
+        mv = ph & xv
+        distances[:, :, j] = score
+    return distances
+
+
+class FrameworkAnchorIndex:
+    """Framework regions of germline templates as approximate-match anchors for CDR extraction."""
+
+    def __init__(self, templates: Sequence[GermlineTemplate], max_error_rate: float = 0.3,
+                 max_flanked_error_rate: float = 0.4):
+        """
+        Args:
+            templates: Germline templates whose FR1-FR4 serve as anchors
+            max_error_rate: Largest accepted edit distance of a framework match,
+                as a fraction of the framework length
+            max_flanked_error_rate: Largest accepted edit distance of a match
+                lying between the accepted frameworks around it
+        """
+        self.max_error_rate = max_error_rate
+        self.max_flanked_error_rate = max_flanked_error_rate
+        self.templates = {}
+        for chain in CHAIN_TYPES:
+            chain_templates = [t for t in templates if t.chain == chain]
+            if not chain_templates:
+                continue
+            patterns = [t.frameworks[region] for region in REGIONS for t in chain_templates]
+            too_long = [p for p in patterns if len(p) > MAX_PATTERN_LENGTH]
+            if too_long:
+                raise ValueError(f"Framework regions longer than {MAX_PATTERN_LENGTH} residues: {too_long}")
+            self.templates[chain] = {
+                'names': [t.name for t in chain_templates],
+                'lengths': np.array([len(p) for p in patterns], dtype=np.int64),
+                'forward': self._match_vectors(patterns),
+                'reverse': self._match_vectors([p[::-1] for p in patterns])
+            }
+
+    @classmethod
+    def from_library(cls, library: Optional[TemplateLibrary] = None, **kwargs) -> "FrameworkAnchorIndex":
+        """Anchor index over every template of a library, by default the bundled one."""
+        library = library or TemplateLibrary.load()
+        return cls([t for chain in CHAIN_TYPES for t in library.chain_templates(chain)], **kwargs)
+
+    @staticmethod
+    def _match_vectors(patterns: List[str]) -> np.ndarray:
+        """Bit i of entry (code, pattern) is set when the pattern's residue i has that code."""
+        peq = np.zeros((PAD + 1, len(patterns)), dtype=np.uint64)
+        for column, pattern in enumerate(patterns):
+            for i, code in enumerate(encode(pattern)):
+                if code != OTHER:
+                    peq[code, column] |= _ONE << np.uint64(i)
+        return peq
+
+    def _locate(self, codes: np.ndarray, lengths: np.ndarray, chain: str) -> Dict[str, np.ndarray]:
+        """Framework spans and distances of a batch of encoded chains for one chain type."""
+        index = self.templates[chain]
+        num_templates = len(index['names'])
+        forward = _myers_distances(codes, index['forward'], index['lengths'])
+        # Reversing each chain within its own length keeps padding at the end
+        positions = np.arange(codes.shape[1])
+        flipped = np.where(positions[None, :] < lengths[:, None], lengths[:, None] - 1 - positions[None, :], 0)
+        reversed_codes = np.where(positions[None, :] < lengths[:, None],
+                                  np.take_along_axis(codes, flipped, axis=1), PAD)
+        backward = _myers_distances(reversed_codes, index['reverse'], index['lengths'])
+
+        chains = len(codes)
+        rows = np.arange(chains)
+        inside = positions[None, :] < lengths[:, None]
+        big = np.iinfo(np.int16).max
+        previous_end = np.full(chains, -1)
+        result = {'start': np.zeros((chains, 4), dtype=np.int64), 'end': np.zeros((chains, 4), dtype=np.int64),
+                  'distance': np.zeros((chains, 4), dtype=np.int64), 'found': np.zeros((chains, 4), dtype=bool)}
+        flanked_ok = np.zeros((chains, 4), dtype=bool)
+        for r, region in enumerate(REGIONS):
+            columns = slice(r * num_templates, (r + 1) * num_templates)
+            ends = forward[:, columns].min(axis=1)
+            # Distance of the best match starting at each position, back in chain coordinates
+            starts_reversed = backward[:, columns].min(axis=1)
+            starts = np.where(inside, np.take_along_axis(starts_reversed, flipped, axis=1), big)
+
+            allowed = inside & (positions[None, :] > previous_end[:, None])
+            ends = np.where(allowed, ends, big)
+            # Rightmost lowest distance end
+            end = positions[-1] - np.argmin(ends[:, ::-1], axis=1)
+            distance = ends[rows, end]
+            window = allowed & (positions[None, :] <= end[:, None])
+            start = np.argmin(np.where(window, starts, big), axis=1)
+
+            pattern_lengths = index['lengths'][columns]
+            best_length = pattern_lengths[np.argmin(forward[rows, columns, end], axis=1)]
+            found = distance <= np.floor(self.max_error_rate * best_length)
+            flanked_ok[:, r] = distance <= np.floor(self.max_flanked_error_rate * best_length)
+            # Regions with no position left to match get an empty span at the chain end
+            exhausted = ~allowed.any(axis=1)
+            result['start'][:, r] = np.where(exhausted, lengths, start)
+            result['end'][:, r] = np.where(exhausted, lengths, end + 1)
+            result['distance'][:, r], result['found'][:, r] = distance, found
+            previous_end = np.where(found, end, previous_end)
+
+        # Weaker matches placed in order between accepted neighbours
+        for r in range(4):
+            left = np.zeros(chains, dtype=np.int64)
+            for before in range(r):
+                left = np.where(result['found'][:, before], result['end'][:, before], left)
+            right = lengths.copy()
+            for after in range(3, r, -1):
+                right = np.where(result['found'][:, after], result['start'][:, after], right)
+            result['found'][:, r] |= (flanked_ok[:, r] & (result['start'][:, r] >= left) &
+                                      (result['end'][:, r] <= right))
+        return result
+
+    def extract(self, sequences: Sequence[str], chain: Optional[str] = None,
+                batch_size: int = 1024) -> List[Dict]:
+        """
+        Locate frameworks and extract CDRs for many chains.
+
+        Args:
+            sequences: Heavy or light chain sequences
+            chain: 'VH' or 'VL'; None picks, per sequence, the chain type whose
+                frameworks match best
+            batch_size: Chains processed per vectorized batch
+
+        Returns:
+            Per sequence: chain type, cdr1-cdr3 ('' when a flanking framework
+            was not found), framework spans as [start, end) and edit distances
+        """
+        chain_types = [chain] if chain is not None else list(self.templates)
+        results = []
+        for start in range(0, len(sequences), batch_size):
+            batch = sequences[start:start + batch_size]
+            lengths = np.array([len(seq) for seq in batch], dtype=np.int64)
+            codes = np.full((len(batch), max(int(lengths.max(initial=0)), 1)), PAD, dtype=np.intp)
+            for row, seq in enumerate(batch):
+                codes[row, :len(seq)] = encode(seq)
+
+            located = {c: self._locate(codes, lengths, c) for c in chain_types}
+            # Found regions first, then the lowest total distance
+            cost = np.stack([(~located[c]['found']).sum(axis=1) * 10000 + located[c]['distance'].sum(axis=1)
+                             for c in chain_types])
+            best = np.argmin(cost, axis=0)
+            for row, seq in enumerate(batch):
+                chain_type = chain_types[best[row]]
+                spans = located[chain_type]
+                entry = {
+                    'chain': chain_type,
+                    'frameworks': {
+                        region: {
+                            'start': int(spans['start'][row, r]),
+                            'end': int(spans['end'][row, r]),
+                            'distance': int(spans['distance'][row, r]),
+                            'found': bool(spans['found'][row, r])
+                        }
+                        for r, region in enumerate(REGIONS)
+                    }
+                }
+                for number in range(1, 4):
+                    left, right = entry['frameworks'][f'FR{number}'], entry['frameworks'][f'FR{number + 1}']
+                    found = left['found'] and right['found'] and left['end'] <= right['start']
+                    entry[f'cdr{number}'] = seq[left['end']:right['start']] if found else ''
+                results.append(entry)
+        return results
+
+    def extract_cdrs(self, sequence: str, chain: Optional[str] = None) -> Dict[str, str]:
+        """CDR1-3 of one chain, '' for CDRs whose flanking frameworks were not found."""
+        entry = self.extract([sequence], chain)[0]
+        return {name: entry[name] for name in ('cdr1', 'cdr2', 'cdr3')}
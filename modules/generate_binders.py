@@ -1,46 +1,25 @@
 
-from transformers import AutoTokenizer, AutoModelForCausalLM
 import torch
-import random
-from typing import List, Dict
-import json
-import os
+from typing import AsyncIterator, List, Dict, Optional
+import time
+from .cdr_decoding import cdr_stopping_criteria, non_amino_acid_token_ids, token_residue_counts
+from .prompt_cache import PromptPrefixCache
+from .generation_service import GenerationClient
+from .binder_stream import stream_attempts
+from .cdr_library import CDRLibrary, CombinatorialAssembler
+from .seen_filter import SeenSequenceFilter
+from .oversampling import AdaptiveOversampler
+from .generation_telemetry import GenerationTelemetry, generated_token_count
+from .onnx_engine import DEFAULT_MODEL_DIR, OnnxGenerationEngine
+from .speculative_decoding import DEFAULT_DRAFT_PATH, SpeculativeDecoder, load_or_train_draft
+from .germline_templates import DEFAULT_TEMPLATE_FILE, GermlineTemplate, TemplateLibrary
+from .campaign import CampaignCheckpoint
+from .model_cache import load_model, load_tokenizer
+from .similarity_service import ACCEPTANCE_THRESHOLDS, get_similarity_service
 
 class AntibodyGenerator:
     """Generates antibody sequences using ProtGPT2 with IMGT germline templates."""
     
-    # IMGT human germline V-region templates
-    GERMLINE_TEMPLATES = {
-        'VH': {
-            'IGHV1-69*01': {
-                'FR1': 'QVQLVQSGAEVKKPGSSVKVSCKASGGTFS',
-                'FR2': 'WVRQAPGQGLEWMG',
-                'FR3': 'RVTITADKSTSTAYMELSSLRSEDTAVYYCAR',
-                'FR4': 'WGQGTLVTVSS'
-            },
-            'IGHV3-23*01': {
-                'FR1': 'EVQLLESGGGLVQPGGSLRLSCAASGFTFS',
-                'FR2': 'WVRQAPGKGLEWVS',
-                'FR3': 'RFTISRDNSKNTLYLQMNSLRAEDTAVYYCAR',
-                'FR4': 'WGQGTLVTVSS'
-            }
-        },
-        'VL': {
-            'IGKV1-39*01': {
-                'FR1': 'DIQMTQSPSSLSASVGDRVTITC',
-                'FR2': 'WYQQKPGKAPKLLIY',
-                'FR3': 'GVPSRFSGSGSGTDFTLTISSLQPEDFATYYC',
-                'FR4': 'FGQGTKVEIK'
-            },
-            'IGLV1-44*01': {
-                'FR1': 'QSVLTQPPSVSGAPGQRVTISCTGSSSNIG',
-                'FR2': 'WYQQHPGKAPKLLIY',
-                'FR3': 'GVPDRFSGSGSGTDFTLTISGVQAEDVAVYYC',
-                'FR4': 'FGGGTKLTVL'
-            }
-        }
-    }
-    
     # Sequence quality parameters
     MAX_HOMOPOLYMER_LENGTH = 4  # Maximum allowed length of amino acid repeats
     MIN_CDR_LENGTH = 5  # Minimum CDR length
@@ -49,91 +28,220 @@ class AntibodyGenerator:
     MAX_DISORDER_SCORE = 0.3  # Maximum allowed disorder score
     ALLOWED_PI_RANGE = (5.5, 8.5)  # Allowed range for isoelectric point
 
-    def __init__(self):
+    def __init__(self, cdr_library: Optional[CDRLibrary] = None, metrics_path: Optional[str] = None,
+                 engine: str = 'torch', onnx_model_dir: str = DEFAULT_MODEL_DIR,
+                 seen_filter: Optional[SeenSequenceFilter] = None,
+                 draft_model_path: Optional[str] = DEFAULT_DRAFT_PATH,
+                 template_file: str = DEFAULT_TEMPLATE_FILE, similarity: str = 'alignment',
+                 reference_path: Optional[str] = None):
         """Initialize the antibody sequence generator.
         
         Sets up the ProtGPT2 language model for sequence generation and loads the validation dataset.
         The model is configured with padding tokens and loaded with pre-trained weights from
         nferruz/ProtGPT2, which was trained on antibody sequences.
+        
+        Args:
+            cdr_library (CDRLibrary, optional): Library that records every CDR passing
+                the quality filters, for later combinatorial assembly
+            metrics_path (str, optional): JSONL file that generation telemetry is
+                streamed to
+            engine (str, optional): Inference engine, 'torch', 'onnx' or 'speculative'.
+                Defaults to 'torch'.
+            onnx_model_dir (str, optional): Exported ONNX model used by the 'onnx' engine
+            seen_filter (SeenSequenceFilter, optional): Cross-run record of produced CDRs
+                and antibodies; sequences already in it are skipped
+            draft_model_path (str, optional): n-gram draft model used by the 'speculative'
+                engine; trained from known CDRs and saved there if missing
+            template_file (str, optional): Germline template library data file
+            similarity (str, optional): Backend of the therapeutic similarity score,
+                'alignment' or 'prefix'. Defaults to 'alignment', which tolerates the
+                length differences between assembled antibodies and references.
+                Binders are accepted from the backend's threshold in ACCEPTANCE_THRESHOLDS.
+            reference_path (str, optional): Therapeutic reference set, as JSON or as a
+                compiled reference database (.refdb). Defaults to the bundled JSON.
         """
         # Initialize ProtGPT2 model and tokenizer
-        self.tokenizer = AutoTokenizer.from_pretrained("nferruz/ProtGPT2")
-        self.model = AutoModelForCausalLM.from_pretrained("nferruz/ProtGPT2")
+        self.tokenizer = load_tokenizer("nferruz/ProtGPT2")
+        if engine == 'onnx':
+            # ONNX Runtime sampling does not need the PyTorch weights
+            self.model = None
+            self.onnx_engine = OnnxGenerationEngine(onnx_model_dir)
+        else:
+            self.model = load_model("nferruz/ProtGPT2")
+            self.onnx_engine = None
+
+        # Speculative sampling verifies n-gram draft tokens with one ProtGPT2 pass
+        self.speculative_decoder = None
+        if engine == 'speculative':
+            draft = load_or_train_draft(self.tokenizer, draft_model_path, cdr_library)
+            self.speculative_decoder = SpeculativeDecoder(self.model, draft)
         
         # Configure padding tokens for batch processing
         if self.tokenizer.pad_token is None:
             self.tokenizer.pad_token = self.tokenizer.eos_token
-            self.model.config.pad_token_id = self.model.config.eos_token_id
+            if self.model is not None:
+                self.model.config.pad_token_id = self.model.config.eos_token_id
 
-        # Load validation dataset from THERAb database
-        self.validation_set = self._load_validation_set()
+        # Germline templates indexed by chain and family, with tokenized prompt prefixes
+        self.template_library = TemplateLibrary.load(template_file)
 
-    def _load_validation_set(self) -> List[Dict]:
-        """Load the validation dataset of therapeutic antibodies.
-        
-        Returns:
-            List[Dict]: A list of validated therapeutic antibodies, each containing:
-                - sequence: Full amino acid sequence
-                - name: Antibody name/identifier
-                - target: Target antigen
-                - approved: FDA approval status
-        """
-        validation_file = os.path.join(os.path.dirname(__file__), 
-                                     'data', 'therapeutic_antibodies.json')
+        # Template prefixes are encoded once and reused across attempts
+        self.prompt_cache = PromptPrefixCache()
+
+        # Set by the generation service to merge sampling calls across requests
+        self.batcher = None
+
+        # Optional store of accepted CDRs for library-based assembly
+        self.cdr_library = cdr_library
+
+        # Optional filter of sequences produced in earlier runs
+        self.seen_filter = seen_filter
+
+        # Sizes sampling requests from observed per-template acceptance rates
+        self.oversampler = AdaptiveOversampler(prior_rate=0.5)
+
+        # Forward pass throughput, acceptance funnel and rejection reasons
+        self.telemetry = GenerationTelemetry(metrics_path)
+
+        # Therapeutic antibody references, loaded and indexed once per process
         try:
-            with open(validation_file, 'r') as f:
-                return json.load(f)
+            self.similarity_service = get_similarity_service(reference_path, similarity)
         except FileNotFoundError:
             print("Warning: Validation dataset not found. Using basic validation.")
-            return []
+            self.similarity_service = None
+
+    def _prompt_ids(self, template_seq: str, context: str, template_name: str = None) -> List[int]:
+        """Token ids of a CDR prompt.
+        
+        Library templates contribute their pre-tokenized prefix, so only the
+        context is tokenized per call.
+        
+        Args:
+            template_seq (str): Template sequence the prompt starts with
+            context (str): Target binding context
+            template_name (str, optional): Germline template name
+            
+        Returns:
+            List[int]: Prompt token ids
+        """
+        suffix = f" {context} <CDR>"
+        if template_name in self.template_library and \
+                self.template_library[template_name].prompt_prefix == template_seq:
+            prefix_ids = self.template_library.prefix_ids(template_name, self.tokenizer)
+            return prefix_ids + self.tokenizer(suffix, add_special_tokens=False)["input_ids"]
+        return self.tokenizer(template_seq + suffix)["input_ids"]
 
-    def _generate_cdrs(self, context: str, template_seq: str, num_variants: int = 5) -> List[str]:
+    def _generate_cdrs(self, context: str, template_seq: str, num_variants: int = 5,
+                       template_name: str = None) -> List[str]:
         """Generate complementarity determining region (CDR) sequences.
         
         Uses ProtGPT2 to generate CDR sequences with template-based conditioning and
-        strict quality controls to prevent unrealistic sequences.
+        strict quality controls to prevent unrealistic sequences. The number of
+        samples drawn is sized by the adaptive oversampler from the template's
+        observed acceptance rate.
         
         Args:
             context (str): Target binding context for generation
             template_seq (str): Template sequence from germline to condition on
             num_variants (int, optional): Number of sequences to generate. Defaults to 5.
+            template_name (str, optional): Germline template name. When given, the
+                encoded template prefix is reused from the prompt prefix cache.
         
         Returns:
             List[str]: List of valid CDR sequences meeting all quality criteria
         """
         # Prepare input with both context and template
         prompt = f"{template_seq} {context} <CDR>"
-        inputs = self.tokenizer(prompt, return_tensors="pt", padding=True)
+        template_key = template_name or template_seq
+        num_samples = self.oversampler.num_samples(template_key, num_variants)  # Extra for filtering
         
         # Use more conservative sampling parameters
-        outputs = self.model.generate(
-            inputs["input_ids"],
-            attention_mask=inputs["attention_mask"],
+        generation_kwargs = dict(
             do_sample=True,
             top_k=20,  # More restrictive top-k
             top_p=0.85,  # More conservative nucleus sampling
             temperature=0.6,  # Lower temperature for more conservative sampling
-            max_length=30,  # Shorter max length for CDRs
-            num_return_sequences=num_variants * 2,  # Generate extra for filtering
-            pad_token_id=self.tokenizer.pad_token_id,
+            max_new_tokens=30,  # Hard token cap; CDR length stopping usually ends earlier
             no_repeat_ngram_size=2,  # Stricter repeat prevention
             repetition_penalty=1.5,  # Additional penalty for repetition
-            length_penalty=0.8  # Slight penalty for longer sequences
+            length_penalty=0.8,  # Slight penalty for longer sequences
+            suppress_tokens=non_amino_acid_token_ids(self.tokenizer)  # Only amino acid tokens in the CDR
+        )
+        
+        start = time.perf_counter()
+        if self.batcher is not None:
+            # Share the forward pass with concurrent requests in the generation service
+            outputs = self.batcher.generate(prompt, num_samples, generation_kwargs, self.MAX_CDR_LENGTH)
+            prompt_length = len(self._prompt_ids(template_seq, context, template_name))
+        elif self.onnx_engine is not None or self.speculative_decoder is not None:
+            # Both engines sample rows from a single encoded prompt
+            engine = self.onnx_engine if self.onnx_engine is not None else self.speculative_decoder
+            prompt_ids = self._prompt_ids(template_seq, context, template_name)
+            outputs = engine.generate(
+                prompt_ids, num_samples,
+                pad_token_id=self.tokenizer.pad_token_id,
+                max_residues=self.MAX_CDR_LENGTH,
+                residue_counts=token_residue_counts(self.tokenizer),
+                **generation_kwargs
+            )
+            prompt_length = len(prompt_ids)
+        else:
+            if template_name is not None:
+                # Start from the cached template prefix and only encode the context
+                inputs = self.prompt_cache.prepare_inputs(
+                    self.model, self.tokenizer, template_name, template_seq,
+                    f" {context} <CDR>", num_samples
+                )
+                num_return_sequences = 1
+            else:
+                inputs = self.tokenizer(prompt, return_tensors="pt", padding=True)
+                num_return_sequences = num_samples
+            
+            # Stop each sample once it has decoded MAX_CDR_LENGTH residues
+            stopping_criteria = cdr_stopping_criteria(
+                self.tokenizer, inputs["input_ids"].shape[1], self.MAX_CDR_LENGTH
+            )
+            
+            outputs = self.model.generate(
+                **inputs,
+                stopping_criteria=stopping_criteria,
+                num_return_sequences=num_return_sequences,
+                pad_token_id=self.tokenizer.pad_token_id,
+                **generation_kwargs
+            )
+            prompt_length = inputs["input_ids"].shape[1]
+        self.telemetry.record_forward(
+            time.perf_counter() - start,
+            generated_token_count(outputs, prompt_length, self.tokenizer.pad_token_id),
+            len(outputs)
         )
         
         cdrs = []
+        evaluated = 0
+        rejections = {}
         for output in outputs:
             sequence = self.tokenizer.decode(output, skip_special_tokens=True)
             sequence = sequence.split("<CDR>")[-1].strip()  # Extract CDR part
-            sequence = ''.join(aa for aa in sequence if aa in "ACDEFGHIKLMNPQRSTVWY")
             
             # Apply quality filters
-            if self._check_sequence_quality(sequence):
+            evaluated += 1
+            with self.telemetry.timed("quality_filters"):
+                reason = self._quality_rejection_reason(sequence)
+            self.telemetry.record_stage("cdr_quality", reason)
+            if reason is None and self.seen_filter is not None:
+                # Drop CDRs produced in this or an earlier run
+                if self.seen_filter.seen_cdr(sequence):
+                    reason = "duplicate_cdr"
+                self.telemetry.record_stage("cdr_novelty", reason)
+            if reason is None:
                 cdrs.append(sequence)
+            else:
+                rejections[reason] = rejections.get(reason, 0) + 1
             
             if len(cdrs) >= num_variants:
                 break
-                
+        
+        self.oversampler.record(template_key, evaluated, len(cdrs), rejections)
         return cdrs
         
     def _check_sequence_quality(self, sequence: str) -> bool:
@@ -147,181 +255,307 @@ class AntibodyGenerator:
         Returns:
             bool: True if sequence meets all criteria, False otherwise
         """
+        return self._quality_rejection_reason(sequence) is None
+
+    def _quality_rejection_reason(self, sequence: str) -> Optional[str]:
+        """Return the first quality filter a sequence fails.
+        
+        Args:
+            sequence (str): Amino acid sequence to check
+            
+        Returns:
+            Optional[str]: 'length', 'homopolymer', 'composition' or 'hydrophobicity',
+                or None if the sequence passes every filter
+        """
         # Length check
         if not (self.MIN_CDR_LENGTH <= len(sequence) <= self.MAX_CDR_LENGTH):
-            return False
+            return 'length'
             
         # Check for homopolymer runs
         for aa in "ACDEFGHIKLMNPQRSTVWY":
             if aa * self.MAX_HOMOPOLYMER_LENGTH in sequence:
-                return False
+                return 'homopolymer'
                 
         # Basic composition checks
         aa_counts = {aa: sequence.count(aa) / len(sequence) for aa in set(sequence)}
         if max(aa_counts.values()) > 0.3:  # No amino acid should be >30% of sequence
-            return False
+            return 'composition'
             
         # Hydrophobicity balance
         hydrophobic = "AILMFWYV"
         hydrophobic_fraction = sum(sequence.count(aa) for aa in hydrophobic) / len(sequence)
         if hydrophobic_fraction > 0.6 or hydrophobic_fraction < 0.2:
-            return False
+            return 'hydrophobicity'
             
-        return True
-        
-        return cdrs
+        return None
 
-    def _assemble_antibody(self, heavy_cdrs: List[str], light_cdrs: List[str]) -> str:
+    def _assemble_antibody(self, heavy_cdrs: List[str], light_cdrs: List[str],
+                           vh_template: Dict, vl_template: Dict) -> str:
         """Assemble a complete antibody sequence by combining framework regions and CDRs.
         
         Constructs the full antibody sequence by inserting CDR sequences into their
-        corresponding positions within the conserved framework regions. Uses standard
-        IMGT-defined framework regions for VH and VL domains.
+        corresponding positions within the conserved framework regions of the
+        selected IMGT germline templates for the VH and VL domains.
         
         Args:
             heavy_cdrs (List[str]): Three heavy chain CDR sequences [CDR-H1, CDR-H2, CDR-H3]
             light_cdrs (List[str]): Three light chain CDR sequences [CDR-L1, CDR-L2, CDR-L3]
+            vh_template (Dict): Heavy chain germline framework regions FR1-FR4
+            vl_template (Dict): Light chain germline framework regions FR1-FR4
             
         Returns:
             str: Complete antibody sequence with framework regions and CDRs
         """
-        vh = (self.FRAMEWORK_REGIONS['VH']['FR1'] + 
+        vh = (vh_template['FR1'] + 
               heavy_cdrs[0] + 
-              self.FRAMEWORK_REGIONS['VH']['FR2'] + 
+              vh_template['FR2'] + 
               heavy_cdrs[1] + 
-              self.FRAMEWORK_REGIONS['VH']['FR3'] + 
+              vh_template['FR3'] + 
               heavy_cdrs[2] + 
-              self.FRAMEWORK_REGIONS['VH']['FR4'])
+              vh_template['FR4'])
         
-        vl = (self.FRAMEWORK_REGIONS['VL']['FR1'] + 
+        vl = (vl_template['FR1'] + 
               light_cdrs[0] + 
-              self.FRAMEWORK_REGIONS['VL']['FR2'] + 
+              vl_template['FR2'] + 
               light_cdrs[1] + 
-              self.FRAMEWORK_REGIONS['VL']['FR3'] + 
+              vl_template['FR3'] + 
               light_cdrs[2] + 
-              self.FRAMEWORK_REGIONS['VL']['FR4'])
+              vl_template['FR4'])
         
         return vh + vl
 
-    def generate_binders(self, fusion_context: Dict, num_candidates: int = 10) -> Dict:
-        """Generate a set of candidate antibody sequences for a given target."""
-        binders = []
-        target_motif = fusion_context.get('cleaned_sequence', '')[:20]
+    def _record_cdrs(self, chain: str, template_name: str, target_motif: str, cdrs: List[str]):
+        """Store CDRs that passed the quality filters in the CDR library, if one is set.
         
-        vh_templates = list(self.GERMLINE_TEMPLATES['VH'].items())
-        vl_templates = list(self.GERMLINE_TEMPLATES['VL'].items())
+        Args:
+            chain (str): 'VH' or 'VL'
+            template_name (str): Germline template the CDRs were generated for
+            target_motif (str): Target motif used as generation context
+            cdrs (List[str]): CDR sequences in CDR1-CDR3 order
+        """
+        if self.cdr_library is None or not cdrs:
+            return
         
-        attempts = 0
-        max_attempts = num_candidates * 3
+        hydrophobic = "AILMFWYV"
+        self.cdr_library.add_many([
+            {
+                "sequence": cdr,
+                "chain": chain,
+                "position": position,
+                "template": template_name,
+                "context": target_motif,
+                "metrics": {
+                    "length": len(cdr),
+                    "hydrophobic_fraction": round(sum(cdr.count(aa) for aa in hydrophobic) / len(cdr), 3),
+                    "max_aa_frequency": round(max(cdr.count(aa) for aa in set(cdr)) / len(cdr), 3)
+                }
+            }
+            for position, cdr in enumerate(cdrs[:3], 1)
+        ])
+
+    def _attempt_binder(self, target_motif: str, vh: Optional[GermlineTemplate] = None,
+                        vl: Optional[GermlineTemplate] = None) -> Optional[Dict]:
+        """Run a single generation attempt for a target.
         
-        while len(binders) < num_candidates and attempts < max_attempts:
-            attempts += 1
-            
-            vh_name, vh = random.choice(vh_templates)
-            vl_name, vl = random.choice(vl_templates)
-            
-            heavy_cdrs = self._generate_cdrs(
-                f"Target binding site: {target_motif}",
-                vh['FR1'] + "X" * 10 + vh['FR2'],
-                3
-            )
-            
-            light_cdrs = self._generate_cdrs(
-                f"Light chain CDRs for {target_motif}",
-                vl['FR1'] + "X" * 8 + vl['FR2'],
-                3
-            )
+        Picks VH/VL templates, generates CDRs for both chains, assembles the
+        antibody and validates it against known therapeutics.
+        
+        Args:
+            target_motif (str): Target sequence motif used as generation context
+            vh (GermlineTemplate, optional): Heavy chain template; sampled if not given
+            vl (GermlineTemplate, optional): Light chain template; sampled if not given
             
-            if len(heavy_cdrs) >= 3 and len(light_cdrs) >= 3:
-                sequence = self._assemble_antibody(heavy_cdrs[:3], light_cdrs[:3])
-                validation_score = self._validate_sequence(sequence)
-                
-                if validation_score >= 0.7:
-                    binder = {
-                        "sequence": sequence,
-                        "heavy_cdrs": heavy_cdrs[:3],
-                        "light_cdrs": light_cdrs[:3],
-                        "validation_score": validation_score,
-                        "template_vh": vh_name,
-                        "template_vl": vl_name
-                    }
-                    binders.append(binder)
+        Returns:
+            Optional[Dict]: The accepted binder, or None if the attempt failed
+        """
+        vh = vh or self.template_library.sample('VH')
+        vl = vl or self.template_library.sample('VL')
+        
+        heavy_cdrs = self._generate_cdrs(
+            f"Target binding site: {target_motif}",
+            vh.prompt_prefix,
+            3,
+            template_name=vh.name
+        )
+        self._record_cdrs('VH', vh.name, target_motif, heavy_cdrs)
+        
+        light_cdrs = self._generate_cdrs(
+            f"Light chain CDRs for {target_motif}",
+            vl.prompt_prefix,
+            3,
+            template_name=vl.name
+        )
+        self._record_cdrs('VL', vl.name, target_motif, light_cdrs)
+        
+        if len(heavy_cdrs) < 3 or len(light_cdrs) < 3:
+            self.telemetry.record_stage("cdr_count", "too_few_cdrs")
+            return None
+        self.telemetry.record_stage("cdr_count")
+        
+        sequence = self._assemble_antibody(heavy_cdrs[:3], light_cdrs[:3], vh.frameworks, vl.frameworks)
+        if self.seen_filter is not None:
+            # Skip validation of assemblies produced before
+            if self.seen_filter.seen_binder(sequence):
+                self.telemetry.record_stage("binder_novelty", "duplicate_binder")
+                return None
+            self.telemetry.record_stage("binder_novelty")
+        with self.telemetry.timed("validation"):
+            validation_score = self._validate_sequence(sequence)
+        
+        if validation_score < self._acceptance_threshold():
+            self.telemetry.record_stage("validation", "validation_score")
+            return None
+        self.telemetry.record_stage("validation")
         
         return {
-            "generated_binders": binders,
-            "stats": {
-                "attempts": attempts,
-                "success_rate": len(binders) / attempts if attempts > 0 else 0
-            }
+            "sequence": sequence,
+            "heavy_cdrs": heavy_cdrs[:3],
+            "light_cdrs": light_cdrs[:3],
+            "validation_score": validation_score,
+            "template_vh": vh.name,
+            "template_vl": vl.name
         }
-                    - sequence (str): Full antibody sequence
-                    - heavy_cdrs (List[str]): Heavy chain CDR sequences
-                    - light_cdrs (List[str]): Light chain CDR sequences
-                    - validation_score (float): Similarity to known antibodies
-                    - template_vh (str): Heavy chain template used
-                    - template_vl (str): Light chain template used
-        """
+
+    def generate_binders(self, fusion_context: Dict, num_candidates: int = 10,
+                         checkpoint: Optional[CampaignCheckpoint] = None) -> Dict:
+        """Generate a set of candidate antibody sequences for a given target."""
         binders = []
-        target_motif = fusion_context.get('cleaned_sequence', '')[:20]  # Use longer context
-        
-        # Select templates
-        vh_templates = list(self.GERMLINE_TEMPLATES['VH'].items())
-        vl_templates = list(self.GERMLINE_TEMPLATES['VL'].items())
+        target_motif = fusion_context.get('cleaned_sequence', '')[:20]
         
         attempts = 0
-        max_attempts = num_candidates * 3  # Allow multiple attempts per candidate
+        max_attempts = self.oversampler.max_attempts(num_candidates)
+        self.oversampler.start_run()
+        self.telemetry.start_run()
+        if self.speculative_decoder is not None:
+            self.speculative_decoder.reset_stats()
+        if checkpoint is not None:
+            # Continue a campaign from its checkpoint log
+            binders, attempts = checkpoint.resume(fusion_context, num_candidates, self.oversampler,
+                                                  self.seen_filter)
         
         while len(binders) < num_candidates and attempts < max_attempts:
             attempts += 1
+            binder = self._tracked_attempt(target_motif)
+            if binder is not None:
+                binders.append(binder)
+            if checkpoint is not None:
+                checkpoint.record(attempts, binder, self.oversampler)
+            if binder is None and self.oversampler.yield_collapsed():
+                break  # Further attempts are unlikely to produce binders
+        
+        stats = {
+            "attempts": attempts,
+            "success_rate": len(binders) / attempts if attempts > 0 else 0,
+            "oversampling": self.oversampler.summary(),
+            "telemetry": self.telemetry.finish_run()
+        }
+        if self.seen_filter is not None:
+            self.seen_filter.save()
+            stats["novelty"] = self.seen_filter.summary()
+        if self.speculative_decoder is not None:
+            stats["speculative"] = self.speculative_decoder.summary()
+        
+        result = {
+            "generated_binders": binders,
+            "stats": stats
+        }
+        if checkpoint is not None:
+            stats["campaign"] = checkpoint.summary()
+            checkpoint.compact(result)
+        return result
+
+    def _tracked_attempt(self, target_motif: str, vh: Optional[GermlineTemplate] = None,
+                         vl: Optional[GermlineTemplate] = None) -> Optional[Dict]:
+        """Run one binder attempt and record its outcome for yield tracking."""
+        binder = self._attempt_binder(target_motif, vh, vl)
+        self.oversampler.record_attempt(binder is not None)
+        return binder
+
+    def agenerate_binders(self, fusion_context: Dict, num_candidates: int = 10,
+                          stats: Optional[Dict] = None) -> AsyncIterator[Dict]:
+        """Stream candidate antibodies for a target as they are accepted.
+        
+        Asynchronous counterpart of generate_binders. Attempts run in a worker
+        thread and each binder is yielded as soon as it passes validation, so
+        downstream stages can overlap with generation. Generation stops once
+        num_candidates binders are accepted, when the marginal yield of further
+        attempts has collapsed, or when the consumer stops iterating.
+        
+        Args:
+            fusion_context (Dict): Fusion context with the target's cleaned_sequence
+            num_candidates (int, optional): Number of binders to accept. Defaults to 10.
+            stats (Dict, optional): Updated in place with attempts and success_rate, and
+                with telemetry (and speculative) summaries once generation ends
             
-            # Randomly select templates
-            vh_name, vh = random.choice(vh_templates)
-            vl_name, vl = random.choice(vl_templates)
-            
-            # Generate CDRs using templates for conditioning
-            heavy_cdrs = self._generate_cdrs(
-                f"Target binding site: {target_motif}",
-                vh['FR1'] + "X" * 10 + vh['FR2'],  # Use template for conditioning
-                3
-            )
-            light_cdrs = self._generate_cdrs(
-                f"Light chain CDRs for {target_motif}",
-                vl['FR1'] + "X" * 8 + vl['FR2'],
-                3
-            )
+        Returns:
+            AsyncIterator[Dict]: Accepted binders in acceptance order
+        """
+        target_motif = fusion_context.get('cleaned_sequence', '')[:20]
+        stats = stats if stats is not None else {}
+        self.oversampler.start_run()
+        self.telemetry.start_run()
+        if self.speculative_decoder is not None:
+            self.speculative_decoder.reset_stats()
+
+        def finish():
+            stats["telemetry"] = self.telemetry.finish_run()
+            if self.speculative_decoder is not None:
+                stats["speculative"] = self.speculative_decoder.summary()
+
+        return stream_attempts(
+            lambda: self._tracked_attempt(target_motif),
+            num_candidates,
+            self.oversampler.max_attempts(num_candidates),
+            stats,
+            should_stop=self.oversampler.yield_collapsed,
+            on_finish=finish
+        )
+
+    def assemble_binders(self, num_candidates: int = 10, target_motif: Optional[str] = None,
+                         seed: Optional[int] = None) -> Dict:
+        """Assemble candidate antibodies from the CDR library without using the model.
+        
+        Combines stored CDRs with their germline frameworks, deduplicates the
+        assembled sequences and keeps those passing the usual validation threshold.
+        
+        Args:
+            num_candidates (int, optional): Number of binders to return. Defaults to 10.
+            target_motif (str, optional): Only use CDRs generated for this target motif
+            seed (int, optional): Seed for reproducible library sampling
             
-            if len(heavy_cdrs) >= 3 and len(light_cdrs) >= 3:
-                # Assemble full sequence
-                sequence = self._assemble_antibody(heavy_cdrs[:3], light_cdrs[:3])
-                validation_score = self._validate_sequence(sequence)
-                
-                # Only include sequences that pass validation threshold
-                if validation_score >= 0.7:  # Higher threshold for quality
-                    binder = {
-                        "sequence": sequence,
-                        "heavy_cdrs": heavy_cdrs[:3],
-                        "light_cdrs": light_cdrs[:3],
-                        "validation_score": validation_score,
-                        "template_vh": vh_name,
-                        "template_vl": vl_name
-                    }
-                    binders.append(binder)
+        Returns:
+            Dict: Binders in the generate_binders output format and assembly statistics
+        """
+        if self.cdr_library is None:
+            raise ValueError("No CDR library configured for this generator")
+        
+        assembler = CombinatorialAssembler(self.cdr_library, self.template_library.as_dict(), seed=seed)
+        candidates = assembler.assemble(num_candidates * 3, context=target_motif)
+        
+        binders = []
+        for candidate in candidates:
+            validation_score = self._validate_sequence(candidate["sequence"])
+            if validation_score >= self._acceptance_threshold():
+                candidate["validation_score"] = validation_score
+                binders.append(candidate)
+                if len(binders) >= num_candidates:
+                    break
         
         return {
             "generated_binders": binders,
             "stats": {
-                "attempts": attempts,
-                "success_rate": len(binders) / attempts if attempts > 0 else 0
+                "assembled": len(candidates),
+                "success_rate": len(binders) / len(candidates) if candidates else 0,
+                "library_size": self.cdr_library.count()
             }
         }
-                    "sequence": sequence,
-                    "heavy_cdrs": heavy_cdrs,
-                    "light_cdrs": light_cdrs,
-                    "validation_score": self._validate_sequence(sequence)
-                })
-        
-        return {"generated_binders": binders}
-    
+
+    def _acceptance_threshold(self) -> float:
+        """Minimum validation score of an accepted binder for the similarity backend in use."""
+        if self.similarity_service is None:
+            return ACCEPTANCE_THRESHOLDS['alignment']
+        return self.similarity_service.acceptance_threshold
+
     def _validate_sequence(self, sequence: str) -> float:
         """Validate a generated sequence against known therapeutic antibodies.
         
@@ -334,21 +568,26 @@ class AntibodyGenerator:
         Returns:
             float: Validation score between 0 and 1
         """
-        if not self.validation_set:
+        if self.similarity_service is None:
             return 0.5  # Default score when validation set is unavailable
             
-        max_score = 0
-        for ref_ab in self.validation_set:
-            score = self._calculate_similarity(sequence, ref_ab["sequence"])
-            max_score = max(max_score, score)
-            
-        return max_score
-                    "sequence": sequence,
-                    "heavy_cdrs": heavy_cdrs[:3],
-                    "light_cdrs": light_cdrs[:3],
-                    "target_context": target_motif
-                })
-        
-        return {"generated_binders": binders}
+        return self.similarity_service.best_score(sequence)
+
 
-    return {"generated_binders": binders}
+def generate_binders(fusion_context: Dict, num_candidates: int = 10) -> Dict:
+    """Generate candidate binders for a fusion context.
+    
+    Uses a running generation service when one is serving this generator,
+    so the model does not have to be loaded again; otherwise generates locally.
+    
+    Args:
+        fusion_context (Dict): Fusion context with the target's cleaned_sequence
+        num_candidates (int, optional): Number of binders to generate. Defaults to 10.
+        
+    Returns:
+        Dict: Generated binders and generation statistics
+    """
+    client = GenerationClient.from_env()
+    if client is not None and client.is_available('original'):
+        return client.generate_binders(fusion_context, num_candidates)
+    return AntibodyGenerator().generate_binders(fusion_context, num_candidates)
@@ -0,0 +1,391 @@
+"""
+Core-partitioned multi-process generation scheduler.
+
+Starting several generator processes with default torch threading
+oversubscribes a node, because every process sizes its intra-op thread
+pool to all cores. The scheduler instead splits the available cores into
+K disjoint sets and pins one worker process to each set, with
+``torch.set_num_threads`` matching the set size. Workers pull targets from
+a shared queue, so faster workers simply take more targets. K is picked
+from a short calibration run that measures attempt throughput for several
+partitionings of the node. Calibration stops adding workers once
+throughput stops improving, and by default tries no more workers than
+available memory holds copies of the generator.
+
+Every target runs as a seeded shard (see parallel_generation), so its
+result does not depend on which worker picks it up.
+
+Usage:
+    python -m modules.generation_scheduler targets.json --workers auto --output results.json
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import time
+from typing import Dict, List, Optional, Sequence, Union
+
+import torch
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+from .parallel_generation import derive_seeds, load_generator, run_shard
+
+logger = logging.getLogger(__name__)
+
+
+def available_cores() -> List[int]:
+    """CPU cores this process may run on."""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def partition_cores(cores: Sequence[int], workers: int) -> List[List[int]]:
+    """
+    Split cores into disjoint, contiguous sets of near-equal size.
+
+    Args:
+        cores: Core ids to distribute
+        workers: Number of sets
+
+    Returns:
+        One list of core ids per worker
+    """
+    if not 1 <= workers <= len(cores):
+        raise ValueError(f"Cannot split {len(cores)} cores over {workers} workers")
+    size, extra = divmod(len(cores), workers)
+    sets, start = [], 0
+    for i in range(workers):
+        end = start + size + (1 if i < extra else 0)
+        sets.append(list(cores[start:end]))
+        start = end
+    return sets
+
+
+def candidate_worker_counts(num_cores: int, max_workers: Optional[int] = None) -> List[int]:
+    """Worker counts tried during calibration: powers of two up to the core count, and the core count."""
+    limit = min(num_cores, max_workers or num_cores)
+    counts, k = [], 1
+    while k <= limit:
+        counts.append(k)
+        k *= 2
+    if counts[-1] != limit:
+        counts.append(limit)
+    return counts
+
+
+def select_worker_count(throughput: Dict[int, float], tolerance: float = 0.05) -> int:
+    """Fewest workers whose throughput is within tolerance of the best, to save memory."""
+    best = max(throughput.values())
+    return min(k for k, value in throughput.items() if value >= best * (1 - tolerance))
+
+
+def available_memory() -> Optional[int]:
+    """Bytes of memory available for new processes, or None where this is unknown."""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def memory_worker_limit(worker_memory: int, available: Optional[int] = None,
+                        headroom: float = 0.8) -> Optional[int]:
+    """
+    Number of workers whose generators fit into available memory.
+
+    Args:
+        worker_memory: Peak resident memory of one worker, in bytes
+        available: Available memory in bytes; measured if omitted
+        headroom: Fraction of the available memory workers may use
+
+    Returns:
+        Worker limit of at least 1, or None if available memory is unknown
+    """
+    available = available if available is not None else available_memory()
+    if available is None or worker_memory <= 0:
+        return None
+    return max(1, int(available * headroom // worker_memory))
+
+
+def pin_to_cores(cores: Sequence[int]):
+    """Restrict the current process to cores and size torch's thread pools to match."""
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    torch.set_num_threads(len(cores))
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # Fixed once inter-op work has started
+
+
+def _worker_main(kind: str, cores: List[int], tasks, results, cancelled, index: int):
+    try:
+        pin_to_cores(cores)
+        generator = load_generator(kind)
+    except Exception as e:
+        results.put(("error", index, repr(e)))
+        return
+    # Peak resident set size; Linux reports kilobytes
+    peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 if resource is not None else 0
+    results.put(("ready", index, peak_memory))
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        if cancelled.is_set():
+            continue
+        task_id, fusion_context, quota, seed = task
+        start = time.perf_counter()
+        try:
+            result, error = run_shard(generator, fusion_context, quota, seed), None
+        except Exception as e:
+            result, error = None, repr(e)
+        results.put((task_id, index, result, time.perf_counter() - start, error))
+
+
+class WorkerPool:
+    """Worker processes pinned to disjoint core sets, fed from a shared task queue."""
+
+    def __init__(self, kind: str, core_sets: List[List[int]], poll_interval: float = 1.0):
+        """
+        Start one worker per core set and wait until every generator is loaded.
+
+        Args:
+            kind: Generator to load in each worker (see parallel_generation.load_generator)
+            core_sets: Disjoint core ids per worker
+            poll_interval: Seconds between checks that workers are still alive
+
+        Raises:
+            RuntimeError: If a worker fails to load its generator or exits
+        """
+        self.core_sets = core_sets
+        self.poll_interval = poll_interval
+        context = multiprocessing.get_context('spawn')
+        self._tasks = context.Queue()
+        self._results = context.Queue()
+        # Set after a failure so workers skip the tasks still queued
+        self._cancelled = context.Event()
+        self._processes = [
+            context.Process(target=_worker_main,
+                            args=(kind, cores, self._tasks, self._results, self._cancelled, index),
+                            daemon=True)
+            for index, cores in enumerate(core_sets)
+        ]
+        for process in self._processes:
+            process.start()
+
+        self.worker_memory = 0
+        try:
+            for _ in self._processes:
+                message = self._next_result()
+                if message[0] == "error":
+                    raise RuntimeError(f"Worker {message[1]} failed to load {kind}: {message[2]}")
+                self.worker_memory = max(self.worker_memory, message[2])
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self) -> "WorkerPool":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def run(self, tasks: List[tuple]) -> List[Dict]:
+        """
+        Run (fusion_context, quota, seed) tasks and return them in task order.
+
+        Returns:
+            Per task: the generate_binders result, worker index and seconds
+        """
+        if self._cancelled.is_set():
+            raise RuntimeError("Worker pool was cancelled by an earlier failure")
+        for task_id, task in enumerate(tasks):
+            self._tasks.put((task_id, *task))
+        outcomes = [None] * len(tasks)
+        try:
+            for _ in tasks:
+                task_id, worker, result, seconds, error = self._next_result()
+                if error is not None:
+                    raise RuntimeError(f"Worker {worker} failed on task {task_id}: {error}")
+                outcomes[task_id] = {"result": result, "worker": worker, "seconds": seconds}
+        except BaseException:
+            # Workers skip what is left of the queue instead of running it
+            self._cancelled.set()
+            raise
+        return outcomes
+
+    def _next_result(self) -> tuple:
+        """Next worker message; raises if a worker exits while messages are awaited."""
+        while True:
+            try:
+                return self._results.get(timeout=self.poll_interval)
+            except queue.Empty:
+                for index, process in enumerate(self._processes):
+                    if not process.is_alive():
+                        self._cancelled.set()
+                        raise RuntimeError(f"Worker {index} exited with code {process.exitcode}")
+
+    def close(self):
+        """Stop the workers once they have finished or skipped the queued tasks."""
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            # Workers cannot exit while their unread results fill the queue's pipe
+            while process.is_alive():
+                process.join(timeout=self.poll_interval)
+                try:
+                    while True:
+                        self._results.get_nowait()
+                except queue.Empty:
+                    pass
+
+
+def calibrate(kind: str, fusion_context: Dict, cores: Optional[Sequence[int]] = None,
+              worker_counts: Optional[List[int]] = None, num_candidates: int = 1,
+              seed: int = 0, tolerance: float = 0.05, memory_limit: bool = True) -> Dict:
+    """
+    Pick the number of workers from a short throughput measurement.
+
+    For every worker count, in ascending order, the node is partitioned
+    accordingly and each worker runs the same seeded probe at once;
+    throughput is attempts per second of wall time, excluding model loading.
+    Larger counts are skipped once a count improves throughput by less than
+    the tolerance, or when their generators would not fit into memory.
+
+    Args:
+        kind: Generator to load in each worker
+        fusion_context: Target used for the probe
+        cores: Cores to partition; defaults to all available
+        worker_counts: Worker counts to try; defaults to powers of two up to the core count
+        num_candidates: Candidates requested per probe
+        seed: Probe seed
+        tolerance: Relative throughput difference treated as a tie
+        memory_limit: Skip counts whose workers' measured peak memory exceeds available memory
+
+    Returns:
+        Dictionary with the selected worker count, attempts/sec per tried count
+        and the memory-based worker limit (None if not applied)
+    """
+    cores = list(cores or available_cores())
+    worker_counts = sorted(worker_counts or candidate_worker_counts(len(cores)))
+    throughput, limit = {}, None
+    for workers in worker_counts:
+        if limit is not None and workers > limit:
+            logger.info(f"Calibration: skipping {workers} workers, memory holds {limit}")
+            break
+        with WorkerPool(kind, partition_cores(cores, workers)) as pool:
+            start = time.perf_counter()
+            outcomes = pool.run([(fusion_context, num_candidates, seed)] * workers)
+            seconds = time.perf_counter() - start
+            worker_memory = pool.worker_memory
+        attempts = sum(outcome["result"]["stats"]["attempts"] for outcome in outcomes)
+        best = max(throughput.values(), default=0.0)
+        throughput[workers] = attempts / seconds if seconds > 0 else 0.0
+        logger.info(f"Calibration: {workers} workers, {throughput[workers]:.2f} attempts/s")
+        if memory_limit and limit is None:
+            limit = memory_worker_limit(worker_memory)
+        if best > 0 and throughput[workers] < best * (1 + tolerance):
+            break
+    return {"workers": select_worker_count(throughput, tolerance), "throughput": throughput,
+            "memory_limit": limit}
+
+
+def generate_targets(targets: List[Dict], num_candidates: int = 10, workers: Union[int, str] = 'auto',
+                     seed: int = 42, kind: str = 'original', cores: Optional[Sequence[int]] = None,
+                     max_workers: Optional[int] = None) -> Dict:
+    """
+    Generate binders for many targets across core-pinned worker processes.
+
+    Args:
+        targets: Fusion contexts with cleaned_sequence
+        num_candidates: Candidates requested per target
+        workers: Number of workers, or 'auto' to calibrate on the first target
+        seed: Master seed; target i uses the i-th derived seed
+        kind: Generator implementation, 'original', 'revised' or 'module:factory'
+        cores: Cores to use; defaults to all available
+        max_workers: Upper bound for calibration; calibration also stops at the
+            number of workers available memory holds
+
+    Returns:
+        Dictionary with per-target results in input order and scheduler stats
+    """
+    if not targets:
+        # Nothing to calibrate on or schedule; no workers are started
+        return {"targets": [], "stats": {"workers": 0, "core_sets": [], "seconds": 0.0, "attempts_per_second": 0.0,
+                                         "targets_per_worker": [], "calibration": None}}
+    cores = list(cores or available_cores())
+    calibration = None
+    if workers == 'auto':
+        calibration = calibrate(kind, targets[0], cores, candidate_worker_counts(len(cores), max_workers))
+        workers = calibration["workers"]
+    core_sets = partition_cores(cores, int(workers))
+
+    seeds = derive_seeds(seed, len(targets))
+    start = time.perf_counter()
+    with WorkerPool(kind, core_sets) as pool:
+        outcomes = pool.run([(target, num_candidates, target_seed) for target, target_seed in zip(targets, seeds)])
+    seconds = time.perf_counter() - start
+
+    attempts = sum(outcome["result"]["stats"]["attempts"] for outcome in outcomes)
+    return {
+        "targets": [
+            {"target": target.get("cleaned_sequence", ""), "seed": target_seed, **outcome["result"]}
+            for target, target_seed, outcome in zip(targets, seeds, outcomes)
+        ],
+        "stats": {
+            "workers": len(core_sets),
+            "core_sets": core_sets,
+            "seconds": round(seconds, 3),
+            "attempts_per_second": round(attempts / seconds, 3) if seconds > 0 else 0.0,
+            "targets_per_worker": [
+                sum(1 for outcome in outcomes if outcome["worker"] == index) for index in range(len(core_sets))
+            ],
+            "calibration": calibration
+        }
+    }
+
+
+def main():
+    """Generate binders for a list of targets on core-pinned workers."""
+    parser = argparse.ArgumentParser(description='Core-partitioned multi-process binder generation')
+    parser.add_argument('targets', help='JSON file with a list of target sequences or fusion contexts')
+    parser.add_argument('--num-candidates', type=int, default=10, help='Candidates per target')
+    parser.add_argument('--workers', default='auto', help="Worker processes, or 'auto' to calibrate")
+    parser.add_argument('--max-workers', type=int, default=None, help='Upper bound for calibration')
+    parser.add_argument('--seed', type=int, default=42, help='Master seed')
+    parser.add_argument('--generator', choices=['original', 'revised'], default='original',
+                        help='Generator implementation to run')
+    parser.add_argument('--output', help='Write the result JSON to this file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    with open(args.targets) as f:
+        targets = [t if isinstance(t, dict) else {'cleaned_sequence': t} for t in json.load(f)]
+    workers = args.workers if args.workers == 'auto' else int(args.workers)
+    result = generate_targets(targets, args.num_candidates, workers, args.seed, args.generator,
+                              max_workers=args.max_workers)
+    logger.info(f"{len(targets)} targets on {result['stats']['workers']} workers in "
+                f"{result['stats']['seconds']}s")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    else:
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,418 @@
+"""
+Long-lived local generation service for ProtGPT2 binder generation.
+
+The service keeps one generator (and its model) resident and answers
+binder generation requests over localhost HTTP. CDR sampling calls coming
+from concurrent requests are merged into shared micro-batches, so several
+clients share every forward pass instead of each paying for its own. Only
+the model is shared: every request runs on its own view of the generator,
+with its own oversampling window, telemetry and statistics.
+
+Start the service with::
+
+    python -m modules.generation_service --generator revised --port 8765
+
+Entry points use it transparently through GenerationClient whenever a
+service for the matching generator is reachable.
+"""
+
+import argparse
+import copy
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+import torch
+
+from .cdr_decoding import cdr_stopping_criteria
+from .generation_telemetry import GenerationTelemetry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SERVICE_URL = "http://127.0.0.1:8765"
+SERVICE_URL_ENV = "HEALDETTE_GENERATION_SERVICE"
+
+
+class _BatchJob:
+    """A single CDR sampling request waiting for a micro-batch."""
+
+    def __init__(self, prompt: str, num_samples: int, generation_kwargs: Dict, max_residues: int):
+        self.prompt = prompt
+        self.num_samples = num_samples
+        self.generation_kwargs = generation_kwargs
+        self.max_residues = max_residues
+        self.key = (tuple(sorted(generation_kwargs.items())), max_residues)
+        self.done = threading.Event()
+        self.outputs = None
+        self.error = None
+
+
+class MicroBatcher:
+    """
+    Merge concurrent CDR sampling calls into shared ``generate`` passes.
+
+    Jobs are collected until either ``max_batch_size`` sampled rows are
+    queued or ``max_wait_ms`` has passed since the first job arrived. Only
+    jobs with identical sampling parameters share a batch; prompts are left
+    padded so every row decodes from the same position.
+    """
+
+    def __init__(self, model, tokenizer, max_batch_size: int = 32, max_wait_ms: float = 10.0):
+        """
+        Args:
+            model: Causal language model used for sampling
+            tokenizer: Tokenizer matching the model
+            max_batch_size: Maximum number of sampled rows per forward pass
+            max_wait_ms: Maximum time to wait for more jobs once one is queued
+        """
+        self.model = model
+        # Own copy, so left padding does not change the caller's tokenizer;
+        # a deep copy also keeps a fast tokenizer's padding state apart
+        self.tokenizer = copy.deepcopy(tokenizer)
+        self.tokenizer.padding_side = "left"
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self.stats = {"batches": 0, "jobs": 0, "rows": 0}
+        self._queue = queue.Queue()
+        self._deferred = deque()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def generate(self, prompt: str, num_samples: int, generation_kwargs: Dict,
+                 max_residues: int) -> List[torch.Tensor]:
+        """
+        Sample continuations for a prompt as part of the next micro-batch.
+
+        Args:
+            prompt: Full generation prompt
+            num_samples: Number of sequences to sample for the prompt
+            generation_kwargs: Sampling parameters passed to ``generate``
+            max_residues: Maximum CDR length used for length-aware stopping
+
+        Returns:
+            List of output token id tensors, one per sample
+        """
+        if self._closed:
+            raise RuntimeError("MicroBatcher is closed")
+
+        job = _BatchJob(prompt, num_samples, generation_kwargs, max_residues)
+        self._queue.put(job)
+        job.done.wait()
+        if job.error is not None:
+            raise job.error
+        return job.outputs
+
+    def close(self):
+        """Stop the batching thread once queued jobs are finished."""
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _next_job(self, timeout: Optional[float]) -> Optional[_BatchJob]:
+        """Return a deferred job first, then the next queued one."""
+        if self._deferred:
+            return self._deferred.popleft()
+        return self._queue.get(timeout=timeout)
+
+    def _collect(self) -> Optional[List[_BatchJob]]:
+        """Block for one job, then gather compatible jobs until full or timed out."""
+        first = self._next_job(timeout=None)
+        if first is None:
+            return None
+
+        batch = [first]
+        rows = first.num_samples
+        skipped = []
+        deadline = time.monotonic() + self.max_wait
+
+        while rows < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 and not self._deferred:
+                break
+            try:
+                job = self._next_job(timeout=max(remaining, 0))
+            except queue.Empty:
+                break
+            if job is None:
+                self._queue.put(None)
+                break
+            if job.key != first.key or rows + job.num_samples > self.max_batch_size:
+                skipped.append(job)
+                continue
+            batch.append(job)
+            rows += job.num_samples
+
+        # Incompatible jobs go first in the next round
+        self._deferred.extendleft(reversed(skipped))
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                break
+            try:
+                self._run_batch(batch)
+            except Exception as e:
+                for job in batch:
+                    job.error = e
+            for job in batch:
+                job.done.set()
+
+    def _run_batch(self, batch: List[_BatchJob]):
+        """Run one padded ``generate`` call and split its outputs per job."""
+        inputs = self.tokenizer([job.prompt for job in batch], return_tensors="pt", padding=True)
+        counts = torch.tensor([job.num_samples for job in batch])
+        input_ids = inputs["input_ids"].repeat_interleave(counts, dim=0)
+        attention_mask = inputs["attention_mask"].repeat_interleave(counts, dim=0)
+
+        with torch.no_grad():
+            outputs = self.model.generate(
+                input_ids.to(self.model.device),
+                attention_mask=attention_mask.to(self.model.device),
+                stopping_criteria=cdr_stopping_criteria(
+                    self.tokenizer, input_ids.shape[1], batch[0].max_residues
+                ),
+                num_return_sequences=1,
+                pad_token_id=self.tokenizer.pad_token_id,
+                **batch[0].generation_kwargs
+            )
+
+        start = 0
+        for job in batch:
+            job.outputs = list(outputs[start:start + job.num_samples])
+            start += job.num_samples
+
+        self.stats["batches"] += 1
+        self.stats["jobs"] += len(batch)
+        self.stats["rows"] += len(outputs)
+
+
+class GenerationService:
+    """Localhost HTTP front end around a resident antibody generator."""
+
+    def __init__(self, generator, generator_kind: str, host: str = "127.0.0.1", port: int = 8765,
+                 max_batch_size: int = 32, max_wait_ms: float = 10.0):
+        """
+        Args:
+            generator: AntibodyGenerator instance to serve
+            generator_kind: 'original' or 'revised', reported to clients
+            host: Interface to bind, localhost by default
+            port: TCP port to listen on
+            max_batch_size: Maximum number of sampled rows per forward pass
+            max_wait_ms: Maximum time to wait for more jobs per micro-batch
+        """
+        self.generator = generator
+        self.generator_kind = generator_kind
+        # Generators on the ONNX engine have no PyTorch model to micro-batch
+        self.batcher = None
+        if generator.model is not None:
+            self.batcher = MicroBatcher(generator.model, generator.tokenizer, max_batch_size, max_wait_ms)
+        generator.batcher = self.batcher
+        # Guards the generator's shared acceptance rates while requests fork and merge them
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+
+    def _request_generator(self):
+        """
+        View of the generator for one request.
+
+        Shares the model, batcher, templates, filters and similarity service;
+        gets its own oversampler fork, telemetry and speculative decoding stats,
+        which generate_binders resets and reports per run.
+        """
+        generator = copy.copy(self.generator)
+        with self._lock:
+            generator.oversampler = self.generator.oversampler.fork()
+        generator.telemetry = GenerationTelemetry(self.generator.telemetry.metrics_path)
+        if self.generator.speculative_decoder is not None:
+            generator.speculative_decoder = copy.copy(self.generator.speculative_decoder)
+        return generator
+
+    def generate_binders(self, fusion_context: Dict, num_candidates: int = 10) -> Dict:
+        """Run one generation request, keeping what it learned about template acceptance rates."""
+        generator = self._request_generator()
+        try:
+            return generator.generate_binders(fusion_context, num_candidates)
+        finally:
+            with self._lock:
+                self.generator.oversampler.merge(generator.oversampler)
+
+    def _handler_class(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send_json(self, status: int, payload: Dict):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path != "/health":
+                    self._send_json(404, {"error": "Not found"})
+                    return
+                self._send_json(200, {
+                    "status": "ok",
+                    "generator": service.generator_kind,
+                    "batching": service.batcher.stats if service.batcher is not None else None
+                })
+
+            def do_POST(self):
+                if self.path != "/generate":
+                    self._send_json(404, {"error": "Not found"})
+                    return
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    request = json.loads(self.rfile.read(length) or b"{}")
+                    fusion_context = request["fusion_context"]
+                    num_candidates = int(request.get("num_candidates", 10))
+                    if not isinstance(fusion_context, dict):
+                        raise ValueError("fusion_context must be an object")
+                except (KeyError, TypeError, ValueError) as e:
+                    self._send_json(400, {"error": f"Invalid request: {e}"})
+                    return
+                try:
+                    results = service.generate_binders(fusion_context, num_candidates)
+                except Exception as e:
+                    logger.exception("Generation request failed")
+                    self._send_json(500, {"error": str(e)})
+                    return
+                self._send_json(200, results)
+
+            def log_message(self, format, *args):
+                logger.info("%s - %s", self.address_string(), format % args)
+
+        return Handler
+
+    def serve_forever(self):
+        """Serve requests until interrupted."""
+        host, port = self.server.server_address[:2]
+        logger.info(f"Generation service ({self.generator_kind}) listening on http://{host}:{port}")
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            if self.batcher is not None:
+                self.batcher.close()
+
+    def shutdown(self):
+        """Stop serving from another thread."""
+        self.server.shutdown()
+
+
+class GenerationClient:
+    """Client for a running generation service."""
+
+    def __init__(self, url: str = DEFAULT_SERVICE_URL, timeout: float = 3600.0):
+        """
+        Args:
+            url: Base URL of the service
+            timeout: Timeout in seconds for generation requests
+        """
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    @classmethod
+    def from_env(cls) -> Optional["GenerationClient"]:
+        """
+        Create a client from the HEALDETTE_GENERATION_SERVICE variable.
+
+        Returns:
+            Client for the configured URL (or the default one), or None when
+            the variable is set to 'off'
+        """
+        url = os.environ.get(SERVICE_URL_ENV, DEFAULT_SERVICE_URL)
+        if url.lower() in ("", "0", "off", "none"):
+            return None
+        return cls(url)
+
+    def health(self) -> Optional[Dict]:
+        """Return the service health report, or None if it is not reachable."""
+        try:
+            with urllib.request.urlopen(f"{self.url}/health", timeout=0.5) as response:
+                return json.loads(response.read())
+        except (urllib.error.URLError, OSError, ValueError):
+            return None
+
+    def is_available(self, generator_kind: str) -> bool:
+        """Check whether a service for the given generator kind is running."""
+        health = self.health()
+        return bool(health) and health.get("generator") == generator_kind
+
+    def generate_binders(self, fusion_context: Dict, num_candidates: int = 10) -> Dict:
+        """
+        Request binders from the service.
+
+        Args:
+            fusion_context: Fusion context passed to ``generate_binders``
+            num_candidates: Number of binders to generate
+
+        Returns:
+            The generator's result dictionary
+        """
+        payload = json.dumps({
+            "fusion_context": fusion_context,
+            "num_candidates": num_candidates
+        }).encode()
+        request = urllib.request.Request(
+            f"{self.url}/generate",
+            data=payload,
+            headers={"Content-Type": "application/json"},
+            method="POST"
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            detail = json.loads(e.read() or b"{}").get("error", e.reason)
+            raise RuntimeError(f"Generation service error: {detail}") from e
+
+
+def main():
+    """Run the generation service from the command line."""
+    parser = argparse.ArgumentParser(description='Run a resident ProtGPT2 binder generation service')
+    parser.add_argument('--generator', choices=['original', 'revised'], default='revised',
+                        help='Generator implementation to serve')
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to bind')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on')
+    parser.add_argument('--max-batch-size', type=int, default=32,
+                        help='Maximum sampled rows per forward pass')
+    parser.add_argument('--max-wait-ms', type=float, default=10.0,
+                        help='Maximum wait for more requests before running a batch')
+    parser.add_argument('--engine', choices=['torch', 'onnx'], default='torch',
+                        help='Inference engine; onnx requires a model exported with modules.onnx_engine')
+    parser.add_argument('--onnx-model-dir', default='models/protgpt2-onnx',
+                        help='Exported ONNX model directory')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.generator == 'revised':
+        from .revised.antibody_generator import AntibodyGenerator
+    else:
+        from .generate_binders import AntibodyGenerator
+
+    service = GenerationService(
+        AntibodyGenerator(engine=args.engine, onnx_model_dir=args.onnx_model_dir),
+        args.generator, args.host, args.port,
+        args.max_batch_size, args.max_wait_ms
+    )
+    service.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
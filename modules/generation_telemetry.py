@@ -0,0 +1,136 @@
+"""
+Generation telemetry.
+
+Collects where generation time goes and where samples are lost: forward
+pass time, generated tokens and throughput, per-stage acceptance funnel
+counts and a histogram of rejection reasons. Summaries are attached to the
+generators' run stats and can optionally be streamed to a JSONL metrics
+file, one event per line.
+"""
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+def generated_token_count(outputs, prompt_length: int, pad_token_id: Optional[int]) -> int:
+    """
+    Count newly generated tokens in a batch of ``generate`` outputs.
+
+    Args:
+        outputs: Output token id rows (tensor or list of tensors)
+        prompt_length: Number of non-padding prompt tokens per row
+        pad_token_id: Padding token id, excluded from the count
+
+    Returns:
+        Total generated tokens over all rows
+    """
+    total = 0
+    for row in outputs:
+        tokens = int((row != pad_token_id).sum()) if pad_token_id is not None else len(row)
+        total += max(tokens - prompt_length, 0)
+    return total
+
+
+class GenerationTelemetry:
+    """Thread-safe counters for one generation run."""
+
+    def __init__(self, metrics_path: Optional[str] = None):
+        """
+        Args:
+            metrics_path: Optional JSONL file that forward passes and run
+                summaries are appended to
+        """
+        self.metrics_path = metrics_path
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Clear all counters."""
+        with self._lock:
+            self.forward_passes = 0
+            self.generated_tokens = 0
+            self.sampled_rows = 0
+            self.timings = {"forward": 0.0}
+            self.funnel = {}
+            self.rejections = {}
+
+    def start_run(self):
+        """Reset counters at the start of a generation run."""
+        self.reset()
+
+    def _emit(self, event: Dict):
+        if self.metrics_path is None:
+            return
+        event = {"time": time.time(), **event}
+        with self._lock, open(self.metrics_path, 'a') as f:
+            f.write(json.dumps(event) + "\n")
+
+    def record_forward(self, seconds: float, tokens: int, rows: int):
+        """
+        Record one sampling call.
+
+        Args:
+            seconds: Wall time of the ``generate`` call
+            tokens: Newly generated tokens over all rows
+            rows: Number of sampled sequences
+        """
+        with self._lock:
+            self.forward_passes += 1
+            self.generated_tokens += tokens
+            self.sampled_rows += rows
+            self.timings["forward"] += seconds
+        self._emit({
+            "event": "forward", "seconds": round(seconds, 6), "tokens": tokens, "rows": rows,
+            "tokens_per_second": round(tokens / seconds, 2) if seconds > 0 else None
+        })
+
+    @contextmanager
+    def timed(self, name: str):
+        """Accumulate the wall time of a block under the given name."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.timings[name] = self.timings.get(name, 0.0) + elapsed
+
+    def record_stage(self, stage: str, reason: Optional[str] = None):
+        """
+        Record one sample passing through a filter stage.
+
+        Args:
+            stage: Filter stage name
+            reason: Rejection reason, or None if the sample passed
+        """
+        with self._lock:
+            counts = self.funnel.setdefault(stage, {"evaluated": 0, "passed": 0})
+            counts["evaluated"] += 1
+            if reason is None:
+                counts["passed"] += 1
+            else:
+                self.rejections[reason] = self.rejections.get(reason, 0) + 1
+
+    def summary(self) -> Dict:
+        """Return throughput, timings, funnel counts and rejection reasons."""
+        with self._lock:
+            forward_seconds = self.timings["forward"]
+            return {
+                "forward_passes": self.forward_passes,
+                "sampled_rows": self.sampled_rows,
+                "generated_tokens": self.generated_tokens,
+                "tokens_per_second": (round(self.generated_tokens / forward_seconds, 2)
+                                      if forward_seconds > 0 else 0),
+                "timings": {name: round(seconds, 6) for name, seconds in self.timings.items()},
+                "funnel": {stage: dict(counts) for stage, counts in self.funnel.items()},
+                "rejections": dict(self.rejections)
+            }
+
+    def finish_run(self) -> Dict:
+        """Return the run summary and append it to the metrics file."""
+        summary = self.summary()
+        self._emit({"event": "run_summary", **summary})
+        return summary
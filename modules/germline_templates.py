@@ -0,0 +1,285 @@
+"""
+Indexed library of germline V-gene templates.
+
+Templates are loaded from a local JSON data file and indexed by chain and
+gene family. Each template carries its prompt prefix, which is tokenized
+once per tokenizer and cached, and templates are drawn with O(1) weighted
+sampling from per-chain and per-family alias tables, so adding templates
+does not add prompt-encoding or sampling cost per attempt.
+
+Libraries with hundreds of V genes can be built from an IMGT/GENE-DB
+gapped amino acid FASTA export, whose IMGT numbering gives the framework
+boundaries.
+
+Usage:
+    python -m modules.germline_templates import-imgt IMGTGENEDB-AA-WithGaps.fasta
+    python -m modules.germline_templates info
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import weakref
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TEMPLATE_FILE = os.path.join(os.path.dirname(__file__), 'data', 'germline_templates.json')
+
+# Placeholder residues standing in for CDR1 in prompt prefixes
+CDR1_PLACEHOLDER = {'VH': 10, 'VL': 8}
+
+# IMGT unique numbering of framework regions in V genes
+IMGT_FRAMEWORKS = {'FR1': (1, 26), 'FR2': (39, 55), 'FR3': (66, 104)}
+
+# J-region FR4 used for V genes imported from IMGT, per locus
+DEFAULT_FR4 = {'IGH': 'WGQGTLVTVSS', 'IGK': 'FGQGTKVEIK', 'IGL': 'FGGGTKLTVL'}
+
+CHAINS = {'IGH': 'VH', 'IGK': 'VL', 'IGL': 'VL'}
+
+
+@dataclass
+class GermlineTemplate:
+    """A germline V-gene framework template."""
+    name: str
+    chain: str
+    family: str
+    FR1: str
+    FR2: str
+    FR3: str
+    FR4: str
+    weight: float = 1.0
+
+    @property
+    def frameworks(self) -> Dict[str, str]:
+        """Framework regions keyed FR1 to FR4."""
+        return {'FR1': self.FR1, 'FR2': self.FR2, 'FR3': self.FR3, 'FR4': self.FR4}
+
+    @property
+    def prompt_prefix(self) -> str:
+        """Framework context the CDR prompt starts with."""
+        return self.FR1 + "X" * CDR1_PLACEHOLDER[self.chain] + self.FR2
+
+
+class AliasTable:
+    """Walker/Vose alias table for O(1) sampling from a discrete distribution."""
+
+    def __init__(self, weights: Sequence[float]):
+        """
+        Args:
+            weights: Non-negative weights with a positive sum
+        """
+        n = len(weights)
+        total = float(sum(weights))
+        if n == 0 or total <= 0:
+            raise ValueError("Alias tables need at least one positive weight")
+        scaled = [w * n / total for w in weights]
+        self.prob = [1.0] * n
+        self.alias = list(range(n))
+        small = [i for i, w in enumerate(scaled) if w < 1.0]
+        large = [i for i, w in enumerate(scaled) if w >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+
+    def sample(self, rng=random) -> int:
+        """Draw an index with probability proportional to its weight."""
+        column = int(rng.random() * len(self.prob))
+        return column if rng.random() < self.prob[column] else self.alias[column]
+
+
+class TemplateLibrary:
+    """Germline templates indexed by name, chain and gene family."""
+
+    def __init__(self, templates: Sequence[GermlineTemplate]):
+        """
+        Args:
+            templates: Templates of one or both chains
+        """
+        self.templates: Dict[str, GermlineTemplate] = {}
+        for template in templates:
+            if template.chain not in CDR1_PLACEHOLDER:
+                raise ValueError(f"Unknown chain {template.chain!r} for template {template.name}")
+            self.templates[template.name] = template
+
+        self._by_chain: Dict[str, List[GermlineTemplate]] = defaultdict(list)
+        self._by_family: Dict[Tuple[str, str], List[GermlineTemplate]] = defaultdict(list)
+        for template in self.templates.values():
+            self._by_chain[template.chain].append(template)
+            self._by_family[(template.chain, template.family)].append(template)
+        self._tables = {
+            key: AliasTable([t.weight for t in group])
+            for key, group in [*self._by_chain.items(), *self._by_family.items()]
+        }
+        # Tokenized prompt prefixes per tokenizer and template name
+        self._prefix_ids = weakref.WeakKeyDictionary()
+
+    def __len__(self) -> int:
+        return len(self.templates)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.templates
+
+    def __getitem__(self, name: str) -> GermlineTemplate:
+        return self.templates[name]
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_TEMPLATE_FILE) -> "TemplateLibrary":
+        """Load templates from a JSON data file."""
+        with open(path) as f:
+            data = json.load(f)
+        return cls([GermlineTemplate(**entry) for entry in data['templates']])
+
+    def save(self, path: str, metadata: Optional[Dict] = None):
+        """Write the templates as a JSON data file."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({
+                'metadata': metadata or {},
+                'templates': [vars(template) for template in self.templates.values()]
+            }, f, indent=2)
+
+    def families(self, chain: str) -> List[str]:
+        """Gene families with templates for a chain."""
+        return sorted(family for c, family in self._by_family if c == chain)
+
+    def chain_templates(self, chain: str, family: Optional[str] = None) -> List[GermlineTemplate]:
+        """Templates of a chain, optionally restricted to one gene family."""
+        if family is None:
+            return list(self._by_chain.get(chain, []))
+        return list(self._by_family.get((chain, family), []))
+
+    def sample(self, chain: str, family: Optional[str] = None, rng=random) -> GermlineTemplate:
+        """
+        Draw a template in O(1), weighted by template weight.
+
+        Args:
+            chain: 'VH' or 'VL'
+            family: Restrict to a gene family such as 'IGHV3'
+            rng: Random source; defaults to the seeded module-level random
+
+        Returns:
+            The sampled template
+        """
+        key = chain if family is None else (chain, family)
+        table = self._tables.get(key)
+        if table is None:
+            raise KeyError(f"No templates for {key}")
+        group = self._by_chain[chain] if family is None else self._by_family[key]
+        return group[table.sample(rng)]
+
+    def prefix_ids(self, name: str, tokenizer) -> List[int]:
+        """Token ids of a template's prompt prefix, tokenized once per tokenizer."""
+        cache = self._prefix_ids.setdefault(tokenizer, {})
+        ids = cache.get(name)
+        if ids is None:
+            ids = tokenizer(self.templates[name].prompt_prefix)["input_ids"]
+            cache[name] = ids
+        return ids
+
+    def as_dict(self) -> Dict[str, Dict[str, Dict[str, str]]]:
+        """Frameworks nested by chain and template name, as used by CombinatorialAssembler."""
+        return {
+            chain: {template.name: template.frameworks for template in group}
+            for chain, group in self._by_chain.items()
+        }
+
+
+def parse_imgt_fasta(path: str, species: str = 'Homo sapiens',
+                     functional_only: bool = True) -> List[GermlineTemplate]:
+    """
+    Read V-gene templates from an IMGT/GENE-DB gapped amino acid FASTA.
+
+    Headers follow the IMGT layout ``>accession|gene*allele|species|functionality|...``
+    and sequences use IMGT gaps ('.'), so framework regions are cut at fixed
+    IMGT positions. FR4 comes from the locus' common J region.
+
+    Args:
+        path: FASTA file
+        species: Keep only entries of this species
+        functional_only: Keep only functional ('F') alleles
+
+    Returns:
+        Templates of IGHV, IGKV and IGLV genes
+    """
+    records = []
+    header, chunks = None, []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('>'):
+                if header is not None:
+                    records.append((header, ''.join(chunks)))
+                header, chunks = line[1:], []
+            elif line:
+                chunks.append(line)
+    if header is not None:
+        records.append((header, ''.join(chunks)))
+
+    templates = []
+    for header, gapped in records:
+        fields = header.split('|')
+        if len(fields) < 4:
+            continue
+        name, entry_species, functionality = fields[1], fields[2], fields[3]
+        locus = name[:3]
+        if locus not in CHAINS or name[3:4] != 'V' or entry_species != species:
+            continue
+        if functional_only and functionality != 'F':
+            continue
+        regions = {
+            region: gapped[start - 1:end].replace('.', '')
+            for region, (start, end) in IMGT_FRAMEWORKS.items()
+        }
+        if not all(regions.values()):
+            continue  # Partial sequence
+        templates.append(GermlineTemplate(
+            name=name, chain=CHAINS[locus], family=name.split('-')[0].split('*')[0],
+            FR4=DEFAULT_FR4[locus], **regions
+        ))
+    return templates
+
+
+def main():
+    """Import IMGT V genes into a template file or summarize one."""
+    parser = argparse.ArgumentParser(description='Germline template library')
+    parser.add_argument('--templates', default=DEFAULT_TEMPLATE_FILE, help='Template data file')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = subparsers.add_parser('import-imgt', help='Build the template file from IMGT/GENE-DB')
+    import_parser.add_argument('fasta', help='Gapped amino acid FASTA from IMGT/GENE-DB')
+    import_parser.add_argument('--species', default='Homo sapiens', help='Species to keep')
+    import_parser.add_argument('--all-functionalities', action='store_true',
+                               help='Also keep ORF and pseudogene alleles')
+
+    subparsers.add_parser('info', help='Show templates per chain and family')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == 'import-imgt':
+        templates = parse_imgt_fasta(args.fasta, args.species, not args.all_functionalities)
+        TemplateLibrary(templates).save(args.templates, {
+            'source': os.path.basename(args.fasta),
+            'species': args.species,
+            'numbering': 'IMGT'
+        })
+        logger.info(f"Wrote {len(templates)} templates to {args.templates}")
+        return
+
+    library = TemplateLibrary.load(args.templates)
+    print(json.dumps({
+        chain: {family: len(library.chain_templates(chain, family)) for family in library.families(chain)}
+        for chain in CDR1_PLACEHOLDER
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+k-mer inverted index prefilter for large reference panels.
+
+Exact similarity scoring is linear in the panel size, which is fine for the
+bundled therapeutics but not for a local dump of hundreds of thousands of
+antibodies such as an OAS extract. The prefilter maps every k-mer of the
+reference chains to a postings list of reference ids, stored in CSR form as
+two compact arrays (offsets and uint32 postings). A query's k-mers select
+the references sharing enough of them, and only those are scored exactly.
+
+Indices are saved as .npy files next to a small JSON header and loaded
+memory-mapped, so opening an index takes milliseconds whatever its size.
+
+Usage:
+    python -m modules.kmer_index build panel.csv models/reference_prefilter --k 3
+    python -m modules.kmer_index query models/reference_prefilter panel.csv HEAVY_CHAIN LIGHT_CHAIN
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+from .reference_index import OTHER, AntibodyReferenceIndex, ReferenceIndex, encode, load_reference_panel
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_K = 3
+
+# Residue codes per k-mer digit, including OTHER so k-mer ids are plain base-21 numbers
+_BASE = OTHER + 1
+
+
+def _window_kmers(codes: np.ndarray, k: int) -> np.ndarray:
+    """k-mer ids of every window of a 2D code array; windows with padding or non-standard residues are -1."""
+    if codes.shape[1] < k:
+        return np.empty((len(codes), 0), dtype=np.int64)
+    windows = np.lib.stride_tricks.sliding_window_view(codes, k, axis=1)
+    kmers = (windows.astype(np.int64) * (_BASE ** np.arange(k - 1, -1, -1))).sum(axis=2)
+    return np.where((windows < OTHER).all(axis=2), kmers, -1)
+
+
+def fingerprint(references: ReferenceIndex) -> str:
+    """Cheap identity of a reference set, used to detect stale indices."""
+    return hashlib.sha1(references.lengths.tobytes()).hexdigest()[:16]
+
+
+class KmerIndex:
+    """Inverted index from k-mers to the references containing them."""
+
+    def __init__(self, k: int, offsets: np.ndarray, postings: np.ndarray, num_references: int,
+                 fingerprint: str = ''):
+        """
+        Args:
+            k: k-mer length
+            offsets: Start of each k-mer's postings; length 21**k + 1
+            postings: Reference ids grouped by k-mer, ascending within a k-mer
+            num_references: Number of indexed references
+            fingerprint: Identity of the indexed reference set
+        """
+        self.k = k
+        self.offsets = offsets
+        self.postings = postings
+        self.num_references = num_references
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def build(cls, references: ReferenceIndex, k: int = DEFAULT_K, chunk_size: int = 20000) -> "KmerIndex":
+        """
+        Index the distinct k-mers of every reference.
+
+        Args:
+            references: Encoded reference chains
+            k: k-mer length
+            chunk_size: References processed at once, bounding build memory
+
+        Returns:
+            The index
+        """
+        num_kmers = _BASE ** k
+        pairs = []
+        for start in range(0, len(references), chunk_size):
+            kmers = _window_kmers(references.codes[start:start + chunk_size], k)
+            rows = np.broadcast_to(np.arange(start, start + len(kmers))[:, None], kmers.shape)
+            valid = kmers >= 0
+            # Sorting kmer * N + row groups by k-mer and puts repeats of a k-mer within a reference side by side
+            chunk = np.sort(kmers[valid] * len(references) + rows[valid])
+            pairs.append(chunk[np.concatenate(([True], chunk[1:] != chunk[:-1]))] if len(chunk) else chunk)
+        pairs = np.concatenate(pairs) if pairs else np.empty(0, dtype=np.int64)
+        # Chunks cover ascending row ranges, so a stable sort keeps rows ascending per k-mer
+        pairs = pairs[np.argsort(pairs // max(len(references), 1), kind='stable')]
+        kmer_ids, postings = np.divmod(pairs, max(len(references), 1))
+
+        offsets = np.zeros(num_kmers + 1, dtype=np.int64)
+        np.cumsum(np.bincount(kmer_ids, minlength=num_kmers), out=offsets[1:])
+        return cls(k, offsets, postings.astype(np.uint32), len(references), fingerprint(references))
+
+    def save(self, path: str):
+        """Write the index to a directory."""
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'offsets.npy'), self.offsets)
+        np.save(os.path.join(path, 'postings.npy'), self.postings)
+        with open(os.path.join(path, 'index.json'), 'w') as f:
+            json.dump({'k': self.k, 'num_references': self.num_references,
+                       'num_postings': int(len(self.postings)), 'fingerprint': self.fingerprint}, f, indent=2)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "KmerIndex":
+        """Open an index saved with save(), memory-mapping its arrays by default."""
+        with open(os.path.join(path, 'index.json')) as f:
+            header = json.load(f)
+        mode = 'r' if mmap else None
+        return cls(
+            header['k'],
+            np.load(os.path.join(path, 'offsets.npy'), mmap_mode=mode),
+            np.load(os.path.join(path, 'postings.npy'), mmap_mode=mode),
+            header['num_references'],
+            header['fingerprint']
+        )
+
+    def query_kmers(self, sequence: str) -> np.ndarray:
+        """Distinct k-mer ids of a query."""
+        kmers = _window_kmers(encode(sequence)[None, :], self.k)[0]
+        return np.unique(kmers[kmers >= 0])
+
+    def shared_counts(self, sequence: str) -> np.ndarray:
+        """Number of distinct query k-mers each reference contains."""
+        kmers = self.query_kmers(sequence)
+        starts, stops = self.offsets[kmers], self.offsets[kmers + 1]
+        hits = np.concatenate([self.postings[a:b] for a, b in zip(starts, stops)]) if len(kmers) else []
+        return np.bincount(np.asarray(hits, dtype=np.int64), minlength=self.num_references)
+
+
+class AntibodyKmerPrefilter:
+    """Candidate selection for antibody similarity search from heavy and light chain k-mers."""
+
+    def __init__(self, heavy: KmerIndex, light: KmerIndex, min_shared: float = 0.3,
+                 max_candidates: Optional[int] = None):
+        """
+        Args:
+            heavy: Heavy chain k-mer index
+            light: Light chain k-mer index
+            min_shared: Fraction of the query's distinct k-mers (both chains) a
+                reference must contain to be scored
+            max_candidates: Keep at most this many candidates, those sharing the most k-mers
+        """
+        self.heavy = heavy
+        self.light = light
+        self.min_shared = min_shared
+        self.max_candidates = max_candidates
+
+    @classmethod
+    def build(cls, references: AntibodyReferenceIndex, k: int = DEFAULT_K, **kwargs) -> "AntibodyKmerPrefilter":
+        """Index both chains of a reference set."""
+        return cls(KmerIndex.build(references.heavy, k), KmerIndex.build(references.light, k), **kwargs)
+
+    def save(self, path: str):
+        """Write both chain indices below a directory."""
+        self.heavy.save(os.path.join(path, 'heavy'))
+        self.light.save(os.path.join(path, 'light'))
+
+    @classmethod
+    def load(cls, path: str, references: Optional[AntibodyReferenceIndex] = None,
+             **kwargs) -> "AntibodyKmerPrefilter":
+        """
+        Open a saved prefilter.
+
+        Args:
+            path: Directory written by save()
+            references: Reference set the prefilter will be used with; checked
+                against the indexed one
+            **kwargs: min_shared and max_candidates
+
+        Returns:
+            The prefilter
+        """
+        prefilter = cls(KmerIndex.load(os.path.join(path, 'heavy')),
+                        KmerIndex.load(os.path.join(path, 'light')), **kwargs)
+        if references is not None and (prefilter.heavy.fingerprint != fingerprint(references.heavy) or
+                                       prefilter.light.fingerprint != fingerprint(references.light)):
+            raise ValueError(f"k-mer index in {path} was built for a different reference panel")
+        return prefilter
+
+    def candidates(self, sequence: Dict[str, str]) -> np.ndarray:
+        """
+        References worth scoring exactly for a heavy/light chain pair.
+
+        Args:
+            sequence: Dictionary with heavy_chain and light_chain sequences
+
+        Returns:
+            Ascending reference ids
+        """
+        counts = self.heavy.shared_counts(sequence['heavy_chain']) + \
+            self.light.shared_counts(sequence['light_chain'])
+        total = len(self.heavy.query_kmers(sequence['heavy_chain'])) + \
+            len(self.light.query_kmers(sequence['light_chain']))
+        selected = np.flatnonzero(counts >= self.min_shared * total)
+        if self.max_candidates is not None and len(selected) > self.max_candidates:
+            best = np.argpartition(-counts[selected], self.max_candidates - 1)[:self.max_candidates]
+            selected = np.sort(selected[best])
+        return selected
+
+
+def main():
+    """Build or query a k-mer prefilter for a reference panel."""
+    parser = argparse.ArgumentParser(description='k-mer inverted index over reference antibody chains')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help='Index a reference panel')
+    build_parser.add_argument('panel', help='Reference panel (therapeutic antibody JSON or OAS paired CSV)')
+    build_parser.add_argument('output', help='Index directory')
+    build_parser.add_argument('--k', type=int, default=DEFAULT_K, help='k-mer length')
+
+    query_parser = subparsers.add_parser('query', help='Find similar references through the prefilter')
+    query_parser.add_argument('index', help='Index directory')
+    query_parser.add_argument('panel', help='Reference panel the index was built from')
+    query_parser.add_argument('heavy_chain', help='Query heavy chain')
+    query_parser.add_argument('light_chain', help='Query light chain')
+    query_parser.add_argument('--min-shared', type=float, default=0.3, help='Minimum shared k-mer fraction')
+    query_parser.add_argument('--threshold', type=float, default=0.7, help='Minimum similarity')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    references = AntibodyReferenceIndex(load_reference_panel(args.panel))
+    if args.command == 'build':
+        start = time.perf_counter()
+        AntibodyKmerPrefilter.build(references, args.k).save(args.output)
+        logger.info(f"Indexed {len(references.heavy)} references in {time.perf_counter() - start:.1f}s")
+        return
+
+    start = time.perf_counter()
+    references.prefilter = AntibodyKmerPrefilter.load(args.index, references, min_shared=args.min_shared)
+    logger.info(f"Loaded index in {1000 * (time.perf_counter() - start):.1f} ms")
+    query = {'heavy_chain': args.heavy_chain, 'light_chain': args.light_chain}
+    print(json.dumps(references.find_similar(query, args.threshold), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+Banded Smith-Waterman local alignment scoring.
+
+The default position-by-position similarity compares residues at the same
+index, so a single insertion shifts every later position out of register.
+This module scores local alignments with BLOSUM62 and affine gaps (a gap of
+length L costs open_gap + (L - 1) * extend_gap, as in Biopython's
+PairwiseAligner), restricted to a band around the main diagonal.
+
+Many pairs are aligned at once: the dynamic programming matrix is swept
+anti-diagonal by anti-diagonal, since the cells of one anti-diagonal depend
+only on the two before it, and every step is a NumPy operation over all
+pairs of a batch and all band cells of the anti-diagonal. Alignment scores
+are memoized by a hash of the pair.
+
+Similarity is the alignment score normalized by the geometric mean of the
+two self-alignment scores, clipped to [0, 1].
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+from Bio.Align import substitution_matrices
+
+from .reference_index import AMINO_ACIDS, OTHER, ReferenceIndex, encode
+
+# Code of positions past the end of a sequence in a padded batch
+PAD = OTHER + 1
+
+# Scores that can never win, with room below them for one gap penalty in int16
+_NEG = -(1 << 13)
+_PAD_SCORE = -(1 << 12)
+
+# Similarity backends accepted by the validators
+SIMILARITY_BACKENDS = ('prefix', 'alignment')
+
+
+def _substitution_matrix() -> np.ndarray:
+    """BLOSUM62 over the residue codes; non-standard residues score as X, padding never aligns."""
+    blosum = substitution_matrices.load('BLOSUM62')
+    letters = AMINO_ACIDS + 'X'
+    matrix = np.full((PAD + 1, PAD + 1), _PAD_SCORE, dtype=np.int32)
+    for i, aa1 in enumerate(letters):
+        for j, aa2 in enumerate(letters):
+            matrix[i, j] = blosum[aa1, aa2]
+    return matrix
+
+
+BLOSUM62 = _substitution_matrix()
+_FLAT_BLOSUM62 = BLOSUM62.ravel()
+
+
+def smith_waterman_batch(queries: Sequence[str], references: Sequence[str], open_gap: int = 11,
+                         extend_gap: int = 1, bandwidth: Optional[int] = 16) -> np.ndarray:
+    """
+    Local alignment scores of query/reference pairs.
+
+    Args:
+        queries: Query sequences
+        references: Reference sequences, paired with queries by position
+        open_gap: Cost of the first residue of a gap
+        extend_gap: Cost of each further residue of a gap
+        bandwidth: Cells farther than this from the diagonal band spanning the
+            length difference are not computed; None aligns without a band
+
+    Returns:
+        Int64 array of alignment scores, one per pair
+    """
+    pairs = len(queries)
+    query_lengths = np.array([len(seq) for seq in queries], dtype=np.int64)
+    reference_lengths = np.array([len(seq) for seq in references], dtype=np.int64)
+    rows = int(query_lengths.max()) if pairs else 0
+    columns = int(reference_lengths.max()) if pairs else 0
+    if rows == 0 or columns == 0:
+        return np.zeros(pairs, dtype=np.int64)
+
+    query_codes = np.full((pairs, rows), PAD, dtype=np.intp)
+    reference_codes = np.full((pairs, columns), PAD, dtype=np.intp)
+    for pair, (query, reference) in enumerate(zip(queries, references)):
+        query_codes[pair, :len(query)] = encode(query)
+        reference_codes[pair, :len(reference)] = encode(reference)
+
+    # Row offsets into the flattened substitution matrix
+    query_codes *= BLOSUM62.shape[1]
+
+    if bandwidth is None:
+        band = rows + columns
+    else:
+        band = bandwidth + int(np.abs(query_lengths - reference_lengths).max())
+
+    # Three rotating anti-diagonals of H (best score ending at a cell), E (ending
+    # in a gap in the query) and F (ending in a gap in the reference), indexed by
+    # query position i; index 0 is the empty-prefix boundary
+    # int16 halves memory traffic; E and F never fall below -open_gap inside the
+    # band, so only the best score can overflow, and only for very long chains
+    max_score = int(BLOSUM62[:OTHER, :OTHER].max()) * min(rows, columns)
+    dtype = np.int16 if max_score < (1 << 14) and open_gap + extend_gap < (1 << 12) else np.int32
+    substitutions = _FLAT_BLOSUM62.astype(dtype)
+
+    H = np.zeros((3, pairs, rows + 1), dtype=dtype)
+    E = np.full((3, pairs, rows + 1), _NEG, dtype=dtype)
+    F = np.full((3, pairs, rows + 1), _NEG, dtype=dtype)
+    computed = [(1, 0)] * 3
+    best = np.zeros(pairs, dtype=dtype)
+
+    for d in range(2, rows + columns + 1):
+        cur, prev, prev2 = d % 3, (d - 1) % 3, (d - 2) % 3
+        # Cells left over from three diagonals ago must read as outside the matrix
+        start, stop = computed[cur]
+        H[cur, :, start:stop + 1] = 0
+        E[cur, :, start:stop + 1] = _NEG
+        F[cur, :, start:stop + 1] = _NEG
+
+        # Cell (i, d - i) lies in the band when |2i - d| <= band
+        lo = max(1, d - columns, (d - band + 1) // 2)
+        hi = min(rows, d - 1, (d + band) // 2)
+        computed[cur] = (lo, hi)
+        if lo > hi:
+            continue
+
+        i, i_up = slice(lo, hi + 1), slice(lo - 1, hi)
+        # Reference positions run backwards along an anti-diagonal
+        substitution = substitutions[query_codes[:, lo - 1:hi] + reference_codes[:, d - hi - 1:d - lo][:, ::-1]]
+        e = np.maximum(H[prev, :, i] - open_gap, E[prev, :, i] - extend_gap)
+        f = np.maximum(H[prev, :, i_up] - open_gap, F[prev, :, i_up] - extend_gap)
+        h = np.maximum(np.maximum(H[prev2, :, i_up] + substitution, 0), np.maximum(e, f))
+        E[cur, :, i], F[cur, :, i], H[cur, :, i] = e, f, h
+        np.maximum(best, h.max(axis=1), out=best)
+
+    return best.astype(np.int64)
+
+
+class LocalAligner:
+    """Memoized banded Smith-Waterman scoring of sequence pairs."""
+
+    def __init__(self, open_gap: int = 11, extend_gap: int = 1, bandwidth: Optional[int] = 16,
+                 batch_size: int = 512, cache_size: int = 100000):
+        """
+        Args:
+            open_gap: Cost of the first residue of a gap
+            extend_gap: Cost of each further residue of a gap
+            bandwidth: Band half-width beyond the length difference; None for full alignment
+            batch_size: Pairs aligned per vectorized batch
+            cache_size: Pair scores kept in the memo, least recently used evicted first
+        """
+        self.open_gap = open_gap
+        self.extend_gap = extend_gap
+        self.bandwidth = bandwidth
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, query: str, reference: str) -> bytes:
+        return hashlib.blake2b(f"{query}\0{reference}".encode(), digest_size=16).digest()
+
+    def scores(self, pairs: Sequence[Tuple[str, str]]) -> np.ndarray:
+        """
+        Local alignment scores of (query, reference) pairs.
+
+        Args:
+            pairs: Sequence pairs
+
+        Returns:
+            Int64 array of scores in pair order
+        """
+        keys = [self._key(query, reference) for query, reference in pairs]
+        scores = np.zeros(len(pairs), dtype=np.int64)
+        missing = {}
+        with self._lock:
+            for position, key in enumerate(keys):
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    scores[position] = self._cache[key]
+                else:
+                    missing.setdefault(key, position)
+
+        # Similar lengths share a batch, which keeps padding and the band narrow
+        todo = sorted(missing.values(), key=lambda position: (len(pairs[position][0]), len(pairs[position][1])))
+        computed = {}
+        for start in range(0, len(todo), self.batch_size):
+            batch = todo[start:start + self.batch_size]
+            batch_scores = smith_waterman_batch([pairs[p][0] for p in batch], [pairs[p][1] for p in batch],
+                                                self.open_gap, self.extend_gap, self.bandwidth)
+            for position, score in zip(batch, batch_scores):
+                computed[keys[position]] = int(score)
+
+        for position, key in enumerate(keys):
+            if key in computed:
+                scores[position] = computed[key]
+        with self._lock:
+            self._cache.update(computed)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return scores
+
+    def similarities(self, pairs: Sequence[Tuple[str, str]]) -> np.ndarray:
+        """
+        Alignment scores normalized by the self-alignment scores of both sequences.
+
+        Args:
+            pairs: (query, reference) sequence pairs
+
+        Returns:
+            Float64 array of similarities in [0, 1]
+        """
+        sequences = list({seq for pair in pairs for seq in pair})
+        own = dict(zip(sequences, self.scores([(seq, seq) for seq in sequences])))
+        scores = self.scores(pairs).astype(np.float64)
+        norms = np.sqrt([own[query] * own[reference] for query, reference in pairs])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(norms > 0, np.clip(scores / norms, 0.0, 1.0), 0.0)
+
+    def similarity(self, query: str, reference: str) -> float:
+        """Normalized alignment similarity of one pair."""
+        return float(self.similarities([(query, reference)])[0])
+
+    def reference_index(self, sequences: Sequence[str], codes: Optional[np.ndarray] = None,
+                        lengths: Optional[np.ndarray] = None) -> "AlignmentReferenceIndex":
+        """Reference index scoring queries with this aligner."""
+        return AlignmentReferenceIndex(sequences, self, codes, lengths)
+
+
+class AlignmentReferenceIndex(ReferenceIndex):
+    """Reference index that scores queries by local alignment instead of by position."""
+
+    def __init__(self, sequences: Sequence[str], aligner: Optional[LocalAligner] = None,
+                 codes: Optional[np.ndarray] = None, lengths: Optional[np.ndarray] = None):
+        """
+        Args:
+            sequences: Reference sequences
+            aligner: Aligner to score with; a default LocalAligner if omitted
+            codes: Already encoded, padded references
+            lengths: Reference lengths, required with codes
+        """
+        super().__init__(sequences, codes, lengths)
+        self.aligner = aligner or LocalAligner()
+
+    def similarities(self, query: str, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Alignment similarity of a query to every reference, or to the references in rows."""
+        references = self.sequences if rows is None else [self.sequences[row] for row in rows]
+        return self.aligner.similarities([(query, reference) for reference in references])
+
+    def similarity_blocks(self, queries: Sequence[str], query_chunk: int = 256, reference_chunk: int = 4096):
+        """Alignment similarity matrix tiles, in the order of ReferenceIndex.similarity_blocks."""
+        for r_start in range(0, len(self), reference_chunk):
+            references = self.sequences[r_start:r_start + reference_chunk]
+            for q_start in range(0, len(queries), query_chunk):
+                chunk = queries[q_start:q_start + query_chunk]
+                pairs = [(query, reference) for query in chunk for reference in references]
+                yield q_start, r_start, self.aligner.similarities(pairs).reshape(len(chunk), len(references))
@@ -0,0 +1,277 @@
+"""
+Offline model snapshots for fast cold starts.
+
+``from_pretrained("nferruz/ProtGPT2")`` resolves hub metadata and
+deserializes the full checkpoint every time a generator is constructed.
+A snapshot stores the weights as safetensors next to the tokenizer files,
+and a manifest records the local path, file hashes and tokenizer files per
+model. When a manifest entry exists, the generators load straight from the
+snapshot: the model skeleton is built on the meta device and its
+parameters are assigned from memory-mapped safetensors, with no hub
+resolution and no random weight initialisation.
+
+Usage:
+    python -m modules.model_cache snapshot --model nferruz/ProtGPT2
+    python -m modules.model_cache verify
+    python -m modules.model_cache benchmark --model nferruz/ProtGPT2
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import sys
+from datetime import datetime
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MANIFEST = 'models/manifest.json'
+MANIFEST_ENV = 'HEALDETTE_MODEL_MANIFEST'
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def manifest_path(path: Optional[str] = None) -> str:
+    """Resolve the manifest location from the argument, the environment or the default."""
+    return path or os.environ.get(MANIFEST_ENV, DEFAULT_MANIFEST)
+
+
+def load_manifest(path: Optional[str] = None) -> Dict:
+    """Load the model manifest, or return an empty one if it does not exist."""
+    path = manifest_path(path)
+    if not os.path.exists(path):
+        return {'models': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def manifest_entry(model_name: str, path: Optional[str] = None) -> Optional[Dict]:
+    """
+    Return the snapshot entry for a model with its directory resolved.
+
+    Args:
+        model_name: Hub name the generators load, e.g. 'nferruz/ProtGPT2'
+        path: Manifest file; defaults to HEALDETTE_MODEL_MANIFEST or models/manifest.json
+
+    Returns:
+        Manifest entry, or None if the model has no usable snapshot
+    """
+    path = manifest_path(path)
+    entry = load_manifest(path)['models'].get(model_name)
+    if entry is None:
+        return None
+    entry = dict(entry)
+    entry['path'] = os.path.join(os.path.dirname(os.path.abspath(path)), entry['path'])
+    if not os.path.isdir(entry['path']):
+        logger.warning(f"Snapshot directory {entry['path']} for {model_name} is missing")
+        return None
+    return entry
+
+
+def snapshot(model_name: str, output_dir: Optional[str] = None, path: Optional[str] = None) -> Dict:
+    """
+    Save a model and tokenizer as a local safetensors snapshot and record it.
+
+    Args:
+        model_name: Hub name or local path of the model
+        output_dir: Snapshot directory; defaults to models/<model name>
+        path: Manifest file to update
+
+    Returns:
+        The manifest entry written for the model
+    """
+    from transformers import AutoModelForCausalLM, AutoTokenizer, __version__
+
+    path = manifest_path(path)
+    manifest_dir = os.path.dirname(os.path.abspath(path))
+    output_dir = output_dir or os.path.join(manifest_dir, model_name.replace('/', '--'))
+    os.makedirs(output_dir, exist_ok=True)
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForCausalLM.from_pretrained(model_name)
+    model.save_pretrained(output_dir, safe_serialization=True)
+    tokenizer_files = tokenizer.save_pretrained(output_dir)
+
+    weights = sorted(name for name in os.listdir(output_dir) if name.endswith('.safetensors'))
+    entry = {
+        'path': os.path.relpath(os.path.abspath(output_dir), manifest_dir),
+        'weights': {name: _sha256(os.path.join(output_dir, name)) for name in weights},
+        'config': 'config.json',
+        'tokenizer_files': {
+            os.path.basename(name): _sha256(name)
+            for name in tokenizer_files if os.path.isfile(name)
+        },
+        'size_bytes': sum(os.path.getsize(os.path.join(output_dir, name)) for name in weights),
+        'transformers_version': __version__,
+        'created_at': datetime.utcnow().isoformat()
+    }
+
+    manifest = load_manifest(path)
+    manifest['models'][model_name] = entry
+    os.makedirs(manifest_dir, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return entry
+
+
+def verify_snapshot(model_name: str, path: Optional[str] = None) -> List[str]:
+    """
+    Check snapshot files against the hashes recorded in the manifest.
+
+    Returns:
+        Names of missing or modified files; empty if the snapshot is intact
+    """
+    entry = manifest_entry(model_name, path)
+    if entry is None:
+        return [model_name]
+    problems = []
+    for name, digest in {**entry['weights'], **entry['tokenizer_files']}.items():
+        file_path = os.path.join(entry['path'], name)
+        if not os.path.exists(file_path) or _sha256(file_path) != digest:
+            problems.append(name)
+    return problems
+
+
+def load_tokenizer(model_name: str, path: Optional[str] = None):
+    """Load a tokenizer from its snapshot if one is recorded, otherwise from the hub."""
+    from transformers import AutoTokenizer
+
+    entry = manifest_entry(model_name, path)
+    if entry is None:
+        return AutoTokenizer.from_pretrained(model_name)
+    return AutoTokenizer.from_pretrained(entry['path'], local_files_only=True)
+
+
+def load_model(model_name: str, path: Optional[str] = None):
+    """
+    Load a causal LM from its snapshot if one is recorded, otherwise from the hub.
+
+    Snapshot weights are memory-mapped and assigned to a model skeleton
+    built on the meta device. If some tensors are not covered by the
+    checkpoint, loading falls back to ``from_pretrained`` on the snapshot
+    directory, which still skips hub resolution.
+
+    Args:
+        model_name: Hub name the generators load, e.g. 'nferruz/ProtGPT2'
+        path: Manifest file
+
+    Returns:
+        Model in eval mode
+    """
+    import torch
+    from safetensors.torch import load_file
+    from transformers import AutoConfig, AutoModelForCausalLM
+
+    entry = manifest_entry(model_name, path)
+    if entry is None:
+        return AutoModelForCausalLM.from_pretrained(model_name)
+
+    config = AutoConfig.from_pretrained(entry['path'], local_files_only=True)
+    with torch.device('meta'):
+        model = AutoModelForCausalLM.from_config(config)
+
+    state_dict = {}
+    for name in entry['weights']:
+        state_dict.update(load_file(os.path.join(entry['path'], name)))
+    model.load_state_dict(state_dict, strict=False, assign=True)
+    model.tie_weights()
+
+    if any(tensor.is_meta for tensor in list(model.parameters()) + list(model.buffers())):
+        logger.info(f"Snapshot of {model_name} does not cover every tensor; using from_pretrained")
+        model = AutoModelForCausalLM.from_pretrained(entry['path'], local_files_only=True)
+    return model.eval()
+
+
+_COLD_START_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from modules.model_cache import load_model, load_tokenizer
+from transformers import AutoModelForCausalLM, AutoTokenizer
+imported = time.perf_counter()
+if sys.argv[1] == 'snapshot':
+    tokenizer, model = load_tokenizer(sys.argv[2], sys.argv[3]), load_model(sys.argv[2], sys.argv[3])
+else:
+    tokenizer = AutoTokenizer.from_pretrained(sys.argv[2])
+    model = AutoModelForCausalLM.from_pretrained(sys.argv[2])
+loaded = time.perf_counter()
+print(json.dumps({'import_seconds': imported - start, 'load_seconds': loaded - imported,
+                  'total_seconds': loaded - start}))
+"""
+
+
+def benchmark(model_name: str, path: Optional[str] = None, repeats: int = 3) -> Dict:
+    """
+    Measure cold start of from_pretrained against snapshot loading.
+
+    Every measurement runs in a fresh interpreter so imports and model
+    loading are timed as a short-lived batch job would see them.
+
+    Args:
+        model_name: Model with a snapshot recorded in the manifest
+        path: Manifest file
+        repeats: Cold starts per mode
+
+    Returns:
+        Mean import, load and total seconds for each mode
+    """
+    path = manifest_path(path)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = {}
+    for mode in ('from_pretrained', 'snapshot'):
+        runs = []
+        for _ in range(repeats):
+            output = subprocess.run(
+                [sys.executable, '-c', _COLD_START_SCRIPT, mode, model_name, path],
+                cwd=root, capture_output=True, text=True, check=True
+            ).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+        results[mode] = {
+            key: round(sum(run[key] for run in runs) / len(runs), 3) for key in runs[0]
+        }
+    return results
+
+
+def main():
+    """Create, verify or benchmark model snapshots."""
+    parser = argparse.ArgumentParser(description='Offline model snapshots for fast cold starts')
+    parser.add_argument('--manifest', default=None, help='Manifest file (default: models/manifest.json)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    snapshot_parser = subparsers.add_parser('snapshot', help='Snapshot a model into the manifest')
+    snapshot_parser.add_argument('--model', default='nferruz/ProtGPT2', help='Model name or path')
+    snapshot_parser.add_argument('--output', default=None, help='Snapshot directory')
+
+    verify_parser = subparsers.add_parser('verify', help='Check snapshot file hashes')
+    verify_parser.add_argument('--model', default='nferruz/ProtGPT2', help='Model name')
+
+    bench_parser = subparsers.add_parser('benchmark', help='Measure cold-start time')
+    bench_parser.add_argument('--model', default='nferruz/ProtGPT2', help='Model name')
+    bench_parser.add_argument('--repeats', type=int, default=3, help='Cold starts per mode')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == 'snapshot':
+        entry = snapshot(args.model, args.output, args.manifest)
+        logger.info(f"Snapshot of {args.model} written to {entry['path']}")
+    elif args.command == 'verify':
+        problems = verify_snapshot(args.model, args.manifest)
+        if problems:
+            logger.error(f"Snapshot of {args.model} is missing or modified: {', '.join(problems)}")
+            sys.exit(1)
+        logger.info(f"Snapshot of {args.model} matches the manifest")
+    else:
+        print(json.dumps(benchmark(args.model, args.manifest, args.repeats), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,478 @@
+"""
+ONNX Runtime inference engine for ProtGPT2.
+
+ProtGPT2 is exported once to an ONNX decoder graph that takes and returns
+past key/values, and sampling is driven by a NumPy loop that reproduces the
+Hugging Face logits processors used by the generators (repetition penalty,
+no-repeat n-gram, minimum length, temperature, top-k and top-p). The prompt
+is encoded once and its key/values are shared by every sampled row, and
+rows that finish early are dropped from the batch instead of being padded
+through the remaining decoding steps.
+
+Usage:
+    python -m modules.onnx_engine export --output models/protgpt2-onnx
+    python -m modules.onnx_engine benchmark --model-dir models/protgpt2-onnx
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_DIR = 'models/protgpt2-onnx'
+MODEL_FILE = 'model.onnx'
+METADATA_FILE = 'engine.json'
+
+
+class _DecoderWithPast(torch.nn.Module):
+    """Decoder wrapper with flat past/present key-value tensors for export."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+        self.num_layers = model.config.n_layer
+
+    def forward(self, input_ids, attention_mask, position_ids, *past):
+        from transformers import DynamicCache
+
+        cache = DynamicCache()
+        for layer in range(self.num_layers):
+            cache.update(past[2 * layer], past[2 * layer + 1], layer)
+
+        outputs = self.model(
+            input_ids=input_ids, attention_mask=attention_mask, position_ids=position_ids,
+            past_key_values=cache, use_cache=True
+        )
+
+        present = []
+        for layer in range(self.num_layers):
+            if hasattr(outputs.past_key_values, 'layers'):
+                cache_layer = outputs.past_key_values.layers[layer]
+                present += [cache_layer.keys, cache_layer.values]
+            else:
+                present += [outputs.past_key_values.key_cache[layer],
+                            outputs.past_key_values.value_cache[layer]]
+        return (outputs.logits, *present)
+
+
+def _past_names(num_layers: int, prefix: str) -> List[str]:
+    return [f"{prefix}_{kind}_{layer}" for layer in range(num_layers) for kind in ('key', 'value')]
+
+
+def export_onnx(model, output_dir: str = DEFAULT_MODEL_DIR, opset: int = 18) -> str:
+    """
+    Export a GPT-2 style causal LM to an ONNX decoder with past key/values.
+
+    Args:
+        model: Hugging Face GPT-2 model (e.g. ProtGPT2) in eval mode
+        output_dir: Directory for the ONNX graph, weights and metadata
+        opset: ONNX opset version
+
+    Returns:
+        Path of the exported ONNX model
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    config = model.config
+    num_layers, num_heads = config.n_layer, config.n_head
+    head_dim = config.n_embd // num_heads
+
+    # Example inputs; every dimension except heads and head_dim is dynamic
+    batch, past_length, length = 2, 3, 4
+    input_ids = torch.zeros((batch, length), dtype=torch.long)
+    attention_mask = torch.ones((batch, past_length + length), dtype=torch.long)
+    position_ids = torch.arange(past_length, past_length + length).expand(batch, length)
+    past = tuple(torch.zeros((batch, num_heads, past_length, head_dim)) for _ in range(2 * num_layers))
+
+    batch_dim = torch.export.Dim('batch')
+    length_dim = torch.export.Dim('length')
+    past_dim = torch.export.Dim('past_length')
+    dynamic_shapes = {
+        'input_ids': {0: batch_dim, 1: length_dim},
+        'attention_mask': {0: batch_dim, 1: torch.export.Dim.AUTO},
+        'position_ids': {0: batch_dim, 1: length_dim},
+        'past': tuple({0: batch_dim, 2: past_dim} for _ in range(2 * num_layers))
+    }
+
+    path = os.path.join(output_dir, MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            _DecoderWithPast(model.eval()), (input_ids, attention_mask, position_ids, *past), path,
+            input_names=['input_ids', 'attention_mask', 'position_ids', *_past_names(num_layers, 'past')],
+            output_names=['logits', *_past_names(num_layers, 'present')],
+            dynamic_shapes=dynamic_shapes, opset_version=opset, dynamo=True, external_data=True
+        )
+
+    with open(os.path.join(output_dir, METADATA_FILE), 'w') as f:
+        json.dump({
+            'num_layers': num_layers,
+            'num_heads': num_heads,
+            'head_dim': head_dim,
+            'vocab_size': config.vocab_size,
+            'eos_token_id': config.eos_token_id,
+            'source': getattr(config, '_name_or_path', '')
+        }, f, indent=2)
+    return path
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(shifted)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+def apply_repetition_penalty(logits: np.ndarray, sequences: np.ndarray, penalty: float) -> np.ndarray:
+    """Penalize tokens already present in each row (Hugging Face semantics)."""
+    scores = np.take_along_axis(logits, sequences, axis=1)
+    scores = np.where(scores < 0, scores * penalty, scores / penalty)
+    np.put_along_axis(logits, sequences, scores, axis=1)
+    return logits
+
+
+def apply_top_k(logits: np.ndarray, top_k: int) -> np.ndarray:
+    """Keep only the top_k highest scoring tokens per row."""
+    top_k = min(top_k, logits.shape[-1])
+    kth = np.partition(logits, -top_k, axis=-1)[:, -top_k, None]
+    logits[logits < kth] = -np.inf
+    return logits
+
+
+def apply_top_p(logits: np.ndarray, top_p: float) -> np.ndarray:
+    """Keep the smallest set of tokens whose probability mass exceeds top_p."""
+    finite = np.isfinite(logits)
+    counts = finite.sum(axis=-1)
+    width = int(counts.max())
+    if width < logits.shape[-1] // 2:
+        # After top-k only a few tokens are left; sort just those, in index order for stable ties,
+        # padding short rows with one of their -inf tokens
+        candidates = np.repeat(np.argmin(finite, axis=-1)[:, None], width, axis=1)
+        rows, cols = np.nonzero(finite)
+        candidates[rows, np.arange(len(rows)) - (np.cumsum(counts) - counts)[rows]] = cols
+        kept = apply_top_p(np.take_along_axis(logits, candidates, axis=-1), top_p)
+        np.put_along_axis(logits, candidates, kept, axis=-1)
+        return logits
+    order = np.argsort(logits, axis=-1, kind='stable')
+    cumulative = np.cumsum(_softmax(np.take_along_axis(logits, order, axis=-1)), axis=-1)
+    remove = cumulative <= (1 - top_p)
+    remove[:, -1] = False  # Always keep the most likely token
+    np.put_along_axis(logits, order, np.where(remove, -np.inf, np.take_along_axis(logits, order, -1)), -1)
+    return logits
+
+
+class NoRepeatNgram:
+    """Incrementally tracked n-grams used to ban repeats, as in no_repeat_ngram_size."""
+
+    def __init__(self, size: int, sequences: np.ndarray):
+        self.size = size
+        self.seen = [dict() for _ in range(len(sequences))]
+        for row, tokens in enumerate(sequences.tolist()):
+            for end in range(size, len(tokens) + 1):
+                self._add(row, tokens[end - size:end])
+
+    def _add(self, row: int, ngram: List[int]):
+        self.seen[row].setdefault(tuple(ngram[:-1]), set()).add(ngram[-1])
+
+    def update(self, rows: np.ndarray, sequences: np.ndarray):
+        """Record the n-gram ending at the newest token of the given rows."""
+        if sequences.shape[1] < self.size:
+            return
+        for row, tokens in zip(rows.tolist(), sequences[:, -self.size:].tolist()):
+            self._add(row, tokens)
+
+    def apply(self, logits: np.ndarray, rows: np.ndarray, sequences: np.ndarray) -> np.ndarray:
+        """Ban tokens that would complete an n-gram already present in the row."""
+        if sequences.shape[1] + 1 < self.size:
+            return logits
+        prefixes = sequences[:, sequences.shape[1] - self.size + 1:].tolist()
+        for i, (row, prefix) in enumerate(zip(rows.tolist(), prefixes)):
+            banned = self.seen[row].get(tuple(prefix))
+            if banned:
+                logits[i, list(banned)] = -np.inf
+        return logits
+
+
+def process_logits(logits: np.ndarray, sequences: np.ndarray, temperature: float = 1.0,
+                   top_k: int = 0, top_p: float = 1.0, repetition_penalty: float = 1.0,
+                   ngram_ban: Optional[NoRepeatNgram] = None, rows: Optional[np.ndarray] = None,
+                   min_length: int = 0, eos_token_id: Optional[int] = None,
+                   suppress_tokens: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Apply the sampling logits processors in Hugging Face order.
+
+    Args:
+        logits: Next-token scores of shape (rows, vocab)
+        sequences: Token ids generated so far, prompt included
+        temperature: Softmax temperature
+        top_k: Number of highest scoring tokens kept; 0 disables
+        top_p: Nucleus probability mass kept; 1.0 disables
+        repetition_penalty: Penalty for tokens already in the sequence
+        ngram_ban: No-repeat n-gram tracker for the batch
+        rows: Batch row index of every sequence, used by ngram_ban
+        min_length: Total length below which eos is suppressed
+        eos_token_id: End of sequence token id
+        suppress_tokens: Token ids that are never sampled
+
+    Returns:
+        Processed logits; -inf marks tokens that can not be sampled
+    """
+    logits = logits.astype(np.float32, copy=True)
+    if repetition_penalty != 1.0:
+        logits = apply_repetition_penalty(logits, sequences, repetition_penalty)
+    if ngram_ban is not None:
+        logits = ngram_ban.apply(logits, rows if rows is not None else np.arange(len(logits)), sequences)
+    if eos_token_id is not None and sequences.shape[1] < min_length:
+        logits[:, eos_token_id] = -np.inf
+    if suppress_tokens is not None and len(suppress_tokens):
+        logits[:, suppress_tokens] = -np.inf
+    if temperature != 1.0:
+        logits = logits / temperature
+    if top_k:
+        logits = apply_top_k(logits, top_k)
+    if top_p < 1.0:
+        logits = apply_top_p(logits, top_p)
+    return logits
+
+
+class OnnxGenerationEngine:
+    """Sample ProtGPT2 continuations through ONNX Runtime."""
+
+    def __init__(self, model_dir: str = DEFAULT_MODEL_DIR, num_threads: Optional[int] = None):
+        """
+        Args:
+            model_dir: Directory created by export_onnx
+            num_threads: Intra-op threads for ONNX Runtime; defaults to all cores
+
+        Raises:
+            ImportError: If onnxruntime is not installed
+        """
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError("The ONNX engine requires onnxruntime (pip install onnxruntime)") from e
+
+        with open(os.path.join(model_dir, METADATA_FILE)) as f:
+            self.metadata = json.load(f)
+        self.num_layers = self.metadata['num_layers']
+
+        options = onnxruntime.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, MODEL_FILE), options, providers=['CPUExecutionProvider']
+        )
+        self._past_names = _past_names(self.num_layers, 'past')
+
+    def forward(self, input_ids: np.ndarray, past: List[np.ndarray], past_length: int):
+        """
+        Run the decoder on new tokens.
+
+        Args:
+            input_ids: New token ids of shape (rows, length)
+            past: Flat list of per-layer key and value arrays
+            past_length: Number of tokens already in past
+
+        Returns:
+            Tuple of logits (rows, length, vocab) and the updated past
+        """
+        rows, length = input_ids.shape
+        feed = {
+            'input_ids': input_ids.astype(np.int64),
+            'attention_mask': np.ones((rows, past_length + length), dtype=np.int64),
+            'position_ids': np.broadcast_to(
+                np.arange(past_length, past_length + length, dtype=np.int64), (rows, length)
+            ).copy()
+        }
+        feed.update(zip(self._past_names, past))
+        logits, *present = self.session.run(None, feed)
+        return logits, present
+
+    def _empty_past(self) -> List[np.ndarray]:
+        shape = (1, self.metadata['num_heads'], 0, self.metadata['head_dim'])
+        return [np.zeros(shape, dtype=np.float32) for _ in range(2 * self.num_layers)]
+
+    def generate(self, input_ids, num_return_sequences: int = 1, max_new_tokens: Optional[int] = None,
+                 max_length: Optional[int] = None, min_length: int = 0, do_sample: bool = True,
+                 top_k: int = 50, top_p: float = 1.0, temperature: float = 1.0,
+                 repetition_penalty: float = 1.0, no_repeat_ngram_size: int = 0,
+                 pad_token_id: Optional[int] = None, eos_token_id: Optional[int] = None,
+                 max_residues: Optional[int] = None, residue_counts=None,
+                 suppress_tokens=None, **unused) -> np.ndarray:
+        """
+        Sample continuations of a single prompt.
+
+        Accepts the sampling arguments the generators pass to Hugging Face
+        ``generate``; beam-search-only arguments such as length_penalty are
+        ignored, as they are when sampling with PyTorch.
+
+        Args:
+            input_ids: Prompt token ids, shape (1, length) or (length,)
+            num_return_sequences: Number of sequences to sample
+            max_new_tokens: Maximum number of generated tokens
+            max_length: Maximum total length, used if max_new_tokens is not set
+            min_length: Total length below which eos is suppressed
+            do_sample: Sample if True, otherwise decode greedily
+            top_k: Top-k filtering; 0 disables
+            top_p: Nucleus filtering; 1.0 disables
+            temperature: Softmax temperature
+            repetition_penalty: Repetition penalty
+            no_repeat_ngram_size: Ban repeats of n-grams of this size; 0 disables
+            pad_token_id: Padding token for rows that finished early
+            eos_token_id: End of sequence token; defaults to the exported model's
+            max_residues: Stop a row once its generated tokens contain this many residues
+            residue_counts: Residues per token id, required with max_residues
+            suppress_tokens: Token ids that are never sampled
+
+        Returns:
+            Array of shape (num_return_sequences, length) with prompt and
+            generated tokens, padded with pad_token_id
+        """
+        prompt = np.asarray(input_ids, dtype=np.int64).reshape(1, -1)
+        prompt_length = prompt.shape[1]
+        if max_new_tokens is None:
+            max_new_tokens = (max_length or prompt_length + 20) - prompt_length
+        eos_token_id = eos_token_id if eos_token_id is not None else self.metadata['eos_token_id']
+        pad_token_id = pad_token_id if pad_token_id is not None else eos_token_id
+        if residue_counts is not None:
+            residue_counts = np.asarray(residue_counts)
+        if suppress_tokens is not None:
+            suppress_tokens = np.asarray(suppress_tokens, dtype=np.int64)
+
+        # Encode the prompt once and share its key/values across all rows
+        logits, past = self.forward(prompt, self._empty_past(), 0)
+        rows = num_return_sequences
+        past = [np.repeat(p, rows, axis=0) for p in past]
+        next_logits = np.repeat(logits[:, -1], rows, axis=0)
+
+        sequences = np.repeat(prompt, rows, axis=0)
+        active = np.arange(rows)
+        generated = np.full((rows, max_new_tokens), pad_token_id, dtype=np.int64)
+        residues = np.zeros(rows, dtype=np.int64)
+        ngram_ban = NoRepeatNgram(no_repeat_ngram_size, sequences) if no_repeat_ngram_size else None
+
+        for step in range(max_new_tokens):
+            scores = process_logits(
+                next_logits, sequences, temperature, top_k if do_sample else 0,
+                top_p if do_sample else 1.0, repetition_penalty, ngram_ban, active,
+                min_length, eos_token_id, suppress_tokens
+            )
+            if do_sample:
+                probs = _softmax(scores)
+                draws = np.random.random_sample((len(active), 1))
+                tokens = np.minimum((probs.cumsum(axis=-1) < draws).sum(axis=-1), probs.shape[-1] - 1)
+            else:
+                tokens = scores.argmax(axis=-1)
+
+            generated[active, step] = tokens
+            sequences = np.concatenate([sequences, tokens[:, None]], axis=1)
+            if ngram_ban is not None:
+                ngram_ban.update(active, sequences)
+
+            finished = tokens == eos_token_id
+            if max_residues is not None:
+                residues[active] += residue_counts[tokens]
+                finished |= residues[active] >= max_residues
+            if step == max_new_tokens - 1:
+                break
+
+            # Drop finished rows from the batch instead of decoding padding
+            keep = ~finished
+            if not keep.any():
+                break
+            if not keep.all():
+                active, sequences, tokens = active[keep], sequences[keep], tokens[keep]
+                past = [p[keep] for p in past]
+
+            logits, past = self.forward(tokens[:, None], past, sequences.shape[1] - 1)
+            next_logits = logits[:, -1]
+
+        # Trim trailing columns that only contain padding
+        used = max_new_tokens
+        while used > 0 and (generated[:, used - 1] == pad_token_id).all():
+            used -= 1
+        return np.concatenate([np.repeat(prompt, rows, axis=0), generated[:, :used]], axis=1)
+
+
+def benchmark(model_dir: str, model_name: str = 'nferruz/ProtGPT2', num_samples: int = 16,
+              max_new_tokens: int = 30, repeats: int = 3) -> Dict:
+    """
+    Compare CDR sampling throughput of the PyTorch and ONNX Runtime paths.
+
+    Args:
+        model_dir: Directory created by export_onnx
+        model_name: Hugging Face model for the PyTorch path
+        num_samples: Sequences sampled per call
+        max_new_tokens: Tokens generated per sequence
+        repeats: Timed calls per engine
+
+    Returns:
+        Generated tokens per second for each engine
+    """
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    from .generation_telemetry import generated_token_count
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForCausalLM.from_pretrained(model_name).eval()
+    engine = OnnxGenerationEngine(model_dir)
+    prompt = tokenizer("EVQLLESGGGLVQPGGSLRLSCAASGFTFS Target binding site: MVLSPADKTN <CDR>",
+                       return_tensors="pt")["input_ids"]
+    kwargs = dict(do_sample=True, top_k=20, top_p=0.85, temperature=0.6, max_new_tokens=max_new_tokens,
+                  no_repeat_ngram_size=2, repetition_penalty=1.5)
+    pad = tokenizer.eos_token_id
+
+    def torch_run():
+        with torch.no_grad():
+            return model.generate(prompt, num_return_sequences=num_samples, pad_token_id=pad, **kwargs)
+
+    def onnx_run():
+        return engine.generate(prompt.numpy(), num_samples, pad_token_id=pad, **kwargs)
+
+    results = {}
+    for name, run in (('torch', torch_run), ('onnx', onnx_run)):
+        run()  # Warm up
+        tokens, seconds = 0, 0.0
+        for _ in range(repeats):
+            start = time.perf_counter()
+            outputs = run()
+            seconds += time.perf_counter() - start
+            tokens += generated_token_count(outputs, prompt.shape[1], pad)
+        results[name] = {'tokens_per_second': round(tokens / seconds, 2), 'seconds': round(seconds, 3)}
+    return results
+
+
+def main():
+    """Export ProtGPT2 to ONNX or benchmark the ONNX engine."""
+    parser = argparse.ArgumentParser(description='ONNX Runtime engine for ProtGPT2')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help='Export ProtGPT2 to ONNX')
+    export_parser.add_argument('--model', default='nferruz/ProtGPT2', help='Model name or path')
+    export_parser.add_argument('--output', default=DEFAULT_MODEL_DIR, help='Output directory')
+    export_parser.add_argument('--opset', type=int, default=18, help='ONNX opset version')
+
+    bench_parser = subparsers.add_parser('benchmark', help='Compare PyTorch and ONNX throughput')
+    bench_parser.add_argument('--model', default='nferruz/ProtGPT2', help='Model name or path')
+    bench_parser.add_argument('--model-dir', default=DEFAULT_MODEL_DIR, help='Exported ONNX model')
+    bench_parser.add_argument('--num-samples', type=int, default=16, help='Sequences per call')
+    bench_parser.add_argument('--max-new-tokens', type=int, default=30, help='Tokens per sequence')
+    bench_parser.add_argument('--repeats', type=int, default=3, help='Timed calls per engine')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == 'export':
+        from transformers import AutoModelForCausalLM
+        path = export_onnx(AutoModelForCausalLM.from_pretrained(args.model), args.output, args.opset)
+        logger.info(f"Exported ONNX model to {path}")
+    else:
+        results = benchmark(args.model_dir, args.model, args.num_samples, args.max_new_tokens, args.repeats)
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
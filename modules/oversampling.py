@@ -0,0 +1,170 @@
+"""
+Adaptive oversampling control for CDR generation.
+
+Instead of always sampling a fixed multiple of the CDRs needed, the
+controller tracks how many samples each germline template gets past the
+quality filters and sizes every ``num_return_sequences`` request so the
+target count is reached with the smallest reasonable oversampling. It also
+watches binder-level yield and signals when the marginal yield of further
+attempts has collapsed.
+"""
+
+import copy
+import math
+from collections import deque
+from typing import Dict, Optional
+
+
+class AdaptiveOversampler:
+    """Size sampling requests from observed per-template acceptance rates."""
+
+    def __init__(self, prior_rate: float = 0.5, prior_weight: float = 4.0, confidence: float = 0.75,
+                 max_factor: int = 6, max_attempt_factor: int = 10, window: int = 10,
+                 min_marginal_yield: float = 0.05):
+        """
+        Args:
+            prior_rate: Assumed CDR acceptance rate before any observations
+            prior_weight: Pseudo-sample count given to the prior rate
+            confidence: Probability of reaching the target count that sample
+                sizes are chosen for
+            max_factor: Upper bound on samples drawn per CDR needed
+            max_attempt_factor: Hard cap on binder attempts per requested binder
+            window: Number of recent binder attempts used to measure marginal yield
+            min_marginal_yield: Windowed binder acceptance rate below which
+                generation is considered to have collapsed
+        """
+        self.prior_rate = prior_rate
+        self.prior_weight = prior_weight
+        self.confidence = confidence
+        self.max_factor = max_factor
+        self.max_attempt_factor = max_attempt_factor
+        self.window = window
+        self.min_marginal_yield = min_marginal_yield
+
+        self.templates: Dict[str, Dict] = {}
+        self._recent = deque(maxlen=window)
+        # Template counts a fork started from, subtracted when it is merged back
+        self._base: Dict[str, Dict] = {}
+
+    def _template(self, key: str) -> Dict:
+        return self.templates.setdefault(key, {"sampled": 0, "accepted": 0, "rejections": {}})
+
+    def acceptance_rate(self, key: str) -> float:
+        """Posterior mean CDR acceptance rate for a template."""
+        counts = self.templates.get(key, {"sampled": 0, "accepted": 0})
+        return ((counts["accepted"] + self.prior_rate * self.prior_weight) /
+                (counts["sampled"] + self.prior_weight))
+
+    def num_samples(self, key: str, target: int) -> int:
+        """
+        Number of samples to request so that ``target`` pass the filters.
+
+        Picks the smallest n for which a Binomial(n, p) draw reaches the
+        target with at least the configured confidence, where p is the
+        template's estimated acceptance rate.
+
+        Args:
+            key: Template name
+            target: Number of accepted CDRs needed
+
+        Returns:
+            Number of sequences to sample
+        """
+        p = min(max(self.acceptance_rate(key), 1e-3), 1.0)
+        upper = target * self.max_factor
+        for n in range(target, upper + 1):
+            # P(X >= target) for X ~ Binomial(n, p)
+            reach = 1.0 - sum(math.comb(n, k) * p ** k * (1 - p) ** (n - k) for k in range(target))
+            if reach >= self.confidence:
+                return n
+        return upper
+
+    def record(self, key: str, sampled: int, accepted: int, rejections: Optional[Dict[str, int]] = None):
+        """
+        Record the outcome of one sampling request.
+
+        Args:
+            key: Template name
+            sampled: Number of samples that went through the filters
+            accepted: Number of samples that passed every filter
+            rejections: Rejected sample counts per filter name
+        """
+        counts = self._template(key)
+        counts["sampled"] += sampled
+        counts["accepted"] += accepted
+        for reason, count in (rejections or {}).items():
+            counts["rejections"][reason] = counts["rejections"].get(reason, 0) + count
+
+    def reset(self):
+        """Forget all observed acceptance rates and binder attempts."""
+        self.templates.clear()
+        self._recent.clear()
+
+    def state(self) -> Dict:
+        """Per-template counts and recent binder outcomes, for checkpointing."""
+        return {
+            "templates": {
+                key: {**counts, "rejections": dict(counts["rejections"])}
+                for key, counts in self.templates.items()
+            },
+            "recent": list(self._recent)
+        }
+
+    def load_state(self, state: Dict):
+        """Restore counts and recent binder outcomes saved with state()."""
+        self.reset()
+        for key, counts in state.get("templates", {}).items():
+            self.templates[key] = {**counts, "rejections": dict(counts["rejections"])}
+        self._recent.extend(state.get("recent", []))
+
+    def fork(self) -> "AdaptiveOversampler":
+        """
+        Independent controller for one concurrent run.
+
+        The fork starts from this controller's acceptance rates with an empty
+        yield window; merge() adds what it observed back here.
+        """
+        fork = copy.deepcopy(self)
+        fork._recent.clear()
+        fork._base = fork.state()["templates"]
+        return fork
+
+    def merge(self, fork: "AdaptiveOversampler"):
+        """Add the sampling counts a fork recorded since fork() to this controller."""
+        for key, counts in fork.templates.items():
+            start = fork._base.get(key, {"sampled": 0, "accepted": 0, "rejections": {}})
+            self.record(key, counts["sampled"] - start["sampled"], counts["accepted"] - start["accepted"], {
+                reason: count - start["rejections"].get(reason, 0)
+                for reason, count in counts["rejections"].items()
+                if count != start["rejections"].get(reason, 0)
+            })
+
+    def start_run(self):
+        """Reset binder-level yield tracking at the start of a generation run."""
+        self._recent.clear()
+
+    def max_attempts(self, num_candidates: int) -> int:
+        """Hard cap on binder attempts for a run."""
+        return num_candidates * self.max_attempt_factor
+
+    def record_attempt(self, accepted: bool):
+        """Record whether a binder attempt produced an accepted binder."""
+        self._recent.append(1 if accepted else 0)
+
+    def yield_collapsed(self) -> bool:
+        """True once the recent binder acceptance rate drops below the floor."""
+        if len(self._recent) < self.window:
+            return False
+        return sum(self._recent) / len(self._recent) < self.min_marginal_yield
+
+    def summary(self) -> Dict:
+        """Per-template sampling counts, acceptance rates and rejections per filter."""
+        return {
+            key: {
+                "sampled": counts["sampled"],
+                "accepted": counts["accepted"],
+                "acceptance_rate": round(self.acceptance_rate(key), 3),
+                "rejections": dict(counts["rejections"])
+            }
+            for key, counts in self.templates.items()
+        }
@@ -0,0 +1,182 @@
+"""
+Reproducible multi-process binder generation.
+
+The candidate quota is split into fixed-size shards. Every shard gets its
+own seed derived from a master seed, reseeds Python, NumPy and torch from
+it and runs on a freshly reset generator, so its output depends only on the
+master seed and the shard index. Shards are distributed over a process
+pool and merged in shard order, which makes a run with N workers produce
+the same design set as a single-process run with the same master seed.
+"""
+
+import argparse
+import importlib
+import json
+import logging
+import multiprocessing
+import random
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+# Generator instance owned by each pool worker process
+_WORKER_GENERATOR = None
+
+
+def derive_seeds(master_seed: int, num_shards: int) -> List[int]:
+    """
+    Derive independent per-shard seeds from a master seed.
+
+    Args:
+        master_seed: Seed of the whole run
+        num_shards: Number of seeds to derive
+
+    Returns:
+        One 32-bit seed per shard; the first k seeds do not depend on num_shards
+    """
+    children = np.random.SeedSequence(master_seed).spawn(num_shards)
+    return [int(child.generate_state(1)[0]) for child in children]
+
+
+def seed_everything(seed: int):
+    """Seed Python, NumPy and torch random number generators."""
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+    if torch.cuda.is_available():
+        torch.cuda.manual_seed_all(seed)
+
+
+def shard_quotas(num_candidates: int, shard_size: int) -> List[int]:
+    """Split a candidate quota into shards of at most shard_size candidates."""
+    full, rest = divmod(num_candidates, shard_size)
+    return [shard_size] * full + ([rest] if rest else [])
+
+
+def load_generator(kind: str):
+    """Instantiate the 'original' or 'revised' antibody generator, or a 'module:factory' one."""
+    if ':' in kind:
+        module, factory = kind.split(':', 1)
+        return getattr(importlib.import_module(module), factory)()
+    if kind == 'revised':
+        from .revised.antibody_generator import AntibodyGenerator
+    elif kind == 'original':
+        from .generate_binders import AntibodyGenerator
+    else:
+        raise ValueError(f"Unknown generator kind: {kind}")
+    return AntibodyGenerator()
+
+
+def run_shard(generator, fusion_context: Dict, quota: int, seed: int) -> Dict:
+    """
+    Generate one shard of candidates from a clean, seeded state.
+
+    Args:
+        generator: Antibody generator to run
+        fusion_context: Fusion context with the target's cleaned_sequence
+        quota: Number of candidates requested from this shard
+        seed: Shard seed
+
+    Returns:
+        The generator's generate_binders result for the shard
+    """
+    seed_everything(seed)
+    generator.oversampler.reset()
+    return generator.generate_binders(fusion_context, quota)
+
+
+def _init_worker(kind: str):
+    global _WORKER_GENERATOR
+    _WORKER_GENERATOR = load_generator(kind)
+
+
+def _run_worker_shard(args: Tuple[Dict, int, int]) -> Dict:
+    fusion_context, quota, seed = args
+    return run_shard(_WORKER_GENERATOR, fusion_context, quota, seed)
+
+
+def generate_binders_parallel(fusion_context: Dict, num_candidates: int = 10, workers: int = 1,
+                              seed: int = 42, kind: str = 'original', shard_size: int = 2,
+                              generator=None) -> Dict:
+    """
+    Generate candidates across a process pool with reproducible results.
+
+    Args:
+        fusion_context: Fusion context with the target's cleaned_sequence
+        num_candidates: Total number of candidates requested
+        workers: Number of worker processes; 1 runs all shards in this process
+        seed: Master seed; together with shard_size it fully determines the output
+        kind: Generator implementation, 'original' or 'revised'
+        shard_size: Candidates per shard
+        generator: Generator to use for single-process runs instead of loading one
+
+    Returns:
+        Dictionary with generated_binders in shard order and aggregated stats
+    """
+    quotas = shard_quotas(num_candidates, shard_size)
+    seeds = derive_seeds(seed, len(quotas))
+    tasks = [(fusion_context, quota, shard_seed) for quota, shard_seed in zip(quotas, seeds)]
+
+    if workers <= 1:
+        generator = generator if generator is not None else load_generator(kind)
+        results = [run_shard(generator, *task) for task in tasks]
+    else:
+        # Spawned workers avoid inheriting torch thread pools from the parent
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_worker, initargs=(kind,)) as pool:
+            results = list(pool.map(_run_worker_shard, tasks))
+
+    binders = [binder for result in results for binder in result["generated_binders"]]
+    attempts = sum(result["stats"]["attempts"] for result in results)
+    return {
+        "generated_binders": binders,
+        "stats": {
+            "attempts": attempts,
+            "success_rate": len(binders) / attempts if attempts > 0 else 0,
+            "seed": seed,
+            "workers": workers,
+            "shards": [
+                {"seed": shard_seed, "quota": quota, "accepted": len(result["generated_binders"]),
+                 "attempts": result["stats"]["attempts"]}
+                for quota, shard_seed, result in zip(quotas, seeds, results)
+            ]
+        }
+    }
+
+
+def main():
+    """Run reproducible parallel generation from the command line."""
+    parser = argparse.ArgumentParser(description='Generate binders across a process pool')
+    parser.add_argument('sequence', help='Target amino acid sequence')
+    parser.add_argument('--num-candidates', type=int, default=10, help='Number of candidates')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes')
+    parser.add_argument('--seed', type=int, default=42, help='Master seed')
+    parser.add_argument('--shard-size', type=int, default=2, help='Candidates per shard')
+    parser.add_argument('--generator', choices=['original', 'revised'], default='original',
+                        help='Generator implementation to run')
+    parser.add_argument('--output', help='Write the result JSON to this file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    result = generate_binders_parallel(
+        {'cleaned_sequence': args.sequence}, args.num_candidates, args.workers,
+        args.seed, args.generator, args.shard_size
+    )
+    logger.info(f"Generated {len(result['generated_binders'])} binders in "
+                f"{result['stats']['attempts']} attempts")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    else:
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
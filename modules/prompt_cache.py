@@ -0,0 +1,109 @@
+"""
+Key/value cache reuse for template-conditioned generation prompts.
+
+Every CDR prompt starts with a long germline framework prefix followed by a
+short target context. The prefix only depends on the template, so its
+attention keys and values are computed once per template and reused for
+every subsequent generation attempt.
+"""
+
+import copy
+from typing import Dict, Tuple
+
+import torch
+from transformers import DynamicCache
+
+
+class PromptPrefixCache:
+    """
+    Per-template cache of ``past_key_values`` for prompt prefixes.
+
+    Entries are keyed by template name. The cache is cleared whenever it is
+    used with a different model instance, and an entry is rebuilt when the
+    prefix text registered under a template name changes.
+    """
+
+    def __init__(self):
+        """Initialize an empty prefix cache."""
+        self._model = None
+        self._entries: Dict[str, Tuple[str, torch.Tensor, DynamicCache]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self):
+        """Drop all cached prefixes."""
+        self._entries.clear()
+        self._model = None
+
+    def _encode_prefix(self, model, prefix_ids: torch.Tensor) -> DynamicCache:
+        """Run the model over the prefix once and return its key/value cache."""
+        with torch.no_grad():
+            outputs = model(
+                prefix_ids.to(model.device),
+                past_key_values=DynamicCache(),
+                use_cache=True
+            )
+        return outputs.past_key_values
+
+    def get(self, model, tokenizer, template_name: str, prefix: str) -> Tuple[torch.Tensor, DynamicCache]:
+        """
+        Return the token ids and key/value cache for a template prefix.
+
+        Args:
+            model: Causal language model the cache belongs to
+            tokenizer: Tokenizer used to encode the prefix
+            template_name: Germline template name used as the cache key
+            prefix: Prompt prefix text for the template
+
+        Returns:
+            Tuple of (prefix token ids of shape (1, n), cached past_key_values)
+        """
+        if model is not self._model:
+            self._entries.clear()
+            self._model = model
+
+        entry = self._entries.get(template_name)
+        if entry is None or entry[0] != prefix:
+            prefix_ids = tokenizer(prefix, return_tensors="pt")["input_ids"]
+            entry = (prefix, prefix_ids, self._encode_prefix(model, prefix_ids))
+            self._entries[template_name] = entry
+
+        return entry[1], entry[2]
+
+    def prepare_inputs(self, model, tokenizer, template_name: str, prefix: str,
+                       suffix: str, num_sequences: int) -> Dict:
+        """
+        Build ``generate`` keyword arguments that start from a cached prefix.
+
+        The suffix must begin with whitespace so that tokenizing prefix and
+        suffix separately yields the same ids as tokenizing the full prompt.
+        Inputs are expanded to ``num_sequences`` rows up front, so callers
+        should pass ``num_return_sequences=1`` to ``generate``.
+
+        Args:
+            model: Causal language model used for generation
+            tokenizer: Tokenizer used to encode the prompt
+            template_name: Germline template name used as the cache key
+            prefix: Prompt prefix text for the template
+            suffix: Remaining prompt text after the prefix
+            num_sequences: Number of rows to sample from the prompt
+
+        Returns:
+            Dictionary with input_ids, attention_mask and past_key_values
+        """
+        prefix_ids, prefix_cache = self.get(model, tokenizer, template_name, prefix)
+        suffix_ids = tokenizer(suffix, return_tensors="pt", add_special_tokens=False)["input_ids"]
+
+        input_ids = torch.cat([prefix_ids, suffix_ids], dim=1).repeat(num_sequences, 1)
+
+        # generate() extends the cache in place, so each call gets its own copy
+        past_key_values = copy.deepcopy(prefix_cache)
+        if num_sequences > 1:
+            past_key_values.batch_repeat_interleave(num_sequences)
+
+        return {
+            "input_ids": input_ids.to(model.device),
+            "attention_mask": torch.ones_like(input_ids).to(model.device),
+            "past_key_values": past_key_values
+        }
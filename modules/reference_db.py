@@ -0,0 +1,261 @@
+"""
+Compiled, memory-mapped reference antibody database.
+
+The JSON reference set has to be parsed and encoded in full before the
+first similarity lookup. The compiled format stores everything lookups
+need as flat arrays in one file:
+
+    magic, version, directory length, JSON directory   (fixed-size header)
+    {heavy,light}_residues   uint8    chains packed back to back (ASCII)
+    {heavy,light}_offsets    int64    start of each chain; one extra end entry
+    {heavy,light}_lengths    int64    chain lengths
+    {heavy,light}_codes      uint8    chains as padded residue codes (see reference_index)
+    {heavy,light}_cdrs       int32    (start, end) of CDR1-3 per chain; -1 if unknown
+    records                  uint8    per-antibody metadata as JSON, back to back
+    record_offsets           int64    start of each record; one extra end entry
+
+The directory holds section offsets, dtypes and shapes, plus the dataset's
+validation_metrics and metadata. Opening maps the file read-only and wraps
+the sections as NumPy views, so open time does not depend on the number of
+references. Worker processes opening the same file share one page-cache
+copy. Sequences and records are decoded on access.
+
+Usage:
+    python -m modules.reference_db build modules/data/therapeutic_antibodies.json \
+        modules/data/therapeutic_antibodies.refdb
+    python -m modules.reference_db info modules/data/therapeutic_antibodies.refdb
+"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+from collections.abc import Sequence
+from typing import Dict, List
+
+import numpy as np
+
+from .reference_index import OTHER, encode
+
+MAGIC = b'HLDREFDB'
+VERSION = 1
+SUFFIX = '.refdb'
+
+CHAINS = ('heavy', 'light')
+
+_HEADER = struct.Struct('<8sIQ')
+_ALIGNMENT = 64
+
+
+def _cdr_spans(chain: str, cdrs: Dict[str, str]) -> List[List[int]]:
+    """Positions of CDR1-3 in a chain, searched left to right; (-1, -1) when not found."""
+    spans, position = [], 0
+    for name in ('cdr1', 'cdr2', 'cdr3'):
+        cdr = cdrs.get(name, '')
+        start = chain.find(cdr, position) if cdr else -1
+        if start == -1:
+            spans.append([-1, -1])
+        else:
+            spans.append([start, start + len(cdr)])
+            position = start + len(cdr)
+    return spans
+
+
+def _packed(strings: List[bytes]):
+    """Concatenated bytes and int64 offsets with a trailing end offset."""
+    offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+    np.cumsum([len(s) for s in strings], out=offsets[1:])
+    return np.frombuffer(b''.join(strings), dtype=np.uint8), offsets
+
+
+def build_reference_db(data: Dict, path: str):
+    """
+    Compile a reference data set into a database file.
+
+    Args:
+        data: Dataset in the therapeutic_antibodies.json format
+        path: Database file to write; replaced atomically
+    """
+    antibodies = data['therapeutic_antibodies']
+    sections = {}
+    for chain in CHAINS:
+        sequences = [ab['sequence'][f'{chain}_chain'] for ab in antibodies]
+        residues, offsets = _packed([seq.encode('latin-1', 'replace') for seq in sequences])
+        lengths = np.diff(offsets)
+        codes = np.full((len(sequences), int(lengths.max()) if len(sequences) else 0), OTHER, dtype=np.uint8)
+        for row, seq in enumerate(sequences):
+            codes[row, :len(seq)] = encode(seq)
+        cdrs = np.array([_cdr_spans(seq, ab.get('cdr_regions', {}).get(chain, {}))
+                         for seq, ab in zip(sequences, antibodies)], dtype=np.int32).reshape(-1, 3, 2)
+        sections.update({
+            f'{chain}_residues': residues,
+            f'{chain}_offsets': offsets,
+            f'{chain}_lengths': lengths,
+            f'{chain}_codes': codes,
+            f'{chain}_cdrs': cdrs
+        })
+    records = [{key: value for key, value in ab.items() if key != 'sequence'} for ab in antibodies]
+    sections['records'], sections['record_offsets'] = _packed([json.dumps(r).encode() for r in records])
+
+    directory = {
+        'count': len(antibodies),
+        'validation_metrics': data.get('validation_metrics', {}),
+        'metadata': data.get('metadata', {}),
+        'sections': {}
+    }
+    # Section offsets depend on the directory size, which depends on the offsets;
+    # lay out with a generous directory estimate and pad the directory to it
+    reserved = len(json.dumps(directory)) + 128 * len(sections) + 1024
+    position = -(-(_HEADER.size + reserved) // _ALIGNMENT) * _ALIGNMENT
+    for name, array in sections.items():
+        directory['sections'][name] = {'offset': position, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+        position = -(-(position + array.nbytes) // _ALIGNMENT) * _ALIGNMENT
+    encoded = json.dumps(directory).encode()
+    if len(encoded) > reserved:
+        raise ValueError("Reference database directory does not fit its reserved space")
+
+    temporary = f"{path}.tmp"
+    with open(temporary, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(encoded)))
+        f.write(encoded)
+        for name, array in sections.items():
+            f.write(b'\0' * (directory['sections'][name]['offset'] - f.tell()))
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.write(b'\0' * (position - f.tell()))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+class ChainSequences(Sequence):
+    """Read-only list of chain sequences decoded from packed residues on access."""
+
+    def __init__(self, residues: np.ndarray, offsets: np.ndarray):
+        self.residues = residues
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.residues[self.offsets[index]:self.offsets[index + 1]].tobytes().decode('latin-1')
+
+
+class AntibodyRecords(Sequence):
+    """Read-only list of antibodies in the therapeutic_antibodies format, decoded on access."""
+
+    def __init__(self, database: "ReferenceDatabase"):
+        self.database = database
+
+    def __len__(self) -> int:
+        return self.database.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        db = self.database
+        start, stop = db.sections['record_offsets'][index:index + 2]
+        record = json.loads(db.sections['records'][start:stop].tobytes())
+        record['sequence'] = {'heavy_chain': db.chains['heavy'][index], 'light_chain': db.chains['light'][index]}
+        return record
+
+
+class ReferenceDatabase:
+    """Read-only view of a compiled reference database file."""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Database file written by build_reference_db
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, directory_length = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a reference database")
+        if version != VERSION:
+            raise ValueError(f"{path} has reference database version {version}, expected {VERSION}")
+        directory = json.loads(self._mmap[_HEADER.size:_HEADER.size + directory_length])
+
+        self.count = directory['count']
+        self.validation_metrics = directory['validation_metrics']
+        self.metadata = directory['metadata']
+        self.sections = {
+            name: np.frombuffer(self._mmap, dtype=np.dtype(spec['dtype']), count=int(np.prod(spec['shape'])),
+                                offset=spec['offset']).reshape(spec['shape'])
+            for name, spec in directory['sections'].items()
+        }
+        self.chains = {chain: ChainSequences(self.sections[f'{chain}_residues'], self.sections[f'{chain}_offsets'])
+                       for chain in CHAINS}
+        self.antibodies = AntibodyRecords(self)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def cdr_spans(self, chain: str) -> np.ndarray:
+        """(start, end) of CDR1-3 for every chain of one type, shape (count, 3, 2)."""
+        return self.sections[f'{chain}_cdrs']
+
+    def encoded_chains(self) -> Dict[str, Dict]:
+        """Per-chain sequences, codes and lengths, as AntibodyReferenceIndex(encoded=...) expects."""
+        return {
+            chain: {
+                'sequences': self.chains[chain],
+                'codes': self.sections[f'{chain}_codes'],
+                'lengths': self.sections[f'{chain}_lengths']
+            }
+            for chain in CHAINS
+        }
+
+    def reference_data(self) -> Dict:
+        """Dataset in the therapeutic_antibodies.json layout, plus the encoded chains."""
+        return {
+            'therapeutic_antibodies': self.antibodies,
+            'validation_metrics': self.validation_metrics,
+            'metadata': self.metadata,
+            'encoded_chains': self.encoded_chains()
+        }
+
+
+def main():
+    """Build or inspect a compiled reference database."""
+    parser = argparse.ArgumentParser(description='Compiled, memory-mapped reference antibody database')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help='Compile a reference JSON file')
+    build_parser.add_argument('input', help='Reference data in the therapeutic_antibodies.json format')
+    build_parser.add_argument('output', help=f'Database file to write, conventionally *{SUFFIX}')
+
+    info_parser = subparsers.add_parser('info', help='Show a database summary')
+    info_parser.add_argument('database', help='Database file')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        with open(args.input, 'r') as f:
+            build_reference_db(json.load(f), args.output)
+        print(f"Wrote {args.output} ({os.path.getsize(args.output)} bytes)")
+        return
+
+    db = ReferenceDatabase(args.database)
+    print(json.dumps({
+        'antibodies': len(db),
+        'bytes': os.path.getsize(args.database),
+        'sections': {name: list(array.shape) for name, array in db.sections.items()},
+        'metadata': db.metadata
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,442 @@
+"""
+Vectorized similarity search against therapeutic reference antibodies.
+
+The validators score a query chain against a reference chain position by
+position: 1.0 for identical residues, 0.5 for residues in the same
+physicochemical group and 0.0 otherwise, averaged over the shorter chain,
+minus 0.1 per residue of length difference and clipped to [0, 1].
+
+ReferenceIndex encodes every reference chain once as a row of a padded
+uint8 array and turns the residue rule into a 21x21 lookup matrix, so one
+query is scored against all references with a single NumPy gather and a
+row sum. Code 20 stands for padding and non-standard residues and scores 0;
+queries containing non-standard residues fall back to the per-residue rule,
+so results match the validators' calculate_similarity exactly.
+
+Many queries are scored as an N x M similarity matrix computed tile by
+tile: each query chunk becomes a matrix of per-position similarity rows
+and each reference chunk a one-hot matrix, so a tile is one matrix product.
+Only the running top-k hits per query are kept, so memory depends on the
+chunk sizes, not on N x M.
+
+For large local panels, an optional prefilter (see modules.kmer_index)
+narrows each query to candidate references before exact scoring.
+"""
+
+import csv
+import gzip
+import json
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+
+# Code of padding and residues outside the 20 standard amino acids
+OTHER = len(AMINO_ACIDS)
+
+SIMILAR_GROUPS = [
+    set('ILVM'),   # Aliphatic
+    set('FYW'),    # Aromatic
+    set('KRH'),    # Basic
+    set('DE'),     # Acidic
+    set('STNQ'),   # Polar
+    set('AG'),     # Small
+    set('C'),      # Cysteine
+    set('P')       # Proline
+]
+
+LENGTH_PENALTY = 0.1
+
+# Chain weights of the overall antibody similarity
+HEAVY_WEIGHT, LIGHT_WEIGHT = 0.6, 0.4
+
+
+def residue_similarity(aa1: str, aa2: str) -> float:
+    """Similarity of two residues: 1.0 if identical, 0.5 if in the same group, else 0.0."""
+    if aa1 == aa2:
+        return 1.0
+    for group in SIMILAR_GROUPS:
+        if aa1 in group and aa2 in group:
+            return 0.5
+    return 0.0
+
+
+def sequence_similarity(seq1: str, seq2: str) -> float:
+    """Length-penalized mean residue similarity of two sequences."""
+    min_length = min(len(seq1), len(seq2))
+    scores = [residue_similarity(a, b) for a, b in zip(seq1[:min_length], seq2[:min_length])]
+    length_penalty = abs(len(seq1) - len(seq2)) * LENGTH_PENALTY
+    return max(0.0, min(1.0, sum(scores) / len(scores) - length_penalty)) if scores else 0.0
+
+
+def _similarity_matrix() -> np.ndarray:
+    size = len(AMINO_ACIDS) + 1
+    matrix = np.zeros((size, size), dtype=np.float32)
+    for i, aa1 in enumerate(AMINO_ACIDS):
+        for j, aa2 in enumerate(AMINO_ACIDS):
+            matrix[i, j] = residue_similarity(aa1, aa2)
+    return matrix
+
+
+SIMILARITY_MATRIX = _similarity_matrix()
+_FLAT_MATRIX = SIMILARITY_MATRIX.ravel()
+
+# ASCII byte to residue code
+_CODES = np.full(256, OTHER, dtype=np.uint8)
+for _code, _aa in enumerate(AMINO_ACIDS):
+    _CODES[ord(_aa)] = _code
+
+
+def encode(sequence: str) -> np.ndarray:
+    """Residue codes of a sequence; non-standard residues map to OTHER."""
+    return _CODES[np.frombuffer(sequence.encode('latin-1', 'replace'), dtype=np.uint8)]
+
+
+def _penalized(totals: np.ndarray, query_lengths: np.ndarray, reference_lengths: np.ndarray) -> np.ndarray:
+    """Turn summed residue similarities into length-penalized, clipped scores."""
+    overlap = np.minimum(query_lengths, reference_lengths)
+    penalty = np.abs(reference_lengths - query_lengths) * LENGTH_PENALTY
+    with np.errstate(invalid='ignore', divide='ignore'):
+        scores = np.clip(totals / overlap - penalty, 0.0, 1.0)
+    return np.where(overlap > 0, scores, 0.0)
+
+
+def _rounded_scores(scores: np.ndarray) -> np.ndarray:
+    """
+    Scores rounded to three decimals exactly as round() rounds reported hits.
+
+    Hits are ranked by their rounded score, so selecting the best k must use
+    it too; float noise below the third decimal would otherwise decide ties.
+    """
+    rounded = np.round(scores, 3)
+    # np.round scales by 1000 first, which can land on the other side of a half
+    with np.errstate(invalid='ignore'):
+        scaled = scores * 1000
+        near_half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if near_half.any():
+        rounded[near_half] = [round(float(score), 3) for score in scores[near_half]]
+    return rounded
+
+
+def _top_columns(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Column indices of the k highest scores per row, ties going to lower columns.
+
+    Args:
+        scores: Score matrix
+        k: Number of columns per row
+
+    Returns:
+        Array of shape (rows, min(k, columns)) with ascending column indices per row
+    """
+    rows, columns = scores.shape
+    if columns <= k:
+        return np.broadcast_to(np.arange(columns), (rows, columns))
+    kth = np.partition(scores, columns - k, axis=1)[:, columns - k]
+    greater = scores > kth[:, None]
+    ties = scores == kth[:, None]
+    needed = k - greater.sum(axis=1)
+    take = greater | (ties & (np.cumsum(ties, axis=1) <= needed[:, None]))
+    return np.nonzero(take)[1].reshape(rows, k)
+
+
+class ReferenceIndex:
+    """Reference sequences encoded as a padded uint8 array for batch similarity scoring."""
+
+    def __init__(self, sequences: Sequence[str], codes: Optional[np.ndarray] = None,
+                 lengths: Optional[np.ndarray] = None):
+        """
+        Args:
+            sequences: Reference sequences
+            codes: Already encoded, padded references, e.g. memory-mapped from a
+                reference database; sequences are then kept as given
+            lengths: Reference lengths, required with codes
+        """
+        if codes is not None:
+            self.sequences, self.codes, self.lengths = sequences, codes, lengths
+            return
+        self.sequences = list(sequences)
+        self.lengths = np.array([len(seq) for seq in self.sequences], dtype=np.int64)
+        width = int(self.lengths.max()) if len(self.sequences) else 0
+        self.codes = np.full((len(self.sequences), width), OTHER, dtype=np.uint8)
+        for row, seq in enumerate(self.sequences):
+            self.codes[row, :len(seq)] = encode(seq)
+
+    def __len__(self) -> int:
+        return len(self.sequences)
+
+    def similarities(self, query: str, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Similarity of a query to every reference, or to a subset of them.
+
+        Args:
+            query: Query sequence
+            rows: Reference indices to score; all references by default
+
+        Returns:
+            Float64 array of similarity scores in reference order, or in the order of rows
+        """
+        codes = encode(query)
+        if (codes == OTHER).any():
+            # Identical non-standard residues score 1.0, which the lookup cannot express
+            references = self.sequences if rows is None else [self.sequences[row] for row in rows]
+            return np.array([sequence_similarity(query, ref) for ref in references], dtype=np.float64)
+
+        width = min(len(codes), self.codes.shape[1])
+        reference_codes = self.codes[:, :width] if rows is None else self.codes[rows, :width]
+        lengths = self.lengths if rows is None else self.lengths[rows]
+        # Gather from the flattened matrix with the query's row offsets; padding
+        # scores 0, so the sum runs over the shorter of query and reference
+        offsets = codes[:width].astype(np.intp) * SIMILARITY_MATRIX.shape[1]
+        totals = _FLAT_MATRIX[offsets[None, :] + reference_codes].sum(axis=1, dtype=np.float64)
+        return _penalized(totals, len(codes), lengths)
+
+    def _one_hot(self, start: int, stop: int, width: int) -> np.ndarray:
+        """One-hot residue codes of references start:stop, flattened to (references, width * 21)."""
+        codes = self.codes[start:stop, :width]
+        one_hot = np.zeros(codes.shape + (SIMILARITY_MATRIX.shape[1],), dtype=np.float32)
+        np.put_along_axis(one_hot, codes[..., None].astype(np.intp), 1.0, axis=2)
+        return one_hot.reshape(len(codes), -1)
+
+    def similarity_blocks(self, queries: Sequence[str], query_chunk: int = 256,
+                          reference_chunk: int = 4096) -> Iterator[Tuple[int, int, np.ndarray]]:
+        """
+        Compute the queries x references similarity matrix tile by tile.
+
+        A tile needs about 4 * 21 * L * (query_chunk + reference_chunk) bytes
+        for its operands and 8 * query_chunk * reference_chunk for the
+        scores, where L is the longest reference.
+
+        Args:
+            queries: Query sequences
+            query_chunk: Queries per tile
+            reference_chunk: References per tile
+
+        Yields:
+            (query_start, reference_start, scores) with scores of shape
+            (queries in the tile, references in the tile)
+        """
+        width = min(max((len(query) for query in queries), default=0), self.codes.shape[1])
+        codes = np.full((len(queries), width), OTHER, dtype=np.uint8)
+        nonstandard = []
+        for row, query in enumerate(queries):
+            encoded = encode(query)
+            codes[row, :min(len(encoded), width)] = encoded[:width]
+            if (encoded == OTHER).any():
+                nonstandard.append(row)
+        query_lengths = np.array([len(query) for query in queries], dtype=np.int64)
+
+        for r_start in range(0, len(self), reference_chunk):
+            r_stop = min(r_start + reference_chunk, len(self))
+            references = self._one_hot(r_start, r_stop, width)
+            reference_lengths = self.lengths[r_start:r_stop]
+            for q_start in range(0, len(queries), query_chunk):
+                q_stop = min(q_start + query_chunk, len(queries))
+                # Row i holds the similarity of query residue j to each of the 21 codes
+                profiles = SIMILARITY_MATRIX[codes[q_start:q_stop]].reshape(q_stop - q_start, -1)
+                # Sums of 0.5 multiples are exact in float32
+                totals = (profiles @ references.T).astype(np.float64)
+                scores = _penalized(totals, query_lengths[q_start:q_stop, None], reference_lengths[None, :])
+                for row in nonstandard:
+                    if q_start <= row < q_stop:
+                        scores[row - q_start] = [sequence_similarity(queries[row], ref)
+                                                 for ref in self.sequences[r_start:r_stop]]
+                yield q_start, r_start, scores
+
+
+class AntibodyReferenceIndex:
+    """Heavy and light chain reference indices of a therapeutic antibody set."""
+
+    def __init__(self, antibodies: Sequence[Dict], prefilter=None, chain_index=ReferenceIndex,
+                 encoded: Optional[Dict[str, Dict]] = None):
+        """
+        Args:
+            antibodies: Antibodies with name, target, antibody_type and
+                sequence.heavy_chain / sequence.light_chain
+            prefilter: Optional candidate selector with a candidates(sequence)
+                method returning reference indices, such as an
+                AntibodyKmerPrefilter; only candidates are scored
+            chain_index: Factory of the per-chain index from a list of
+                sequences, e.g. LocalAligner.reference_index to score by
+                local alignment
+            encoded: Per chain ('heavy', 'light'), keyword arguments of
+                chain_index with pre-encoded sequences, codes and lengths,
+                as provided by ReferenceDatabase.encoded_chains
+        """
+        self.antibodies = antibodies
+        if encoded is None:
+            encoded = {chain: {'sequences': [ab['sequence'][f'{chain}_chain'] for ab in antibodies]}
+                       for chain in ('heavy', 'light')}
+        self.heavy = chain_index(**encoded['heavy'])
+        self.light = chain_index(**encoded['light'])
+        self.prefilter = prefilter
+
+    def scores(self, sequence: Dict[str, str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Reference indices scored for a query with their overall, heavy and light similarities."""
+        if self.prefilter is None:
+            rows = np.arange(len(self.antibodies))
+            heavy = self.heavy.similarities(sequence['heavy_chain'])
+            light = self.light.similarities(sequence['light_chain'])
+        else:
+            rows = self.prefilter.candidates(sequence)
+            heavy = self.heavy.similarities(sequence['heavy_chain'], rows)
+            light = self.light.similarities(sequence['light_chain'], rows)
+        return rows, HEAVY_WEIGHT * heavy + LIGHT_WEIGHT * light, heavy, light
+
+    def find_similar(self, sequence: Dict[str, str], threshold: float = 0.7) -> List[Dict]:
+        """
+        Reference antibodies similar to a heavy/light chain pair.
+
+        Args:
+            sequence: Dictionary with heavy_chain and light_chain sequences
+            threshold: Minimum overall similarity
+
+        Returns:
+            Similar antibodies with similarity scores, most similar first
+        """
+        rows, overall, heavy, light = self.scores(sequence)
+        similar = [self._hit(rows[i], overall[i], heavy[i], light[i]) for i in np.flatnonzero(overall >= threshold)]
+        return sorted(similar, key=lambda x: x['similarity_score'], reverse=True)
+
+    def _hit(self, index: int, overall: float, heavy: float, light: float) -> Dict:
+        antibody = self.antibodies[index]
+        return {
+            'name': antibody['name'],
+            'similarity_score': round(float(overall), 3),
+            'heavy_chain_similarity': round(float(heavy), 3),
+            'light_chain_similarity': round(float(light), 3),
+            'target': antibody['target'],
+            'antibody_type': antibody['antibody_type']
+        }
+
+    def top_k(self, sequences: Sequence[Dict[str, str]], k: Optional[int] = 5, threshold: float = 0.0,
+              query_chunk: int = 256, reference_chunk: int = 4096) -> List[List[Dict]]:
+        """
+        Most similar reference antibodies for many heavy/light chain pairs.
+
+        The similarity matrix is computed in tiles of query_chunk x
+        reference_chunk and only the best k hits per query are kept, so
+        memory is bounded by the chunk sizes and k. Without k, only the hits
+        reaching the threshold are collected from each tile. With a
+        prefilter, each query is scored against its own candidates instead.
+
+        Args:
+            sequences: Dictionaries with heavy_chain and light_chain sequences
+            k: Hits per query; None keeps every hit above the threshold
+            threshold: Minimum overall similarity
+            query_chunk: Queries per tile
+            reference_chunk: References per tile
+
+        Returns:
+            Per query, hits in the find_similar format, most similar first
+        """
+        if self.prefilter is not None:
+            return [self._top_candidates(sequence, k, threshold) for sequence in sequences]
+        if k is None:
+            return self._threshold_hits(sequences, threshold, query_chunk, reference_chunk)
+        shape = (len(sequences), min(k, len(self.antibodies)))
+        # Running best hits per query; index -1 marks an empty slot
+        best = {
+            "index": np.full(shape, -1, dtype=np.int64),
+            "overall": np.full(shape, -np.inf),
+            "heavy": np.zeros(shape),
+            "light": np.zeros(shape)
+        }
+
+        blocks = zip(
+            self.heavy.similarity_blocks([s['heavy_chain'] for s in sequences], query_chunk, reference_chunk),
+            self.light.similarity_blocks([s['light_chain'] for s in sequences], query_chunk, reference_chunk)
+        )
+        for (q_start, r_start, heavy), (_, _, light) in blocks:
+            q_stop = q_start + len(heavy)
+            weighted = HEAVY_WEIGHT * heavy + LIGHT_WEIGHT * light
+            overall = _rounded_scores(weighted)
+            overall[weighted < threshold] = -np.inf
+
+            columns = _top_columns(overall, shape[1])
+            rows = np.arange(len(overall))[:, None]
+            candidates = {
+                "index": np.concatenate([best["index"][q_start:q_stop], columns + r_start], axis=1),
+                "overall": np.concatenate([best["overall"][q_start:q_stop], overall[rows, columns]], axis=1),
+                "heavy": np.concatenate([best["heavy"][q_start:q_stop], heavy[rows, columns]], axis=1),
+                "light": np.concatenate([best["light"][q_start:q_stop], light[rows, columns]], axis=1)
+            }
+            order = np.lexsort((candidates["index"], -candidates["overall"]), axis=-1)[:, :shape[1]]
+            for key, values in candidates.items():
+                best[key][q_start:q_stop] = np.take_along_axis(values, order, axis=1)
+
+        return [
+            self._ranked_hits([
+                (index, overall, heavy, light)
+                for index, overall, heavy, light in zip(best["index"][row], best["overall"][row],
+                                                        best["heavy"][row], best["light"][row])
+                if np.isfinite(overall)
+            ])
+            for row in range(len(sequences))
+        ]
+
+    def _threshold_hits(self, sequences: Sequence[Dict[str, str]], threshold: float,
+                        query_chunk: int, reference_chunk: int) -> List[List[Dict]]:
+        """Every hit reaching the threshold per query, collected tile by tile."""
+        entries = [[] for _ in sequences]
+        blocks = zip(
+            self.heavy.similarity_blocks([s['heavy_chain'] for s in sequences], query_chunk, reference_chunk),
+            self.light.similarity_blocks([s['light_chain'] for s in sequences], query_chunk, reference_chunk)
+        )
+        for (q_start, r_start, heavy), (_, _, light) in blocks:
+            overall = HEAVY_WEIGHT * heavy + LIGHT_WEIGHT * light
+            for row, column in zip(*np.nonzero(overall >= threshold)):
+                entries[q_start + row].append(
+                    (r_start + column, overall[row, column], heavy[row, column], light[row, column])
+                )
+        return [self._ranked_hits(query_entries) for query_entries in entries]
+
+    def _ranked_hits(self, entries: List[tuple]) -> List[Dict]:
+        """Hits from (index, overall, heavy, light) entries in the find_similar order."""
+        hits = [(index, self._hit(index, overall, heavy, light)) for index, overall, heavy, light in entries]
+        # Same order as find_similar: rounded score, then reference order
+        hits.sort(key=lambda hit: (-hit[1]['similarity_score'], hit[0]))
+        return [hit for _, hit in hits]
+
+    def _top_candidates(self, sequence: Dict[str, str], k: Optional[int], threshold: float) -> List[Dict]:
+        """Best k prefiltered hits of one query, in the top_k order."""
+        rows, overall, heavy, light = self.scores(sequence)
+        order = np.lexsort((rows, -_rounded_scores(overall)))[:k]
+        return self._ranked_hits([(rows[i], overall[i], heavy[i], light[i]) for i in order if overall[i] >= threshold])
+
+
+def load_reference_panel(path: str) -> List[Dict]:
+    """
+    Load a reference antibody panel.
+
+    Args:
+        path: JSON file in the therapeutic_antibodies format, or an OAS paired
+            CSV export (optionally gzipped) with sequence_alignment_aa_heavy and
+            sequence_alignment_aa_light columns
+
+    Returns:
+        Antibodies in the format AntibodyReferenceIndex expects
+    """
+    if path.endswith('.json'):
+        with open(path) as f:
+            data = json.load(f)
+        return data['therapeutic_antibodies'] if isinstance(data, dict) else data
+
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', newline='') as f:
+        first = f.readline()
+        # OAS exports start with a JSON metadata line before the CSV header
+        lines = f if first.startswith('"{') or first.startswith('{') else [first] + list(f)
+        antibodies = []
+        for row in csv.DictReader(lines):
+            antibodies.append({
+                'name': row.get('sequence_id_heavy') or f"oas{len(antibodies)}",
+                'target': row.get('target', ''),
+                'antibody_type': row.get('antibody_type', 'paired'),
+                'sequence': {
+                    'heavy_chain': row['sequence_alignment_aa_heavy'],
+                    'light_chain': row['sequence_alignment_aa_light']
+                }
+            })
+    return antibodies
@@ -1,114 +1,214 @@
 """Antibody sequence generation using ProtGPT2 with IMGT germline templates."""
 
-from transformers import AutoTokenizer, AutoModelForCausalLM
 import torch
-import random
-from typing import List, Dict, Tuple
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 import json
-import os
-from pathlib import Path
+import time
 from .sequence_validator import SequenceValidator
+from ..cdr_decoding import cdr_stopping_criteria, non_amino_acid_token_ids, token_residue_counts
+from ..prompt_cache import PromptPrefixCache
+from ..binder_stream import stream_attempts
+from ..cdr_library import CDRLibrary, CombinatorialAssembler
+from ..seen_filter import SeenSequenceFilter
+from ..oversampling import AdaptiveOversampler
+from ..generation_telemetry import GenerationTelemetry, generated_token_count
+from ..onnx_engine import DEFAULT_MODEL_DIR, OnnxGenerationEngine
+from ..speculative_decoding import DEFAULT_DRAFT_PATH, SpeculativeDecoder, load_or_train_draft
+from ..germline_templates import DEFAULT_TEMPLATE_FILE, GermlineTemplate, TemplateLibrary
+from ..campaign import CampaignCheckpoint
+from ..model_cache import load_model, load_tokenizer
+from ..similarity_service import ACCEPTANCE_THRESHOLDS, get_similarity_service
 
 class AntibodyGenerator:
     """Generates antibody sequences using ProtGPT2 with IMGT germline templates."""
-    
-    # IMGT human germline V-region templates
-    GERMLINE_TEMPLATES = {
-        'VH': {
-            'IGHV1-69*01': {
-                'FR1': 'QVQLVQSGAEVKKPGSSVKVSCKASGGTFS',
-                'FR2': 'WVRQAPGQGLEWMG',
-                'FR3': 'RVTITADKSTSTAYMELSSLRSEDTAVYYCAR',
-                'FR4': 'WGQGTLVTVSS'
-            },
-            'IGHV3-23*01': {
-                'FR1': 'EVQLLESGGGLVQPGGSLRLSCAASGFTFS',
-                'FR2': 'WVRQAPGKGLEWVS',
-                'FR3': 'RFTISRDNSKNTLYLQMNSLRAEDTAVYYCAR',
-                'FR4': 'WGQGTLVTVSS'
-            }
-        },
-        'VL': {
-            'IGKV1-39*01': {
-                'FR1': 'DIQMTQSPSSLSASVGDRVTITC',
-                'FR2': 'WYQQKPGKAPKLLIY',
-                'FR3': 'GVPSRFSGSGSGTDFTLTISSLQPEDFATYYC',
-                'FR4': 'FGQGTKVEIK'
-            },
-            'IGLV1-44*01': {
-                'FR1': 'QSVLTQPPSVSGAPGQRVTISCTGSSSNIG',
-                'FR2': 'WYQQHPGKAPKLLIY',
-                'FR3': 'GVPDRFSGSGSGTDFTLTISGVQAEDVAVYYC',
-                'FR4': 'FGGGTKLTVL'
-            }
-        }
-    }
 
-    def __init__(self):
-        """Initialize generator with model and validator."""
+    def __init__(self, cdr_library: Optional[CDRLibrary] = None, metrics_path: Optional[str] = None,
+                 engine: str = 'torch', onnx_model_dir: str = DEFAULT_MODEL_DIR,
+                 seen_filter: Optional[SeenSequenceFilter] = None,
+                 draft_model_path: Optional[str] = DEFAULT_DRAFT_PATH,
+                 template_file: str = DEFAULT_TEMPLATE_FILE, similarity: str = 'alignment',
+                 reference_path: Optional[str] = None):
+        """Initialize generator with model and validator.
+        
+        If a CDR library is given, every CDR passing validation is recorded
+        in it for later combinatorial assembly. If metrics_path is given,
+        generation telemetry is streamed to it as JSONL. With engine='onnx',
+        sampling runs through ONNX Runtime on the model exported to
+        onnx_model_dir and the PyTorch weights are not loaded. With
+        engine='speculative', an n-gram draft model (draft_model_path,
+        trained from known CDRs if missing) proposes tokens that ProtGPT2
+        verifies several at a time. If a seen filter is given, CDRs and
+        antibodies produced in earlier runs are skipped. Germline templates
+        are loaded from template_file. Candidates are scored against the
+        therapeutic references with the shared similarity service, by local
+        alignment unless similarity='prefix'; binders are accepted from the
+        backend's threshold in ACCEPTANCE_THRESHOLDS. The references are read from
+        reference_path (JSON or a compiled .refdb database) if given.
+        """
         # Initialize ProtGPT2
-        self.tokenizer = AutoTokenizer.from_pretrained("nferruz/ProtGPT2")
-        self.model = AutoModelForCausalLM.from_pretrained("nferruz/ProtGPT2")
+        self.tokenizer = load_tokenizer("nferruz/ProtGPT2")
+        if engine == 'onnx':
+            self.model = None
+            self.onnx_engine = OnnxGenerationEngine(onnx_model_dir)
+        else:
+            self.model = load_model("nferruz/ProtGPT2")
+            self.onnx_engine = None
+        
+        # Speculative sampling verifies n-gram draft tokens with one ProtGPT2 pass
+        self.speculative_decoder = None
+        if engine == 'speculative':
+            draft = load_or_train_draft(self.tokenizer, draft_model_path, cdr_library)
+            self.speculative_decoder = SpeculativeDecoder(self.model, draft)
         
         # Configure tokenizer
         if self.tokenizer.pad_token is None:
             self.tokenizer.pad_token = self.tokenizer.eos_token
-            self.model.config.pad_token_id = self.model.config.eos_token_id
+            if self.model is not None:
+                self.model.config.pad_token_id = self.model.config.eos_token_id
         
         # Initialize sequence validator
         self.validator = SequenceValidator()
         
-        # Load validation dataset
-        self.validation_set = self._load_validation_set()
-
-    def _load_validation_set(self) -> List[Dict]:
-        """Load therapeutic antibody validation dataset."""
+        # Germline templates indexed by chain and family, with tokenized prompt prefixes
+        self.template_library = TemplateLibrary.load(template_file)
+        
+        # Cache encoded template prefixes across generation attempts
+        self.prompt_cache = PromptPrefixCache()
+        
+        # Set by the generation service to merge sampling calls across requests
+        self.batcher = None
+        
+        # Optional store of accepted CDRs for library-based assembly
+        self.cdr_library = cdr_library
+        
+        # Optional filter of sequences produced in earlier runs
+        self.seen_filter = seen_filter
+        
+        # Size sampling requests from observed per-template acceptance rates
+        self.oversampler = AdaptiveOversampler(prior_rate=1 / 3)
+        
+        # Forward pass throughput, acceptance funnel and rejection reasons
+        self.telemetry = GenerationTelemetry(metrics_path)
+        
+        # Therapeutic antibody references, loaded and indexed once per process
         try:
-            validation_file = Path(__file__).parent / 'data' / 'therapeutic_antibodies.json'
-            with open(validation_file) as f:
-                return json.load(f)
+            self.similarity_service = get_similarity_service(reference_path, similarity)
         except (FileNotFoundError, json.JSONDecodeError):
             print("Warning: Validation dataset not found or invalid. Using basic validation.")
-            return []
+            self.similarity_service = None
 
-    def _generate_cdrs(self, context: str, template_seq: str, num_variants: int = 5) -> List[Tuple[str, Dict]]:
+    def _prompt_ids(self, template_seq: str, context: str, template_name: str = None) -> List[int]:
+        """Token ids of a CDR prompt, reusing the pre-tokenized prefix of library templates."""
+        suffix = f" {context} <CDR>"
+        if template_name in self.template_library and \
+                self.template_library[template_name].prompt_prefix == template_seq:
+            prefix_ids = self.template_library.prefix_ids(template_name, self.tokenizer)
+            return prefix_ids + self.tokenizer(suffix, add_special_tokens=False)["input_ids"]
+        return self.tokenizer(template_seq + suffix)["input_ids"]
+
+    def _generate_cdrs(self, context: str, template_seq: str, num_variants: int = 5,
+                       template_name: str = None) -> List[Tuple[str, Dict]]:
         """Generate CDR sequences with template-based conditioning.
         
+        When template_name is given, the encoded template prefix is reused
+        from the prompt prefix cache instead of being re-encoded. The number
+        of samples is sized by the adaptive oversampler from the template's
+        observed acceptance rate.
+        
         Returns:
             List of tuples (sequence, analysis_dict)
         """
         prompt = f"{template_seq} {context} <CDR>"
-        inputs = self.tokenizer(prompt, return_tensors="pt", padding=True)
+        template_key = template_name or template_seq
+        num_samples = self.oversampler.num_samples(template_key, num_variants)  # Extra for filtering
+        max_cdr_length = self.validator.params['max_cdr_length']
         
         # Generate sequences with improved parameters
-        outputs = self.model.generate(
-            inputs["input_ids"],
-            attention_mask=inputs["attention_mask"],
+        generation_kwargs = dict(
             do_sample=True,
             top_k=40,  # More diverse sampling
             top_p=0.9,  # Slightly more permissive
             temperature=0.7,  # Higher temperature for diversity
             max_new_tokens=25,  # Allow slightly longer sequences
-            num_return_sequences=num_variants * 3,  # Generate more for filtering
-            pad_token_id=self.tokenizer.pad_token_id,
             no_repeat_ngram_size=2,  # Prevent direct repeats
-            repetition_penalty=1.3  # More permissive repetition penalty
+            repetition_penalty=1.3,  # More permissive repetition penalty
+            suppress_tokens=non_amino_acid_token_ids(self.tokenizer)  # Only amino acid tokens in the CDR
+        )
+        
+        start = time.perf_counter()
+        if self.batcher is not None:
+            # Share the forward pass with concurrent service requests
+            outputs = self.batcher.generate(prompt, num_samples, generation_kwargs, max_cdr_length)
+            prompt_length = len(self._prompt_ids(template_seq, context, template_name))
+        elif self.onnx_engine is not None or self.speculative_decoder is not None:
+            # Both engines sample rows from a single encoded prompt
+            engine = self.onnx_engine if self.onnx_engine is not None else self.speculative_decoder
+            prompt_ids = self._prompt_ids(template_seq, context, template_name)
+            outputs = engine.generate(
+                prompt_ids, num_samples,
+                pad_token_id=self.tokenizer.pad_token_id,
+                max_residues=max_cdr_length,
+                residue_counts=token_residue_counts(self.tokenizer),
+                **generation_kwargs
+            )
+            prompt_length = len(prompt_ids)
+        else:
+            if template_name is not None:
+                # Start from the cached template prefix and only encode the context
+                inputs = self.prompt_cache.prepare_inputs(
+                    self.model, self.tokenizer, template_name, template_seq,
+                    f" {context} <CDR>", num_samples
+                )
+                num_return_sequences = 1
+            else:
+                inputs = self.tokenizer(prompt, return_tensors="pt", padding=True)
+                num_return_sequences = num_samples
+            
+            # Stop each sample as soon as it reaches the maximum CDR length
+            stopping_criteria = cdr_stopping_criteria(
+                self.tokenizer, inputs["input_ids"].shape[1], max_cdr_length
+            )
+            
+            outputs = self.model.generate(
+                **inputs,
+                stopping_criteria=stopping_criteria,
+                num_return_sequences=num_return_sequences,
+                pad_token_id=self.tokenizer.pad_token_id,
+                **generation_kwargs
+            )
+            prompt_length = inputs["input_ids"].shape[1]
+        self.telemetry.record_forward(
+            time.perf_counter() - start,
+            generated_token_count(outputs, prompt_length, self.tokenizer.pad_token_id),
+            len(outputs)
         )
         
         # Process and validate sequences
         valid_sequences = []
+        evaluated = 0
+        rejections = {}
         for output in outputs:
             sequence = self.tokenizer.decode(output, skip_special_tokens=True)
             sequence = sequence.split("<CDR>")[-1].strip()
-            sequence = ''.join(aa for aa in sequence if aa in "ACDEFGHIKLMNPQRSTVWY")
             
-            # Analyze sequence quality
-            analysis = self.validator.analyze_sequence(sequence)
-            if analysis['passes_validation']:
-                valid_sequences.append((sequence, analysis))
-                if len(valid_sequences) >= num_variants:
-                    break
+            # Run the cheap filters first; only accepted sequences get a full analysis
+            evaluated += 1
+            with self.telemetry.timed("quality_filters"):
+                reason = self.validator.rejection_reason(sequence)
+            self.telemetry.record_stage("cdr_quality", reason)
+            if reason is None and self.seen_filter is not None:
+                if self.seen_filter.seen_cdr(sequence):
+                    reason = "duplicate_cdr"
+                self.telemetry.record_stage("cdr_novelty", reason)
+            if reason is not None:
+                rejections[reason] = rejections.get(reason, 0) + 1
+                continue
+            
+            valid_sequences.append((sequence, self.validator.analyze_sequence(sequence)))
+            if len(valid_sequences) >= num_variants:
+                break
         
+        self.oversampler.record(template_key, evaluated, len(valid_sequences), rejections)
         return valid_sequences
 
     def _assemble_antibody(self, heavy_cdrs: List[str], light_cdrs: List[str], vh_template: Dict, vl_template: Dict) -> str:
@@ -131,80 +231,210 @@ class AntibodyGenerator:
         
         return vh + vl
 
-    def generate_binders(self, fusion_context: Dict, num_candidates: int = 10) -> Dict:
+    def _record_cdrs(self, chain: str, template_name: str, target_motif: str,
+                     cdrs: List[Tuple[str, Dict]]):
+        """Store validated CDRs and their analysis in the CDR library, if one is set."""
+        if self.cdr_library is None or not cdrs:
+            return
+        
+        self.cdr_library.add_many([
+            {
+                "sequence": sequence,
+                "chain": chain,
+                "position": position,
+                "template": template_name,
+                "context": target_motif,
+                "metrics": analysis
+            }
+            for position, (sequence, analysis) in enumerate(cdrs[:3], 1)
+        ])
+
+    def _attempt_binder(self, target_motif: str, vh: Optional[GermlineTemplate] = None,
+                        vl: Optional[GermlineTemplate] = None) -> Optional[Dict]:
+        """Run one generation attempt; return the accepted binder or None."""
+        # Select templates unless the caller allocated them
+        vh = vh or self.template_library.sample('VH')
+        vl = vl or self.template_library.sample('VL')
+        
+        # Generate and validate CDRs
+        heavy_cdrs = self._generate_cdrs(
+            f"Target binding site: {target_motif}",
+            vh.prompt_prefix,
+            3,
+            template_name=vh.name
+        )
+        self._record_cdrs('VH', vh.name, target_motif, heavy_cdrs)
+        
+        light_cdrs = self._generate_cdrs(
+            f"Light chain CDRs for {target_motif}",
+            vl.prompt_prefix,
+            3,
+            template_name=vl.name
+        )
+        self._record_cdrs('VL', vl.name, target_motif, light_cdrs)
+        
+        if len(heavy_cdrs) < 3 or len(light_cdrs) < 3:
+            self.telemetry.record_stage("cdr_count", "too_few_cdrs")
+            return None
+        self.telemetry.record_stage("cdr_count")
+        
+        # Use only the sequences, not their analysis dicts
+        h_seqs = [seq for seq, _ in heavy_cdrs[:3]]
+        l_seqs = [seq for seq, _ in light_cdrs[:3]]
+        
+        sequence = self._assemble_antibody(h_seqs, l_seqs, vh.frameworks, vl.frameworks)
+        if self.seen_filter is not None:
+            if self.seen_filter.seen_binder(sequence):
+                self.telemetry.record_stage("binder_novelty", "duplicate_binder")
+                return None
+            self.telemetry.record_stage("binder_novelty")
+        with self.telemetry.timed("validation"):
+            validation_score = self._validate_sequence(sequence)
+        
+        if validation_score < self._acceptance_threshold():
+            self.telemetry.record_stage("validation", "validation_score")
+            return None
+        self.telemetry.record_stage("validation")
+        
+        return {
+            "sequence": sequence,
+            "heavy_cdrs": h_seqs,
+            "light_cdrs": l_seqs,
+            "validation_score": validation_score,
+            "template_vh": vh.name,
+            "template_vl": vl.name,
+            "heavy_cdr_analysis": [analysis for _, analysis in heavy_cdrs[:3]],
+            "light_cdr_analysis": [analysis for _, analysis in light_cdrs[:3]]
+        }
+
+    def generate_binders(self, fusion_context: Dict, num_candidates: int = 10,
+                         checkpoint: Optional[CampaignCheckpoint] = None) -> Dict:
         """Generate antibody sequences with comprehensive validation."""
         binders = []
         target_motif = fusion_context.get('cleaned_sequence', '')[:20]
         
-        vh_templates = list(self.GERMLINE_TEMPLATES['VH'].items())
-        vl_templates = list(self.GERMLINE_TEMPLATES['VL'].items())
-        
         attempts = 0
-        max_attempts = num_candidates * 3
+        max_attempts = self.oversampler.max_attempts(num_candidates)
+        self.oversampler.start_run()
+        self.telemetry.start_run()
+        if self.speculative_decoder is not None:
+            self.speculative_decoder.reset_stats()
+        if checkpoint is not None:
+            # Continue a campaign from its checkpoint log
+            binders, attempts = checkpoint.resume(fusion_context, num_candidates, self.oversampler,
+                                                  self.seen_filter)
         
         while len(binders) < num_candidates and attempts < max_attempts:
             attempts += 1
-            
-            # Select templates
-            vh_name, vh = random.choice(vh_templates)
-            vl_name, vl = random.choice(vl_templates)
-            
-            # Generate and validate CDRs
-            heavy_cdrs = self._generate_cdrs(
-                f"Target binding site: {target_motif}",
-                vh['FR1'] + "X" * 10 + vh['FR2'],
-                3
-            )
-            
-            light_cdrs = self._generate_cdrs(
-                f"Light chain CDRs for {target_motif}",
-                vl['FR1'] + "X" * 8 + vl['FR2'],
-                3
-            )
-            
-            if len(heavy_cdrs) >= 3 and len(light_cdrs) >= 3:
-                # Use only the sequences, not their analysis dicts
-                h_seqs = [seq for seq, _ in heavy_cdrs[:3]]
-                l_seqs = [seq for seq, _ in light_cdrs[:3]]
-                
-                sequence = self._assemble_antibody(h_seqs, l_seqs, vh, vl)
-                validation_score = self._validate_sequence(sequence)
-                
-                if validation_score >= 0.7:
-                    binder = {
-                        "sequence": sequence,
-                        "heavy_cdrs": h_seqs,
-                        "light_cdrs": l_seqs,
-                        "validation_score": validation_score,
-                        "template_vh": vh_name,
-                        "template_vl": vl_name,
-                        "heavy_cdr_analysis": [analysis for _, analysis in heavy_cdrs[:3]],
-                        "light_cdr_analysis": [analysis for _, analysis in light_cdrs[:3]]
-                    }
-                    binders.append(binder)
+            binder = self._tracked_attempt(target_motif)
+            if binder is not None:
+                binders.append(binder)
+            if checkpoint is not None:
+                checkpoint.record(attempts, binder, self.oversampler)
+            if binder is None and self.oversampler.yield_collapsed():
+                break  # Marginal yield has collapsed
+        
+        stats = {
+            "attempts": attempts,
+            "success_rate": len(binders) / attempts if attempts > 0 else 0,
+            "oversampling": self.oversampler.summary(),
+            "telemetry": self.telemetry.finish_run()
+        }
+        if self.seen_filter is not None:
+            self.seen_filter.save()
+            stats["novelty"] = self.seen_filter.summary()
+        if self.speculative_decoder is not None:
+            stats["speculative"] = self.speculative_decoder.summary()
+        
+        result = {
+            "generated_binders": binders,
+            "stats": stats
+        }
+        if checkpoint is not None:
+            stats["campaign"] = checkpoint.summary()
+            checkpoint.compact(result)
+        return result
+
+    def _tracked_attempt(self, target_motif: str, vh: Optional[GermlineTemplate] = None,
+                         vl: Optional[GermlineTemplate] = None) -> Optional[Dict]:
+        """Run one binder attempt and record its outcome for yield tracking."""
+        binder = self._attempt_binder(target_motif, vh, vl)
+        self.oversampler.record_attempt(binder is not None)
+        return binder
+
+    def agenerate_binders(self, fusion_context: Dict, num_candidates: int = 10,
+                          stats: Optional[Dict] = None) -> AsyncIterator[Dict]:
+        """Stream validated binders as soon as each one is accepted.
+        
+        Attempts run in a worker thread so downstream stages can process early
+        binders while generation continues. Iteration ends once num_candidates
+        binders are accepted or the marginal yield has collapsed; breaking out
+        of the loop or cancelling the consuming task stops generation after the
+        current attempt. If given, stats is updated in place with attempts and
+        success_rate, and with the telemetry (and speculative) summaries once
+        generation ends.
+        """
+        target_motif = fusion_context.get('cleaned_sequence', '')[:20]
+        stats = stats if stats is not None else {}
+        self.oversampler.start_run()
+        self.telemetry.start_run()
+        if self.speculative_decoder is not None:
+            self.speculative_decoder.reset_stats()
+
+        def finish():
+            stats["telemetry"] = self.telemetry.finish_run()
+            if self.speculative_decoder is not None:
+                stats["speculative"] = self.speculative_decoder.summary()
+
+        return stream_attempts(
+            lambda: self._tracked_attempt(target_motif),
+            num_candidates,
+            self.oversampler.max_attempts(num_candidates),
+            stats,
+            should_stop=self.oversampler.yield_collapsed,
+            on_finish=finish
+        )
+
+    def assemble_binders(self, num_candidates: int = 10, target_motif: Optional[str] = None,
+                         seed: Optional[int] = None) -> Dict:
+        """Assemble validated binders from the CDR library without model calls.
+        
+        Stored CDRs are combined with their germline frameworks, duplicates are
+        skipped and candidates must pass the usual validation threshold.
+        """
+        if self.cdr_library is None:
+            raise ValueError("No CDR library configured for this generator")
+        
+        assembler = CombinatorialAssembler(self.cdr_library, self.template_library.as_dict(), seed=seed)
+        candidates = assembler.assemble(num_candidates * 3, context=target_motif)
+        
+        binders = []
+        for candidate in candidates:
+            validation_score = self._validate_sequence(candidate["sequence"])
+            if validation_score >= self._acceptance_threshold():
+                candidate["validation_score"] = validation_score
+                binders.append(candidate)
+                if len(binders) >= num_candidates:
+                    break
         
         return {
             "generated_binders": binders,
             "stats": {
-                "attempts": attempts,
-                "success_rate": len(binders) / attempts if attempts > 0 else 0
+                "assembled": len(candidates),
+                "success_rate": len(binders) / len(candidates) if candidates else 0,
+                "library_size": self.cdr_library.count()
             }
         }
 
+    def _acceptance_threshold(self) -> float:
+        """Minimum validation score of an accepted binder for the similarity backend in use."""
+        if self.similarity_service is None:
+            return ACCEPTANCE_THRESHOLDS['alignment']
+        return self.similarity_service.acceptance_threshold
+
     def _validate_sequence(self, sequence: str) -> float:
         """Validate sequence against known therapeutic antibodies."""
-        if not self.validation_set:
+        if self.similarity_service is None:
             return 0.5
         
-        max_score = 0
-        for ref_ab in self.validation_set:
-            score = self._calculate_similarity(sequence, ref_ab["sequence"])
-            max_score = max(max_score, score)
-        
-        return max_score
-
-    def _calculate_similarity(self, seq1: str, seq2: str) -> float:
-        """Calculate sequence similarity using local alignment."""
-        min_len = min(len(seq1), len(seq2))
-        matches = sum(a == b for a, b in zip(seq1[:min_len], seq2[:min_len]))
-        return matches / min_len if min_len > 0 else 0.0
\ No newline at end of file
+        return self.similarity_service.best_score(sequence)
@@ -7,6 +7,7 @@ from pathlib import Path
 from typing import Dict, List
 from modules.revised.antibody_generator import AntibodyGenerator
 from modules.revised.sequence_validator import SequenceValidator
+from modules.generation_service import GenerationClient
 
 def setup_logging():
     """Configure logging for the application."""
@@ -42,12 +43,21 @@ def save_results(results: Dict, output_file: Path):
     logging.info(f"Results saved to {output_file}")
 
 def generate_binders(fusion_context: Dict, num_candidates: int = 10) -> Dict:
-    """Generate and validate antibody binders."""
-    generator = AntibodyGenerator()
+    """Generate and validate antibody binders.
+    
+    Candidates come from a running generation service when one is available,
+    which avoids reloading ProtGPT2 for every invocation.
+    """
     validator = SequenceValidator()
     
     # Generate initial candidates
-    results = generator.generate_binders(fusion_context, num_candidates)
+    client = GenerationClient.from_env()
+    if client is not None and client.is_available('revised'):
+        logging.info(f"Using generation service at {client.url}")
+        results = client.generate_binders(fusion_context, num_candidates)
+    else:
+        generator = AntibodyGenerator()
+        results = generator.generate_binders(fusion_context, num_candidates)
     
     # Additional validation of complete sequences
     for binder in results['generated_binders']:
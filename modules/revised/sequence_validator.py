@@ -1,5 +1,5 @@
 """Sequence quality validation for antibody generation."""
-from typing import Dict
+from typing import Dict, Optional
 import re
 
 class SequenceValidator:
@@ -19,15 +19,23 @@ class SequenceValidator:
     
     def validate_cdr(self, sequence: str) -> bool:
         """Validate CDR sequence meets all quality criteria."""
+        return self.rejection_reason(sequence) is None
+    
+    def rejection_reason(self, sequence: str) -> Optional[str]:
+        """Return the first quality criterion a CDR fails, or None if it passes.
+        
+        Reasons are 'length', 'homopolymer', 'diversity', 'composition'
+        and 'hydrophobicity'.
+        """
         # Length check
         if not (self.params['min_cdr_length'] <= len(sequence) <= self.params['max_cdr_length']):
-            return False
+            return 'length'
         
         # Homopolymer check using regex
         for aa in set(sequence):
             pattern = f"{aa}{{{self.params['max_homopolymer_length']},}}"
             if re.search(pattern, sequence):
-                return False
+                return 'homopolymer'
         
         # Amino acid composition checks
         aa_counts = {}
@@ -36,13 +44,13 @@ class SequenceValidator:
         
         # Check amino acid diversity
         if len(aa_counts) < self.params['min_unique_aa']:
-            return False
+            return 'diversity'
         
         # Check maximum frequency
         sequence_length = len(sequence)
         for count in aa_counts.values():
             if count / sequence_length > self.params['max_aa_frequency']:
-                return False
+                return 'composition'
         
         # Hydrophobicity check
         hydrophobic_count = sum(1 for aa in sequence if aa in self.params['hydrophobic_aas'])
@@ -50,9 +58,9 @@ class SequenceValidator:
         min_hydrophobic, max_hydrophobic = self.params['hydrophobic_range']
         
         if not (min_hydrophobic <= hydrophobic_fraction <= max_hydrophobic):
-            return False
+            return 'hydrophobicity'
         
-        return True
+        return None
     
     def analyze_sequence(self, sequence: str) -> Dict:
         """Analyze sequence properties for detailed validation."""
@@ -0,0 +1,195 @@
+"""
+Cross-run filter of previously produced sequences.
+
+A persistent Bloom filter records every CDR and every assembled antibody
+the generators produce. Later runs consult it to drop sequences already
+seen in earlier campaigns before assembly and validation are spent on
+them. Filters with the same size can be merged, so campaigns run on
+different machines can share one filter.
+
+Usage:
+    python -m modules.seen_filter info output/seen_sequences.bloom
+    python -m modules.seen_filter merge output/merged.bloom run1.bloom run2.bloom
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import threading
+from typing import Dict, Optional
+
+import numpy as np
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings."""
+
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 0.001):
+        """
+        Args:
+            capacity: Number of items the filter is sized for
+            error_rate: Target false positive rate at capacity
+        """
+        self.num_bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.bits = np.zeros((self.num_bits + 7) // 8, dtype=np.uint8)
+        self.items = 0
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def add(self, item: str) -> bool:
+        """
+        Add an item.
+
+        Returns:
+            True if the item was (probably) already present
+        """
+        present = True
+        for pos in self._positions(item):
+            mask = 1 << (pos & 7)
+            if not self.bits[pos >> 3] & mask:
+                present = False
+                self.bits[pos >> 3] |= mask
+        if not present:
+            self.items += 1
+        return present
+
+    def merge(self, other: "BloomFilter"):
+        """Add every item of another filter with the same size and hash count."""
+        if (other.num_bits, other.num_hashes) != (self.num_bits, self.num_hashes):
+            raise ValueError("Only Bloom filters with the same size and hash count can be merged")
+        np.bitwise_or(self.bits, other.bits, out=self.bits)
+        self.items = self.estimated_items()
+
+    def fill_ratio(self) -> float:
+        """Fraction of bits set."""
+        return int(np.unpackbits(self.bits)[:self.num_bits].sum()) / self.num_bits
+
+    def false_positive_rate(self) -> float:
+        """Current false positive probability estimated from the fill ratio."""
+        return self.fill_ratio() ** self.num_hashes
+
+    def estimated_items(self) -> int:
+        """Number of distinct items estimated from the fill ratio."""
+        fill = self.fill_ratio()
+        if fill >= 1.0:
+            return self.items
+        return int(round(-self.num_bits / self.num_hashes * math.log(1 - fill)))
+
+    def save(self, path: str):
+        """Write the filter atomically."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, bits=self.bits, params=np.array([self.num_bits, self.num_hashes, self.items]))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BloomFilter":
+        """Read a filter written by save()."""
+        with np.load(path) as data:
+            bloom = cls.__new__(cls)
+            bloom.num_bits, bloom.num_hashes, bloom.items = (int(v) for v in data['params'])
+            bloom.bits = data['bits'].copy()
+        return bloom
+
+
+class SeenSequenceFilter:
+    """
+    Persistent record of CDRs and assembled antibodies from earlier runs.
+
+    Each check also records the sequence, so duplicates within a run are
+    skipped as well. Skipped duplicates are counted per kind.
+    """
+
+    def __init__(self, path: Optional[str] = 'output/seen_sequences.bloom',
+                 capacity: int = 1_000_000, error_rate: float = 0.001):
+        """
+        Open (or create) a filter.
+
+        Args:
+            path: Filter file, or None for an in-memory filter
+            capacity: Items the filter is sized for when created
+            error_rate: Target false positive rate at capacity when created
+        """
+        self.path = path
+        if path is not None and os.path.exists(path):
+            self.bloom = BloomFilter.load(path)
+        else:
+            self.bloom = BloomFilter(capacity, error_rate)
+        self.skipped = {"cdr": 0, "binder": 0}
+        self._lock = threading.Lock()
+
+    def _check(self, kind: str, sequence: str) -> bool:
+        with self._lock:
+            seen = self.bloom.add(f"{kind}:{sequence}")
+            if seen:
+                self.skipped[kind] += 1
+        return seen
+
+    def seen_cdr(self, sequence: str) -> bool:
+        """Record a CDR and return True if it was produced before."""
+        return self._check("cdr", sequence)
+
+    def seen_binder(self, sequence: str) -> bool:
+        """Record an assembled antibody and return True if it was produced before."""
+        return self._check("binder", sequence)
+
+    def save(self):
+        """Persist the filter if it has a path."""
+        if self.path is not None:
+            with self._lock:
+                self.bloom.save(self.path)
+
+    def summary(self) -> Dict:
+        """Duplicates skipped in this session and the filter's false positive rate."""
+        with self._lock:
+            return {
+                "skipped_cdrs": self.skipped["cdr"],
+                "skipped_binders": self.skipped["binder"],
+                "items": self.bloom.items,
+                "false_positive_rate": self.bloom.false_positive_rate()
+            }
+
+
+def main():
+    """Inspect or merge seen-sequence filters."""
+    parser = argparse.ArgumentParser(description='Inspect or merge seen-sequence Bloom filters')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    info_parser = subparsers.add_parser('info', help='Show filter size and false positive rate')
+    info_parser.add_argument('path', help='Filter file')
+
+    merge_parser = subparsers.add_parser('merge', help='Merge filters into one file')
+    merge_parser.add_argument('output', help='Merged filter file')
+    merge_parser.add_argument('inputs', nargs='+', help='Filters to merge')
+    args = parser.parse_args()
+
+    if args.command == 'info':
+        bloom = BloomFilter.load(args.path)
+    else:
+        bloom = BloomFilter.load(args.inputs[0])
+        for path in args.inputs[1:]:
+            bloom.merge(BloomFilter.load(path))
+        bloom.save(args.output)
+
+    print(json.dumps({
+        "bits": bloom.num_bits,
+        "hashes": bloom.num_hashes,
+        "items": bloom.items,
+        "fill_ratio": round(bloom.fill_ratio(), 6),
+        "false_positive_rate": bloom.false_positive_rate()
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,16 +2,23 @@
 Module for generating antibody sequences using ProtGPT2.
 """
 
-from transformers import AutoTokenizer, AutoModelForCausalLM
 import torch
 import random
 import json
+import time
+import numpy as np
+from .generation_telemetry import GenerationTelemetry, generated_token_count
+from .onnx_engine import DEFAULT_MODEL_DIR, OnnxGenerationEngine
+from .model_cache import load_model, load_tokenizer
 
 class SequenceGenerator:
-    def __init__(self, config_path):
-        """Initialize the sequence generator with a configuration file."""
-        self.tokenizer = AutoTokenizer.from_pretrained("nferruz/ProtGPT2")
-        self.model = AutoModelForCausalLM.from_pretrained("nferruz/ProtGPT2")
+    def __init__(self, config_path, metrics_path=None, engine=None):
+        """Initialize the sequence generator with a configuration file.
+        
+        If metrics_path is given, generation telemetry is streamed to it as JSONL.
+        The inference engine ('torch' or 'onnx') is taken from the optional
+        "generation" section of the configuration unless engine is given.
+        """
         self.config_path = config_path
         
         # Load Celtic-specific parameters
@@ -19,27 +26,27 @@ class SequenceGenerator:
             config = json.load(f)
             self.celtic_params = config["populations"]["celtic"]["biophysical_params"]
             self.celtic_motifs = config["populations"]["celtic"]["binding_motifs"]
+            generation_config = config.get("generation", {})
+        
+        self.tokenizer = load_tokenizer("nferruz/ProtGPT2")
+        engine = engine or generation_config.get("engine", "torch")
+        if engine == "onnx":
+            self.model = None
+            self.onnx_engine = OnnxGenerationEngine(generation_config.get("onnx_model_dir", DEFAULT_MODEL_DIR))
+        else:
+            self.model = load_model("nferruz/ProtGPT2")
+            self.onnx_engine = None
+        
+        # Forward pass throughput, acceptance funnel and rejection reasons of the last run
+        self.telemetry = GenerationTelemetry(metrics_path)
 
     def _check_homopolymer(self, sequence, max_repeat=4):
         """Check for homopolymer repeats."""
-        for i in range(len(sequence) - max_repeat + 1):
-            if len(set(sequence[i:i + max_repeat])) == 1:
-                return True
-        return False
+        return bool(homopolymer_mask([sequence], max_repeat)[0])
     
     def _check_protein_realism(self, sequence):
         """Check protein sequence realism based on common patterns."""
-        # Check for basic protein patterns
-        rules = {
-            'proline_patterns': len([i for i in range(len(sequence)-1) if sequence[i:i+2] == 'PP']) <= 2,
-            'charged_spacing': not any(all(aa in 'KR' for aa in sequence[i:i+4]) for i in range(len(sequence)-3)),
-            'hydrophobic_balance': 0.2 <= len([aa for aa in sequence if aa in 'AILMFWV'])/len(sequence) <= 0.6,
-            'glycine_spacing': not any(all(aa == 'G' for aa in sequence[i:i+3]) for i in range(len(sequence)-2)),
-            'cysteine_pairs': sequence.count('C') % 2 == 0,  # Cysteines should appear in pairs
-            'charged_distribution': all(sequence[i:i+5].count('K') + sequence[i:i+5].count('R') <= 3 
-                                     for i in range(len(sequence)-4))
-        }
-        return all(rules.values())
+        return bool(realism_mask([sequence])[0])
 
     def _get_realistic_seed(self):
         """Generate a realistic seed sequence with Celtic properties."""
@@ -60,79 +67,147 @@ class SequenceGenerator:
         seed = random.choice(framework_segments) + random.choice(celtic_segments)
         return seed
 
-    def generate_sequences(self, num_sequences=5):
-        """Generate antibody sequences based on Celtic-optimized parameters with realism checks."""
+    def generate_sequences(self, num_sequences=5, batch_size=8):
+        """Generate antibody sequences based on Celtic-optimized parameters with realism checks.
+        
+        Each round samples a batch of continuations of one seed with
+        num_return_sequences and filters the whole batch at once. Every
+        sampled sequence counts as one attempt. Telemetry for the run is
+        available from self.telemetry afterwards.
+        """
         sequences = []
         max_attempts = num_sequences * 10  # Allow more attempts for quality sequences
         attempts = 0
+        self.telemetry.start_run()
         
         while len(sequences) < num_sequences and attempts < max_attempts:
             # Get a realistic seed sequence
             seed = self._get_realistic_seed()
             input_ids = self.tokenizer.encode(seed, return_tensors="pt")
+            num_samples = min(batch_size, max_attempts - attempts)
             
-            output = self.model.generate(
-                input_ids,
+            generation_kwargs = dict(
                 do_sample=True,
                 top_k=50,
                 top_p=0.92,
                 temperature=0.8,
                 max_length=120,
                 min_length=60,
+                num_return_sequences=num_samples,
                 pad_token_id=self.tokenizer.eos_token_id,
                 repetition_penalty=1.3,
                 no_repeat_ngram_size=3  # Prevent repetitive patterns
             )
             
-            sequence = self.tokenizer.decode(output[0], skip_special_tokens=True)
-            
-            # Skip if homopolymer or unrealistic patterns found
-            if self._check_homopolymer(sequence) or not self._check_protein_realism(sequence):
-                attempts += 1
-                continue
+            start = time.perf_counter()
+            if self.onnx_engine is not None:
+                outputs = self.onnx_engine.generate(input_ids.numpy(), **generation_kwargs)
+            else:
+                outputs = self.model.generate(input_ids, **generation_kwargs)
+            self.telemetry.record_forward(
+                time.perf_counter() - start,
+                generated_token_count(outputs, input_ids.shape[1], self.tokenizer.eos_token_id),
+                len(outputs)
+            )
+            batch = self.tokenizer.batch_decode(outputs, skip_special_tokens=True)
             
-            # Calculate sequence properties
-            aromatic_aas = ['F', 'W', 'Y']
-            hydrophobic_aas = ['A', 'V', 'I', 'L', 'M', 'F', 'W', 'C']
-            positive_aas = ['R', 'K', 'H']
-            negative_aas = ['D', 'E']
+            # Skip homopolymers and unrealistic patterns
+            with self.telemetry.timed("quality_filters"):
+                homopolymers = homopolymer_mask(batch)
+                realistic = realism_mask(batch)
             
-            seq_len = len(sequence)
-            aromatic_content = sum(sequence.count(aa) for aa in aromatic_aas) / seq_len * 100
-            hydrophobic_content = sum(sequence.count(aa) for aa in hydrophobic_aas) / seq_len * 100
-            net_charge = (sum(sequence.count(aa) for aa in positive_aas) - 
-                         sum(sequence.count(aa) for aa in negative_aas))
+            # Calculate sequence properties for the whole batch
+            codes, lengths = _encode_batch(batch)
+            seq_len = np.maximum(lengths, 1)
+            aromatic_content = np.isin(codes, _codes('FWY')).sum(axis=1) / seq_len * 100
+            hydrophobic_content = np.isin(codes, _codes('AVILMFWC')).sum(axis=1) / seq_len * 100
+            net_charge = (np.isin(codes, _codes('RKH')).sum(axis=1) -
+                          np.isin(codes, _codes('DE')).sum(axis=1))
             
             # Check Celtic criteria with protein realism
-            criteria_met = 0
-            if (self.celtic_params["aromatic_content"]["min"] <= aromatic_content <= 
-                self.celtic_params["aromatic_content"]["max"]):
-                criteria_met += 1
-            if (self.celtic_params["hydrophobic_content"]["min"] <= hydrophobic_content <= 
-                self.celtic_params["hydrophobic_content"]["max"]):
-                criteria_met += 1
-            if (self.celtic_params["net_charge"]["min"] <= net_charge <= 
-                self.celtic_params["net_charge"]["max"]):
-                criteria_met += 1
+            criteria_met = np.zeros(len(batch), dtype=int)
+            for values, param in ((aromatic_content, "aromatic_content"),
+                                  (hydrophobic_content, "hydrophobic_content"),
+                                  (net_charge, "net_charge")):
+                criteria_met += ((self.celtic_params[param]["min"] <= values) &
+                                 (values <= self.celtic_params[param]["max"]))
             
-            # Accept sequences meeting minimum criteria
-            meets_realism = self._check_protein_realism(sequence)
-            no_homopolymer = not self._check_homopolymer(sequence)
-            
-            quality_score = criteria_met + (1 if meets_realism else 0) + (1 if no_homopolymer else 0)
-            
-            # Accept if good quality or running out of attempts
-            if quality_score >= 3 or (attempts > max_attempts * 0.8 and not sequences):
-                sequences.append(sequence)
-            
-            attempts += 1
-            
-            # Break early if we have enough sequences
-            if len(sequences) >= num_sequences:
-                break
-            
-            attempts += 1
-            
-            attempts += 1
+            for i, sequence in enumerate(batch):
+                attempts += 1
+                if homopolymers[i] or not realistic[i]:
+                    self.telemetry.record_stage("realism", "homopolymer" if homopolymers[i] else "realism")
+                    continue
+                self.telemetry.record_stage("realism")
+                
+                # Accept if good quality or running out of attempts
+                if criteria_met[i] >= 1 or (attempts > max_attempts * 0.8 and not sequences):
+                    sequences.append(sequence)
+                    self.telemetry.record_stage("celtic_criteria")
+                else:
+                    self.telemetry.record_stage("celtic_criteria", "celtic_criteria")
+                
+                # Break early if we have enough sequences
+                if len(sequences) >= num_sequences:
+                    break
         
-        return sequences
\ No newline at end of file
+        self.telemetry.finish_run()
+        return sequences
+
+
+def _codes(residues):
+    """Byte codes of residue letters for comparisons against encoded batches."""
+    return np.frombuffer(residues.encode('ascii'), dtype=np.uint8)
+
+
+def _encode_batch(sequences):
+    """Encode sequences as a zero-padded uint8 matrix plus their lengths."""
+    lengths = np.array([len(seq) for seq in sequences], dtype=int)
+    codes = np.zeros((len(sequences), max(lengths, default=0)), dtype=np.uint8)
+    for i, seq in enumerate(sequences):
+        codes[i, :len(seq)] = np.frombuffer(seq.encode('ascii', 'replace'), dtype=np.uint8)
+    return codes, lengths
+
+
+def _window_sums(mask, width):
+    """Sum a boolean matrix over every full sliding window of the given width."""
+    totals = np.zeros((mask.shape[0], mask.shape[1] + 1), dtype=int)
+    np.cumsum(mask, axis=1, out=totals[:, 1:])
+    if mask.shape[1] < width:
+        return totals[:, :0]
+    return totals[:, width:] - totals[:, :-width]
+
+
+def homopolymer_mask(sequences, max_repeat=4):
+    """Flag sequences containing a run of max_repeat or more identical residues."""
+    codes, lengths = _encode_batch(sequences)
+    if max_repeat <= 1:
+        return lengths > 0
+    same_as_next = (codes[:, 1:] == codes[:, :-1]) & (codes[:, 1:] != 0)
+    return (_window_sums(same_as_next, max_repeat - 1) == max_repeat - 1).any(axis=1)
+
+
+def realism_mask(sequences):
+    """
+    Check protein realism rules for a batch of sequences at once.
+    
+    Rules: at most two PP dipeptides, no run of four K/R, hydrophobic
+    (AILMFWV) fraction between 0.2 and 0.6, no GGG, an even number of
+    cysteines and at most three K/R in any five-residue window.
+    
+    Returns:
+        Boolean array, True for sequences passing every rule
+    """
+    codes, lengths = _encode_batch(sequences)
+    charged = np.isin(codes, _codes('KR'))
+    proline = codes == ord('P')
+    hydrophobic_fraction = np.isin(codes, _codes('AILMFWV')).sum(axis=1) / np.maximum(lengths, 1)
+    
+    rules = [
+        (_window_sums(proline, 2) == 2).sum(axis=1) <= 2,  # proline patterns
+        ~(_window_sums(charged, 4) == 4).any(axis=1),  # charged spacing
+        (0.2 <= hydrophobic_fraction) & (hydrophobic_fraction <= 0.6),  # hydrophobic balance
+        ~(_window_sums(codes == ord('G'), 3) == 3).any(axis=1),  # glycine spacing
+        (codes == ord('C')).sum(axis=1) % 2 == 0,  # cysteines should appear in pairs
+        ~(_window_sums(charged, 5) > 3).any(axis=1)  # charged distribution
+    ]
+    return np.logical_and.reduce(rules) & (lengths > 0)
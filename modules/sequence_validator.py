@@ -3,33 +3,37 @@ Sequence validation module for comparing generated antibodies against known ther
 """
 
 import json
-import os
 from typing import Dict, List, Tuple
 import numpy as np
 from Bio.SeqUtils.ProtParam import ProteinAnalysis
+from .framework_anchors import FrameworkAnchorIndex
+from .similarity_service import get_similarity_service
 
 class TherapeuticAntibodyValidator:
-    def __init__(self, validation_data_path: str = None):
+    def __init__(self, validation_data_path: str = None, similarity: str = 'prefix'):
         """
         Initialize validator with therapeutic antibody dataset.
         
         Args:
-            validation_data_path: Path to validation dataset JSON file
+            validation_data_path: Path to validation dataset JSON file or compiled
+                reference database (.refdb)
+            similarity: Similarity backend, 'prefix' for position-by-position
+                comparison or 'alignment' for banded Smith-Waterman with BLOSUM62
         """
-        if validation_data_path is None:
-            validation_data_path = os.path.join(
-                os.path.dirname(__file__), 
-                'data', 
-                'therapeutic_antibodies.json'
-            )
-        
-        with open(validation_data_path, 'r') as f:
-            self.validation_data = json.load(f)
+        # Dataset and reference index are loaded once per process and shared
+        self.similarity_service = get_similarity_service(validation_data_path, similarity)
+        self.validation_data = self.similarity_service.data
         
         # Extract validation metrics and data
         self.metrics = self.validation_data['validation_metrics']
         self.antibodies = self.validation_data['therapeutic_antibodies']
         
+        # Reference chains pre-encoded for one-pass similarity search
+        self.reference_index = self.similarity_service.index
+        
+        # Framework anchors of all germline templates for CDR extraction
+        self.anchor_index = FrameworkAnchorIndex.from_library()
+        
         # Default configuration
         self.default_config = {
             "sequence_properties": {
@@ -65,49 +69,22 @@ class TherapeuticAntibodyValidator:
         if not hasattr(self, 'config'):
             self.config = {}
         
-    def extract_cdrs(self, sequence: str) -> Dict[str, List[str]]:
+    def extract_cdrs(self, sequence: str, chain: str = None) -> Dict[str, str]:
         """
-        Extract CDRs from a sequence based on framework region patterns.
+        Extract CDRs from a sequence by locating its framework regions.
+        
+        Frameworks of every germline template are matched approximately, so
+        mutated frameworks and any germline in the template library are found.
         
         Args:
-            sequence: Full antibody sequence
+            sequence: Heavy or light chain sequence
+            chain: 'heavy_chain' or 'light_chain'; detected from the frameworks if omitted
             
         Returns:
-            Dictionary containing CDR sequences
+            Dictionary containing CDR sequences; empty when not identified
         """
-        # Framework region patterns (simplified version)
-        fr_patterns = {
-            'FR1': 'EVQLVESGGGLVQPGGSLRLSCAAS',
-            'FR2': 'WVRQAPGKGLEWV',
-            'FR3': 'RFTISRDNSKNTLYLQMNSLRAEDTAVYYC',
-            'FR4': 'WGQGTLVTVSS'
-        }
-        
-        cdrs = {
-            'cdr1': '',
-            'cdr2': '',
-            'cdr3': ''
-        }
-        
-        try:
-            # Find FR1
-            fr1_end = sequence.find(fr_patterns['FR1']) + len(fr_patterns['FR1'])
-            # Find FR2
-            fr2_start = sequence.find(fr_patterns['FR2'])
-            # Find FR3
-            fr3_start = sequence.find(fr_patterns['FR3'])
-            # Find FR4
-            fr4_start = sequence.find(fr_patterns['FR4'])
-            
-            if all(x != -1 for x in [fr1_end, fr2_start, fr3_start, fr4_start]):
-                cdrs['cdr1'] = sequence[fr1_end:fr2_start]
-                cdrs['cdr2'] = sequence[fr2_start + len(fr_patterns['FR2']):fr3_start]
-                cdrs['cdr3'] = sequence[fr3_start + len(fr_patterns['FR3']):fr4_start]
-        except Exception:
-            # If pattern matching fails, return empty CDRs
-            pass
-            
-        return cdrs
+        chain_type = {'heavy_chain': 'VH', 'light_chain': 'VL'}.get(chain)
+        return self.anchor_index.extract_cdrs(sequence, chain_type)
         
     def calculate_sequence_similarity(self, seq1: str, seq2: str) -> float:
         """
@@ -120,48 +97,7 @@ class TherapeuticAntibodyValidator:
         Returns:
             Similarity score between 0 and 1
         """
-        # Define groups of similar amino acids
-        similar_groups = [
-            set('ILVM'),           # Aliphatic
-            set('FYW'),           # Aromatic
-            set('KRH'),           # Basic
-            set('DE'),            # Acidic
-            set('STNQ'),          # Polar
-            set('AG'),            # Small
-            set('C'),             # Cysteine
-            set('P')              # Proline
-        ]
-        
-        def aa_similarity(aa1: str, aa2: str) -> float:
-            """Calculate similarity score between two amino acids."""
-            if aa1 == aa2:
-                return 1.0
-            for group in similar_groups:
-                if aa1 in group and aa2 in group:
-                    return 0.5
-            return 0.0
-        
-        # Get the length of the shorter sequence
-        min_length = min(len(seq1), len(seq2))
-        
-        # Calculate similarity scores for the overlapping region
-        similarity_scores = [
-            aa_similarity(aa1, aa2) 
-            for aa1, aa2 in zip(seq1[:min_length], seq2[:min_length])
-        ]
-        
-        # Add penalties for length difference
-        length_difference = abs(len(seq1) - len(seq2))
-        length_penalty = length_difference * 0.1
-        
-        # Calculate final score
-        if not similarity_scores:
-            return 0.0
-            
-        raw_score = sum(similarity_scores) / len(similarity_scores)
-        final_score = max(0.0, min(1.0, raw_score - length_penalty))
-        
-        return final_score
+        return self.similarity_service.chain_similarity(seq1, seq2)
         
     def find_similar_antibodies(self, sequence: Dict[str, str], threshold: float = 0.7) -> List[Dict]:
         """
@@ -174,33 +110,7 @@ class TherapeuticAntibodyValidator:
         Returns:
             List of similar antibodies with similarity scores
         """
-        similar_antibodies = []
-        
-        for antibody in self.antibodies:
-            heavy_similarity = self.calculate_sequence_similarity(
-                sequence['heavy_chain'],
-                antibody['sequence']['heavy_chain']
-            )
-            
-            light_similarity = self.calculate_sequence_similarity(
-                sequence['light_chain'],
-                antibody['sequence']['light_chain']
-            )
-            
-            # Average similarity score weighted slightly towards heavy chain
-            overall_similarity = (0.6 * heavy_similarity + 0.4 * light_similarity)
-            
-            if overall_similarity >= threshold:
-                similar_antibodies.append({
-                    'name': antibody['name'],
-                    'similarity_score': round(overall_similarity, 3),
-                    'heavy_chain_similarity': round(heavy_similarity, 3),
-                    'light_chain_similarity': round(light_similarity, 3),
-                    'target': antibody['target'],
-                    'antibody_type': antibody['antibody_type']
-                })
-                
-        return sorted(similar_antibodies, key=lambda x: x['similarity_score'], reverse=True)
+        return self.reference_index.find_similar(sequence, threshold)
         
     def validate_sequence_metrics(self, sequence: Dict[str, str]) -> Dict:
         """
@@ -234,7 +144,7 @@ class TherapeuticAntibodyValidator:
         
         # Extract and validate CDRs
         for chain in ['heavy_chain', 'light_chain']:
-            cdrs = self.extract_cdrs(sequence[chain])
+            cdrs = self.extract_cdrs(sequence[chain], chain)
             results['metrics'][f'{chain}_cdrs'] = cdrs
             
             for cdr_name, cdr_seq in cdrs.items():
@@ -266,18 +176,19 @@ class TherapeuticAntibodyValidator:
         return results
 
 def validate_generated_sequences(sequences: List[Dict[str, str]], 
-                              output_file: str = None) -> Dict:
+                              output_file: str = None, similarity: str = 'prefix') -> Dict:
     """
     Validate a set of generated sequences against therapeutic antibody dataset.
     
     Args:
         sequences: List of sequences to validate
         output_file: Optional path to save validation results
+        similarity: Similarity backend, 'prefix' or 'alignment'
         
     Returns:
         Dictionary containing validation results
     """
-    validator = TherapeuticAntibodyValidator()
+    validator = TherapeuticAntibodyValidator(similarity=similarity)
     
     results = {
         'validated_sequences': [],
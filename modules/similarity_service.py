@@ -0,0 +1,162 @@
+"""
+Shared reference similarity service.
+
+Generators and validators all compare sequences against the same
+therapeutic antibody reference set. The service loads and indexes that set
+once per process and backend, and every component asks it for scores.
+
+References use the chain-split schema of therapeutic_antibodies.json
+(sequence.heavy_chain / sequence.light_chain). Queries may be chain pairs,
+scored with the usual 0.6/0.4 heavy/light weighting, or the single VH+VL
+strings the generators assemble, which are scored against the concatenated
+reference chains. Best scores are memoized per candidate hash; each service
+serves one backend, so the memo is effectively keyed by (candidate, backend).
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from functools import cached_property
+from typing import Dict, List, Optional, Union
+
+from .local_alignment import SIMILARITY_BACKENDS, LocalAligner
+from .reference_db import SUFFIX as REFERENCE_DB_SUFFIX, ReferenceDatabase
+from .reference_index import AntibodyReferenceIndex, ReferenceIndex, load_reference_panel, sequence_similarity
+
+DEFAULT_REFERENCE_FILE = os.path.join(os.path.dirname(__file__), 'data', 'therapeutic_antibodies.json')
+
+# Minimum best score of an accepted generated antibody, per backend. Assembled
+# from the germline templates, candidates with therapeutic CDRs score at least
+# 0.7 by alignment and random CDRs at most 0.66; the prefix rule penalizes the
+# length differences of assembled antibodies, which puts both groups lower.
+ACCEPTANCE_THRESHOLDS = {'prefix': 0.4, 'alignment': 0.7}
+
+# Loaded reference files and services of this process
+_reference_data: Dict[str, Dict] = {}
+_services: Dict[tuple, "ReferenceSimilarityService"] = {}
+
+
+def load_reference_data(path: Optional[str] = None) -> Dict:
+    """
+    Reference data file, loaded once per process.
+
+    Args:
+        path: therapeutic_antibodies.json-style file, a compiled reference
+            database (.refdb), or an OAS paired CSV panel; defaults to the
+            bundled therapeutic antibodies
+
+    Returns:
+        Dictionary with therapeutic_antibodies and, for the JSON and database
+        formats, validation_metrics and metadata; databases also provide
+        encoded_chains, and their antibodies are decoded on access
+    """
+    path = os.path.abspath(path or DEFAULT_REFERENCE_FILE)
+    if path not in _reference_data:
+        if path.endswith(REFERENCE_DB_SUFFIX):
+            _reference_data[path] = ReferenceDatabase(path).reference_data()
+        elif path.endswith('.json'):
+            with open(path, 'r') as f:
+                _reference_data[path] = json.load(f)
+        else:
+            _reference_data[path] = {'therapeutic_antibodies': load_reference_panel(path)}
+    return _reference_data[path]
+
+
+class ReferenceSimilarityService:
+    """Indexed reference antibodies with memoized best-similarity lookups for one backend."""
+
+    def __init__(self, data: Dict, backend: str = 'prefix', cache_size: int = 100000):
+        """
+        Args:
+            data: Reference data with therapeutic_antibodies in the chain-split
+                format and optionally their encoded_chains, as returned by
+                load_reference_data
+            backend: 'prefix' for position-by-position similarity or 'alignment'
+                for banded Smith-Waterman
+            cache_size: Candidate scores kept, least recently used evicted first
+        """
+        if backend not in SIMILARITY_BACKENDS:
+            raise ValueError(f"Unknown similarity backend: {backend}")
+        self.data = data
+        self.antibodies = data['therapeutic_antibodies']
+        self.backend = backend
+        self.acceptance_threshold = ACCEPTANCE_THRESHOLDS[backend]
+        self.aligner = LocalAligner() if backend == 'alignment' else None
+        chain_index = self.aligner.reference_index if self.aligner is not None else ReferenceIndex
+        self._chain_index = chain_index
+        self.index = AntibodyReferenceIndex(self.antibodies, chain_index=chain_index,
+                                            encoded=data.get('encoded_chains'))
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        # Generation service requests share the service from several threads
+        self._lock = threading.Lock()
+
+    @cached_property
+    def paired(self) -> ReferenceIndex:
+        """Index of the concatenated heavy and light reference chains, built on first use."""
+        return self._chain_index([heavy + light for heavy, light in
+                                  zip(self.index.heavy.sequences, self.index.light.sequences)])
+
+    def chain_similarity(self, seq1: str, seq2: str) -> float:
+        """Similarity of two single sequences with this backend."""
+        if self.aligner is not None:
+            return self.aligner.similarity(seq1, seq2)
+        return sequence_similarity(seq1, seq2)
+
+    def find_similar(self, sequence: Dict[str, str], threshold: float = 0.7) -> List[Dict]:
+        """Reference antibodies similar to a heavy/light chain pair, most similar first."""
+        return self.index.find_similar(sequence, threshold)
+
+    def _key(self, sequence: Union[str, Dict[str, str]]) -> bytes:
+        text = sequence if isinstance(sequence, str) else \
+            f"{sequence['heavy_chain']}\0{sequence['light_chain']}"
+        return hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+    def best_score(self, sequence: Union[str, Dict[str, str]]) -> float:
+        """
+        Highest similarity of a candidate to any reference antibody.
+
+        Args:
+            sequence: Heavy/light chain pair, or an assembled VH+VL sequence
+
+        Returns:
+            Similarity between 0 and 1; 0.0 without references
+        """
+        key = self._key(sequence)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        if not self.antibodies:
+            score = 0.0
+        elif isinstance(sequence, str):
+            score = float(self.paired.similarities(sequence).max())
+        else:
+            _, overall, _, _ = self.index.scores(sequence)
+            score = float(overall.max()) if len(overall) else 0.0
+
+        with self._lock:
+            self._cache[key] = score
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return score
+
+
+def get_similarity_service(path: Optional[str] = None, backend: str = 'prefix') -> ReferenceSimilarityService:
+    """
+    The process-wide similarity service of a reference file and backend.
+
+    Args:
+        path: Reference data file; defaults to the bundled therapeutic antibodies
+        backend: 'prefix' or 'alignment'
+
+    Returns:
+        Service shared by every caller with the same file and backend
+    """
+    key = (os.path.abspath(path or DEFAULT_REFERENCE_FILE), backend)
+    if key not in _services:
+        _services[key] = ReferenceSimilarityService(load_reference_data(path), backend)
+    return _services[key]
@@ -0,0 +1,537 @@
+"""
+Speculative CDR sampling with an n-gram draft model.
+
+ProtGPT2 forward passes dominate CDR sampling on CPU. Here a cheap n-gram
+model over token ids, trained on known CDRs, proposes a few tokens for
+every row, and one ProtGPT2 pass scores all of them. Each draft token is
+kept with probability min(1, p/q), where p is the target distribution
+after all logits processors and q the draft distribution, and the first
+rejected token is resampled from the normalized residual max(0, p - q).
+This leaves the sampling distribution of ProtGPT2 unchanged while a
+single pass can emit up to ``num_draft_tokens + 1`` tokens per row.
+
+Rows accept different numbers of draft tokens, so all rows stay in one
+batch: key/value slots of rejected drafts are kept in the cache but
+masked out of attention, and position ids count only accepted tokens.
+
+Usage:
+    python -m modules.speculative_decoding train --output models/cdr_draft_ngram.json
+    python -m modules.speculative_decoding benchmark --draft models/cdr_draft_ngram.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import torch
+from transformers import DynamicCache
+
+from .onnx_engine import process_logits
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DRAFT_PATH = 'models/cdr_draft_ngram.json'
+DEFAULT_ANTIBODY_FILE = os.path.join(os.path.dirname(__file__), 'data', 'therapeutic_antibodies.json')
+
+# Context padding before the first generated token
+_START = -1
+
+
+class NgramDraftModel:
+    """Interpolated (Witten-Bell) n-gram model over token ids."""
+
+    def __init__(self, vocab_size: int, order: int = 3):
+        """
+        Args:
+            vocab_size: Size of the token distributions returned
+            order: Longest n-gram used, including the predicted token
+        """
+        self.vocab_size = vocab_size
+        self.order = order
+        # counts[n][context of n tokens][token] -> count
+        self.counts: List[Dict[Tuple[int, ...], Dict[int, int]]] = [dict() for _ in range(order)]
+        self._cache: Dict[Tuple[int, ...], Tuple[np.ndarray, np.ndarray]] = {}
+
+    def train(self, sequences: Iterable[Sequence[int]], eos_token_id: Optional[int] = None) -> "NgramDraftModel":
+        """
+        Count n-grams in token id sequences.
+
+        Args:
+            sequences: Token ids of one CDR each
+            eos_token_id: Appended to every sequence so the draft learns where CDRs end
+
+        Returns:
+            The model itself
+        """
+        for tokens in sequences:
+            padded = [_START] * (self.order - 1) + list(tokens)
+            if eos_token_id is not None:
+                padded.append(eos_token_id)
+            for i in range(self.order - 1, len(padded)):
+                for n in range(self.order):
+                    table = self.counts[n].setdefault(tuple(padded[i - n:i]), {})
+                    table[padded[i]] = table.get(padded[i], 0) + 1
+        self._cache.clear()
+        return self
+
+    def _context_key(self, context: Sequence[int]) -> Tuple[int, ...]:
+        if self.order == 1:
+            return ()
+        padded = [_START] * (self.order - 1) + list(context[-(self.order - 1):])
+        return tuple(padded[-(self.order - 1):])
+
+    def _distribution(self, key: Tuple[int, ...]) -> Tuple[np.ndarray, np.ndarray]:
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+        if not self.counts[0]:
+            raise ValueError("The draft model has not been trained")
+
+        dist = None
+        for n in range(self.order):
+            table = self.counts[n].get(key[len(key) - n:] if n else ())
+            if not table:
+                continue
+            total = sum(table.values())
+            ml = np.zeros(self.vocab_size)
+            ml[np.fromiter(table.keys(), dtype=np.int64)] = np.fromiter(table.values(), dtype=np.float64) / total
+            if dist is None:
+                dist = ml
+            else:
+                weight = total / (total + len(table))
+                dist = weight * ml + (1 - weight) * dist
+
+        cached = (dist, np.cumsum(dist))
+        self._cache[key] = cached
+        return cached
+
+    def distribution(self, context: Sequence[int]) -> np.ndarray:
+        """Next-token probabilities after the generated tokens in context."""
+        return self._distribution(self._context_key(context))[0]
+
+    def propose(self, context: Sequence[int], num_tokens: int) -> Tuple[List[int], List[np.ndarray]]:
+        """
+        Sample draft tokens autoregressively.
+
+        Args:
+            context: Tokens generated so far, prompt excluded
+            num_tokens: Number of tokens to draft
+
+        Returns:
+            Tuple of (draft tokens, distribution each token was sampled from)
+        """
+        context = list(context)
+        tokens, dists = [], []
+        for _ in range(num_tokens):
+            dist, cumulative = self._distribution(self._context_key(context))
+            token = int(np.searchsorted(cumulative, np.random.random_sample() * cumulative[-1], side='right'))
+            token = min(token, self.vocab_size - 1)
+            tokens.append(token)
+            dists.append(dist)
+            context.append(token)
+        return tokens, dists
+
+    def save(self, path: str):
+        """Write the n-gram counts as JSON."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({
+                'vocab_size': self.vocab_size,
+                'order': self.order,
+                'counts': [
+                    [[list(context), [[token, count] for token, count in table.items()]]
+                     for context, table in level.items()]
+                    for level in self.counts
+                ]
+            }, f)
+
+    @classmethod
+    def load(cls, path: str) -> "NgramDraftModel":
+        """Read a model written by save()."""
+        with open(path) as f:
+            data = json.load(f)
+        model = cls(data['vocab_size'], data['order'])
+        model.counts = [
+            {tuple(context): {token: count for token, count in table} for context, table in level}
+            for level in data['counts']
+        ]
+        return model
+
+    @classmethod
+    def from_sequences(cls, tokenizer, sequences: Iterable[str], order: int = 3) -> "NgramDraftModel":
+        """Train a draft model on amino acid sequences tokenized like generated CDRs."""
+        token_ids = [tokenizer(seq, add_special_tokens=False)["input_ids"] for seq in sequences]
+        return cls(len(tokenizer), order).train(token_ids, tokenizer.eos_token_id)
+
+
+def training_cdrs(antibody_file: str = DEFAULT_ANTIBODY_FILE, cdr_library=None) -> List[str]:
+    """
+    Collect CDRs to train the draft model on.
+
+    Args:
+        antibody_file: Therapeutic antibody dataset with per-chain cdr_regions
+        cdr_library: Optional CDRLibrary of CDRs accepted in earlier runs
+
+    Returns:
+        CDR sequences
+    """
+    cdrs = []
+    if antibody_file and os.path.exists(antibody_file):
+        with open(antibody_file) as f:
+            antibodies = json.load(f).get('therapeutic_antibodies', [])
+        for antibody in antibodies:
+            for chain in antibody.get('cdr_regions', {}).values():
+                cdrs.extend(chain.values())
+    if cdr_library is not None:
+        for chain in ('VH', 'VL'):
+            for position in (1, 2, 3):
+                cdrs.extend(record['sequence'] for record in cdr_library.query(chain, position))
+    return cdrs
+
+
+def load_or_train_draft(tokenizer, path: Optional[str] = DEFAULT_DRAFT_PATH, cdr_library=None,
+                        order: int = 3) -> NgramDraftModel:
+    """
+    Load the draft model, training and saving it first if it does not exist.
+
+    Args:
+        tokenizer: Tokenizer of the target model
+        path: Draft model file, or None to train in memory only
+        cdr_library: Optional CDRLibrary added to the training CDRs
+        order: n-gram order when training
+
+    Returns:
+        Draft model
+    """
+    if path is not None and os.path.exists(path):
+        return NgramDraftModel.load(path)
+    draft = NgramDraftModel.from_sequences(tokenizer, training_cdrs(cdr_library=cdr_library), order)
+    if path is not None:
+        draft.save(path)
+    return draft
+
+
+def _banned_ngram_tokens(tokens: List[int], size: int) -> List[int]:
+    """Tokens that would complete an n-gram already present in tokens."""
+    if len(tokens) + 1 < size:
+        return []
+    prefix = tokens[len(tokens) - size + 1:]
+    return [tokens[i + size - 1] for i in range(len(tokens) - size + 1) if tokens[i:i + size - 1] == prefix]
+
+
+def _sample(probs: np.ndarray) -> int:
+    cumulative = np.cumsum(probs)
+    token = int(np.searchsorted(cumulative, np.random.random_sample() * cumulative[-1], side='right'))
+    return min(token, len(probs) - 1)
+
+
+class SpeculativeDecoder:
+    """Sample continuations of a prompt with draft tokens verified by the target model."""
+
+    def __init__(self, model, draft: NgramDraftModel, num_draft_tokens: int = 4):
+        """
+        Args:
+            model: Hugging Face causal language model
+            draft: Draft model proposing tokens
+            num_draft_tokens: Tokens drafted per row and verification pass
+        """
+        self.model = model
+        self.draft = draft
+        self.num_draft_tokens = num_draft_tokens
+        self.stats = {"passes": 0, "row_passes": 0, "drafted": 0, "accepted": 0, "tokens": 0}
+
+    def reset_stats(self):
+        """Zero the verification counters."""
+        self.stats = dict.fromkeys(self.stats, 0)
+
+    def summary(self) -> Dict:
+        """Draft acceptance rate and tokens emitted per row and verification pass."""
+        stats = self.stats
+        return {
+            **stats,
+            "acceptance_rate": round(stats["accepted"] / stats["drafted"], 3) if stats["drafted"] else 0.0,
+            "tokens_per_pass": round(stats["tokens"] / stats["row_passes"], 3) if stats["row_passes"] else 0.0
+        }
+
+    def _target_probs(self, logits: np.ndarray, prefixes: List[List[int]], do_sample: bool,
+                      temperature: float, top_k: int, top_p: float, repetition_penalty: float,
+                      no_repeat_ngram_size: int, min_length: int, eos_token_id: int,
+                      suppress_tokens: Optional[np.ndarray]) -> np.ndarray:
+        """Target distributions for every (row, position) prefix, after all logits processors."""
+        logits = logits.astype(np.float32, copy=True)
+        for i, prefix in enumerate(prefixes):
+            # No-repeat n-gram and min-length bans commute with the repetition penalty
+            if no_repeat_ngram_size:
+                banned = _banned_ngram_tokens(prefix, no_repeat_ngram_size)
+                if banned:
+                    logits[i, banned] = -np.inf
+            if len(prefix) < min_length:
+                logits[i, eos_token_id] = -np.inf
+
+        # Pad prefixes with their own first token; duplicates do not change the repetition penalty
+        width = max(len(prefix) for prefix in prefixes)
+        sequences = np.array([[prefix[0]] * (width - len(prefix)) + prefix for prefix in prefixes])
+        scores = process_logits(
+            logits, sequences, temperature, top_k if do_sample else 0, top_p if do_sample else 1.0,
+            repetition_penalty, suppress_tokens=suppress_tokens
+        )
+        if not do_sample:
+            probs = np.zeros_like(scores)
+            probs[np.arange(len(scores)), scores.argmax(axis=-1)] = 1.0
+            return probs
+        scores = scores - scores.max(axis=-1, keepdims=True)
+        probs = np.exp(scores)
+        return probs / probs.sum(axis=-1, keepdims=True)
+
+    def generate(self, input_ids, num_return_sequences: int = 1, max_new_tokens: Optional[int] = None,
+                 max_length: Optional[int] = None, min_length: int = 0, do_sample: bool = True,
+                 top_k: int = 50, top_p: float = 1.0, temperature: float = 1.0,
+                 repetition_penalty: float = 1.0, no_repeat_ngram_size: int = 0,
+                 pad_token_id: Optional[int] = None, eos_token_id: Optional[int] = None,
+                 max_residues: Optional[int] = None, residue_counts=None,
+                 suppress_tokens=None, **unused) -> torch.Tensor:
+        """
+        Sample continuations of a single prompt.
+
+        Takes the same sampling arguments as ``OnnxGenerationEngine.generate``;
+        beam-search-only arguments such as length_penalty are ignored.
+
+        Args:
+            input_ids: Prompt token ids, shape (1, length) or (length,)
+            num_return_sequences: Number of sequences to sample
+            max_new_tokens: Maximum number of generated tokens
+            max_length: Maximum total length, used if max_new_tokens is not set
+            min_length: Total length below which eos is suppressed
+            do_sample: Sample if True, otherwise decode greedily
+            top_k: Top-k filtering; 0 disables
+            top_p: Nucleus filtering; 1.0 disables
+            temperature: Softmax temperature
+            repetition_penalty: Repetition penalty
+            no_repeat_ngram_size: Ban repeats of n-grams of this size; 0 disables
+            pad_token_id: Padding token for rows that finished early
+            eos_token_id: End of sequence token; defaults to the model's
+            max_residues: Stop a row once its generated tokens contain this many residues
+            residue_counts: Residues per token id, required with max_residues
+            suppress_tokens: Token ids that are never sampled
+
+        Returns:
+            Tensor of shape (num_return_sequences, length) with prompt and
+            generated tokens, padded with pad_token_id
+        """
+        prompt = torch.as_tensor(input_ids, dtype=torch.long).reshape(1, -1)
+        prompt_length = prompt.shape[1]
+        if max_new_tokens is None:
+            max_new_tokens = (max_length or prompt_length + 20) - prompt_length
+        eos_token_id = eos_token_id if eos_token_id is not None else self.model.config.eos_token_id
+        pad_token_id = pad_token_id if pad_token_id is not None else eos_token_id
+        if residue_counts is not None:
+            residue_counts = np.asarray(residue_counts)
+        if suppress_tokens is not None:
+            suppress_tokens = np.asarray(suppress_tokens, dtype=np.int64)
+        device = self.model.device
+
+        # Encode the prompt once, all but its last token, which is fed with the first drafts
+        rows = num_return_sequences
+        past = DynamicCache()
+        with torch.no_grad():
+            if prompt_length > 1:
+                past = self.model(prompt[:, :-1].to(device), past_key_values=past, use_cache=True).past_key_values
+        if rows > 1:
+            past.batch_repeat_interleave(rows)
+
+        prompt_tokens = prompt[0].tolist()
+        sequences = [list(prompt_tokens) for _ in range(rows)]
+        generated = [[] for _ in range(rows)]
+        residues = [0] * rows
+        pending = [prompt_tokens[-1]] * rows  # Sampled but not yet in the cache
+        positions = [prompt_length - 1] * rows
+        attention = torch.ones(rows, prompt_length - 1, dtype=torch.long)
+        active = list(range(rows))
+
+        while active:
+            remaining = min(max_new_tokens - len(generated[row]) for row in active)
+            num_drafts = max(0, min(self.num_draft_tokens, remaining - 1))
+            proposals = [self.draft.propose(generated[row], num_drafts) for row in active]
+
+            block = num_drafts + 1
+            step_ids = torch.tensor([[pending[row]] + drafts for row, (drafts, _) in zip(active, proposals)])
+            step_positions = torch.tensor([[positions[row] + i for i in range(block)] for row in active])
+            attention = torch.cat([attention, torch.ones(len(active), block, dtype=torch.long)], dim=1)
+            with torch.no_grad():
+                outputs = self.model(
+                    step_ids.to(device), attention_mask=attention.to(device),
+                    position_ids=step_positions.to(device), past_key_values=past, use_cache=True
+                )
+            past = outputs.past_key_values
+            logits = outputs.logits.float().cpu().numpy()
+
+            prefixes = [
+                sequences[row] + drafts[:i]
+                for row, (drafts, _) in zip(active, proposals) for i in range(block)
+            ]
+            probs = self._target_probs(
+                logits.reshape(-1, logits.shape[-1]), prefixes, do_sample, temperature, top_k, top_p,
+                repetition_penalty, no_repeat_ngram_size, min_length, eos_token_id, suppress_tokens
+            ).reshape(len(active), block, -1)
+
+            keep = []
+            for index, (row, (drafts, dists)) in enumerate(zip(active, proposals)):
+                accepted = 0
+                for i, token in enumerate(drafts):
+                    p, q = probs[index, i], dists[i]
+                    if np.random.random_sample() * q[token] < p[token]:
+                        accepted += 1
+                        continue
+                    residual = np.maximum(p - np.pad(q, (0, max(0, len(p) - len(q))))[:len(p)], 0)
+                    next_token = _sample(residual if residual.sum() > 0 else p)
+                    break
+                else:
+                    next_token = _sample(probs[index, num_drafts])
+
+                # Slots of rejected drafts stay in the cache but are never attended to
+                attention[index, attention.shape[1] - num_drafts + accepted:] = 0
+                positions[row] += 1 + accepted
+                pending[row] = next_token
+                self.stats["drafted"] += num_drafts
+                self.stats["accepted"] += accepted
+
+                done = False
+                for token in drafts[:accepted] + [next_token]:
+                    sequences[row].append(token)
+                    generated[row].append(token)
+                    self.stats["tokens"] += 1
+                    if residue_counts is not None and token < len(residue_counts):
+                        residues[row] += int(residue_counts[token])
+                    done = (token == eos_token_id or len(generated[row]) >= max_new_tokens or
+                            (max_residues is not None and residues[row] >= max_residues))
+                    if done:
+                        break
+                if not done:
+                    keep.append(index)
+
+            self.stats["passes"] += 1
+            self.stats["row_passes"] += len(active)
+            if len(keep) < len(active):
+                active = [active[index] for index in keep]
+                if active:
+                    past.batch_select_indices(torch.tensor(keep, device=device))
+                    attention = attention[keep]
+
+        length = prompt_length + max(len(tokens) for tokens in generated)
+        output = torch.full((rows, length), pad_token_id, dtype=torch.long)
+        for row, tokens in enumerate(sequences):
+            output[row, :len(tokens)] = torch.tensor(tokens)
+        return output
+
+
+def benchmark(model, tokenizer, draft: NgramDraftModel, prompts: List[str], num_return_sequences: int = 8,
+              num_draft_tokens: int = 4, max_residues: int = 20, repeats: int = 3,
+              **generation_kwargs) -> Dict:
+    """
+    Compare standard sampling with speculative sampling of CDRs.
+
+    Args:
+        model: Hugging Face causal language model
+        tokenizer: Its tokenizer
+        draft: Draft model
+        prompts: CDR prompts ending in '<CDR>'
+        num_return_sequences: Samples per prompt
+        num_draft_tokens: Tokens drafted per verification pass
+        max_residues: CDR length at which sampling stops
+        repeats: Passes over the prompts per mode
+        **generation_kwargs: Sampling parameters for both modes
+
+    Returns:
+        Seconds and tokens/sec per mode, plus draft acceptance rate and
+        tokens emitted per verification pass for speculative sampling
+    """
+    from .cdr_decoding import cdr_stopping_criteria, token_residue_counts
+
+    decoder = SpeculativeDecoder(model, draft, num_draft_tokens)
+    residue_counts = token_residue_counts(tokenizer)
+    pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+    results = {}
+    for mode in ('standard', 'speculative'):
+        tokens = 0
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for prompt in prompts:
+                inputs = tokenizer(prompt, return_tensors="pt")
+                prompt_length = inputs["input_ids"].shape[1]
+                if mode == 'standard':
+                    with torch.no_grad():
+                        outputs = model.generate(
+                            **inputs, num_return_sequences=num_return_sequences, pad_token_id=pad_token_id,
+                            stopping_criteria=cdr_stopping_criteria(tokenizer, prompt_length, max_residues),
+                            **generation_kwargs
+                        )
+                else:
+                    outputs = decoder.generate(
+                        inputs["input_ids"], num_return_sequences, pad_token_id=pad_token_id,
+                        max_residues=max_residues, residue_counts=residue_counts, **generation_kwargs
+                    )
+                tokens += int((outputs[:, prompt_length:] != pad_token_id).sum())
+        seconds = time.perf_counter() - start
+        results[mode] = {
+            'seconds': round(seconds, 3),
+            'tokens': tokens,
+            'tokens_per_second': round(tokens / seconds, 1) if seconds else 0.0
+        }
+    results['speculative'].update(decoder.summary())
+    return results
+
+
+def main():
+    """Train the CDR draft model or benchmark speculative sampling."""
+    parser = argparse.ArgumentParser(description='Speculative CDR sampling with an n-gram draft model')
+    parser.add_argument('--model', default='nferruz/ProtGPT2', help='Target model name or path')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    train_parser = subparsers.add_parser('train', help='Train the n-gram draft model')
+    train_parser.add_argument('--output', default=DEFAULT_DRAFT_PATH, help='Draft model file')
+    train_parser.add_argument('--library', default=None, help='CDR library (SQLite) to add to the training CDRs')
+    train_parser.add_argument('--order', type=int, default=3, help='n-gram order')
+
+    bench_parser = subparsers.add_parser('benchmark', help='Compare standard and speculative sampling')
+    bench_parser.add_argument('--draft', default=DEFAULT_DRAFT_PATH, help='Draft model file')
+    bench_parser.add_argument('--context', default='MKTAYIAKQRQISFVKSHFSRQ', help='Target context sequence')
+    bench_parser.add_argument('--num-draft-tokens', type=int, default=4, help='Tokens drafted per pass')
+    bench_parser.add_argument('--samples', type=int, default=8, help='Samples per prompt')
+    bench_parser.add_argument('--repeats', type=int, default=3, help='Passes over the prompts per mode')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    from .cdr_decoding import non_amino_acid_token_ids
+    from .model_cache import load_model, load_tokenizer
+    tokenizer = load_tokenizer(args.model)
+
+    if args.command == 'train':
+        from .cdr_library import CDRLibrary
+        library = CDRLibrary(args.library) if args.library else None
+        draft = NgramDraftModel.from_sequences(tokenizer, training_cdrs(cdr_library=library), args.order)
+        draft.save(args.output)
+        logger.info(f"Draft model with {len(draft.counts[-1])} contexts written to {args.output}")
+        return
+
+    from .germline_templates import TemplateLibrary
+    model = load_model(args.model)
+    prompts = [
+        f"{template.prompt_prefix} {args.context} <CDR>"
+        for template in TemplateLibrary.load().templates.values()
+    ]
+    results = benchmark(
+        model, tokenizer, load_or_train_draft(tokenizer, args.draft), prompts, args.samples,
+        args.num_draft_tokens, repeats=args.repeats, do_sample=True, top_k=20, top_p=0.85,
+        temperature=0.6, max_new_tokens=30, no_repeat_ngram_size=2, repetition_penalty=1.5,
+        suppress_tokens=non_amino_acid_token_ids(tokenizer)
+    )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
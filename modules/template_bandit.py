@@ -0,0 +1,258 @@
+"""
+Budgeted bandit allocation of generation attempts.
+
+Instead of drawing germline templates independently of how they perform,
+every (VH, VL, prompt context) combination is treated as an arm of a
+multi-armed bandit. Arms are chosen by budgeted Thompson sampling: a draw
+from each arm's Beta posterior of binder acceptance is divided by the
+arm's average cost per attempt (wall time or generated tokens), so compute
+goes to the combinations producing accepted designs most cheaply. The run
+stops when the budget is spent or the requested number of binders is
+accepted, and reports the yield of every arm.
+
+Prompt contexts are target motifs; by default the first 20 residues of the
+target, as in generate_binders, or sliding windows over the whole target.
+
+Usage:
+    python -m modules.template_bandit MVLSPADKTNVKAAWGKVGAHAGEYGAEALERMFLSFPTTKTYFPHFD \
+        --num-candidates 20 --seconds 600 --windows
+"""
+
+import argparse
+import json
+import logging
+import random
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from .parallel_generation import load_generator, seed_everything
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Arm:
+    """A template pair and prompt context with its observed outcomes."""
+    vh: str
+    vl: str
+    context: str
+    pulls: int = 0
+    accepted: int = 0
+    seconds: float = 0.0
+    tokens: int = 0
+
+    def summary(self) -> Dict:
+        """Attempts, accepted binders and yield per attempt, second and thousand tokens."""
+        return {
+            "vh": self.vh,
+            "vl": self.vl,
+            "context": self.context,
+            "pulls": self.pulls,
+            "accepted": self.accepted,
+            "yield": round(self.accepted / self.pulls, 3) if self.pulls else 0.0,
+            "seconds": round(self.seconds, 3),
+            "tokens": self.tokens,
+            "accepted_per_hour": round(3600 * self.accepted / self.seconds, 2) if self.seconds > 0 else 0.0,
+            "accepted_per_1k_tokens": round(1000 * self.accepted / self.tokens, 3) if self.tokens else 0.0
+        }
+
+
+class BudgetedThompsonSampler:
+    """Budgeted Thompson sampling over arms with Bernoulli rewards and positive costs."""
+
+    def __init__(self, arms: List[Arm], cost: str = 'seconds', prior: tuple = (1.0, 1.0), rng=random):
+        """
+        Args:
+            arms: Arms to allocate attempts over
+            cost: Arm attribute attempts are charged in: 'seconds', 'tokens' or 'pulls'
+            prior: Beta prior (successes, failures) of each arm's acceptance rate
+            rng: Random source; defaults to the seeded module-level random
+        """
+        self.arms = arms
+        self.cost = cost
+        self.prior = prior
+        self.rng = rng
+
+    def _mean_cost(self, arm: Arm, default: float) -> float:
+        # The run-wide mean acts as one pseudo-observation, so new arms are not free
+        return (getattr(arm, self.cost) + default) / (arm.pulls + 1)
+
+    def select(self) -> Arm:
+        """Arm with the highest sampled acceptance rate per unit of expected cost."""
+        pulls = sum(arm.pulls for arm in self.arms)
+        spent = sum(getattr(arm, self.cost) for arm in self.arms)
+        default = spent / pulls if pulls and spent > 0 else 1.0
+        alpha, beta = self.prior
+        return max(
+            self.arms,
+            key=lambda arm: self.rng.betavariate(alpha + arm.accepted, beta + arm.pulls - arm.accepted)
+            / max(self._mean_cost(arm, default), 1e-9)
+        )
+
+    def update(self, arm: Arm, accepted: bool, seconds: float, tokens: int):
+        """Record the outcome and cost of one attempt."""
+        arm.pulls += 1
+        arm.accepted += int(accepted)
+        arm.seconds += seconds
+        arm.tokens += tokens
+
+
+def motif_windows(sequence: str, width: int = 20, stride: int = 10) -> List[str]:
+    """Overlapping target motifs covering the whole sequence."""
+    if len(sequence) <= width:
+        return [sequence]
+    starts = list(range(0, len(sequence) - width + 1, stride))
+    if starts[-1] != len(sequence) - width:
+        starts.append(len(sequence) - width)
+    return [sequence[start:start + width] for start in starts]
+
+
+def build_arms(template_library, contexts: List[str], level: str = 'template') -> List[Arm]:
+    """
+    One arm per VH/VL combination and context.
+
+    Args:
+        template_library: Generator's TemplateLibrary
+        contexts: Prompt contexts (target motifs)
+        level: 'template' for template pairs, 'family' for gene family pairs,
+            which keeps the arm count small for IMGT-sized libraries
+
+    Returns:
+        Arms in a fixed order
+    """
+    if level == 'family':
+        heavy, light = template_library.families('VH'), template_library.families('VL')
+    elif level == 'template':
+        heavy = [t.name for t in template_library.chain_templates('VH')]
+        light = [t.name for t in template_library.chain_templates('VL')]
+    else:
+        raise ValueError(f"Unknown arm level: {level}")
+    return [Arm(vh, vl, context) for context in contexts for vh in heavy for vl in light]
+
+
+def generate_binders_budgeted(generator, fusion_context: Dict, num_candidates: int = 10,
+                              seconds: Optional[float] = None, tokens: Optional[int] = None,
+                              contexts: Optional[List[str]] = None, level: str = 'template',
+                              rng=random) -> Dict:
+    """
+    Generate binders with attempts allocated by a budgeted bandit.
+
+    Args:
+        generator: Antibody generator to run
+        fusion_context: Fusion context with the target's cleaned_sequence
+        num_candidates: Number of binders to accept
+        seconds: Wall-clock budget
+        tokens: Generated-token budget; with both budgets, arms are charged in seconds
+        contexts: Prompt contexts; defaults to the first 20 residues of the target
+        level: Arm granularity, 'template' or 'family'
+        rng: Random source for the bandit and family-level template draws
+
+    Returns:
+        Dictionary with generated_binders and stats, including per-arm yield
+    """
+    contexts = contexts or [fusion_context.get('cleaned_sequence', '')[:20]]
+    library = generator.template_library
+    arms = build_arms(library, contexts, level)
+    cost = 'seconds' if seconds is not None else 'tokens' if tokens is not None else 'pulls'
+    bandit = BudgetedThompsonSampler(arms, cost, rng=rng)
+    # Without a budget, the usual attempt cap applies
+    max_attempts = generator.oversampler.max_attempts(num_candidates) if cost == 'pulls' else None
+
+    generator.oversampler.start_run()
+    generator.telemetry.start_run()
+    if generator.speculative_decoder is not None:
+        generator.speculative_decoder.reset_stats()
+
+    binders = []
+    attempts = 0
+    start = time.perf_counter()
+    stop_reason = 'target'
+    while len(binders) < num_candidates:
+        if seconds is not None and time.perf_counter() - start >= seconds:
+            stop_reason = 'seconds'
+            break
+        if tokens is not None and generator.telemetry.generated_tokens >= tokens:
+            stop_reason = 'tokens'
+            break
+        if max_attempts is not None and attempts >= max_attempts:
+            stop_reason = 'max_attempts'
+            break
+
+        arm = bandit.select()
+        if level == 'family':
+            vh, vl = library.sample('VH', arm.vh, rng), library.sample('VL', arm.vl, rng)
+        else:
+            vh, vl = library[arm.vh], library[arm.vl]
+
+        attempt_start, tokens_before = time.perf_counter(), generator.telemetry.generated_tokens
+        binder = generator._tracked_attempt(arm.context, vh, vl)
+        bandit.update(arm, binder is not None, time.perf_counter() - attempt_start,
+                      generator.telemetry.generated_tokens - tokens_before)
+        attempts += 1
+        if binder is not None:
+            binders.append(binder)
+
+    stats = {
+        "attempts": attempts,
+        "success_rate": len(binders) / attempts if attempts > 0 else 0,
+        "stop_reason": stop_reason,
+        "budget": {
+            "seconds": seconds,
+            "tokens": tokens,
+            "spent_seconds": round(time.perf_counter() - start, 3),
+            "spent_tokens": generator.telemetry.generated_tokens
+        },
+        "arms": sorted((arm.summary() for arm in arms), key=lambda summary: -summary["pulls"]),
+        "oversampling": generator.oversampler.summary(),
+        "telemetry": generator.telemetry.finish_run()
+    }
+    if generator.seen_filter is not None:
+        generator.seen_filter.save()
+        stats["novelty"] = generator.seen_filter.summary()
+    if generator.speculative_decoder is not None:
+        stats["speculative"] = generator.speculative_decoder.summary()
+
+    return {
+        "generated_binders": binders,
+        "stats": stats
+    }
+
+
+def main():
+    """Generate binders under a compute budget with bandit template allocation."""
+    parser = argparse.ArgumentParser(description='Budgeted bandit allocation of generation attempts')
+    parser.add_argument('sequence', help='Target amino acid sequence')
+    parser.add_argument('--num-candidates', type=int, default=10, help='Binders to accept')
+    parser.add_argument('--seconds', type=float, default=None, help='Wall-clock budget')
+    parser.add_argument('--tokens', type=int, default=None, help='Generated-token budget')
+    parser.add_argument('--windows', action='store_true',
+                        help='Use sliding target windows as prompt contexts instead of the first 20 residues')
+    parser.add_argument('--level', choices=['template', 'family'], default='template',
+                        help='Allocate over template pairs or gene family pairs')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed')
+    parser.add_argument('--generator', choices=['original', 'revised'], default='original',
+                        help='Generator implementation to run')
+    parser.add_argument('--output', help='Write the result JSON to this file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.seed is not None:
+        seed_everything(args.seed)
+    generator = load_generator(args.generator)
+    contexts = motif_windows(args.sequence) if args.windows else None
+    result = generate_binders_budgeted(generator, {'cleaned_sequence': args.sequence}, args.num_candidates,
+                                       args.seconds, args.tokens, contexts, args.level)
+    logger.info(f"Accepted {len(result['generated_binders'])} binders in {result['stats']['attempts']} "
+                f"attempts; stopped on {result['stats']['stop_reason']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    else:
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
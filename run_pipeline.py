@@ -8,6 +8,7 @@ import json
 import sys
 import os
 import hashlib
+import random
 from datetime import datetime
 import numpy as np
 import torch
@@ -17,6 +18,7 @@ from modules.validate_sequences import validate_binder_set
 
 def set_random_seeds(seed=42):
     """Set random seeds for reproducibility."""
+    random.seed(seed)
     np.random.seed(seed)
     torch.manual_seed(seed)
     if torch.cuda.is_available():
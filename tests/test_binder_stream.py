@@ -0,0 +1,144 @@
+"""
+Unit tests for asynchronous binder streaming.
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import unittest
+from modules.binder_stream import stream_attempts
+from modules.generate_binders import AntibodyGenerator
+from modules.generation_telemetry import GenerationTelemetry
+from modules.oversampling import AdaptiveOversampler
+from modules.revised.antibody_generator import AntibodyGenerator as RevisedAntibodyGenerator
+
+
+class CountingAttempts:
+    """Attempt callable that accepts every other attempt."""
+
+    def __init__(self):
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            self.calls += 1
+            call = self.calls
+        return {"sequence": f"BINDER{call}"} if call % 2 == 0 else None
+
+
+class TestBinderStream(unittest.TestCase):
+    def test_streams_until_enough_accepted(self):
+        """Test that streaming stops once the requested number is accepted."""
+        attempt = CountingAttempts()
+        stats = {}
+
+        async def consume():
+            return [b async for b in stream_attempts(attempt, 3, 100, stats)]
+
+        binders = asyncio.run(consume())
+        self.assertEqual([b["sequence"] for b in binders], ["BINDER2", "BINDER4", "BINDER6"])
+        self.assertEqual(stats["attempts"], 6)
+        self.assertAlmostEqual(stats["success_rate"], 0.5)
+
+    def test_respects_max_attempts(self):
+        """Test that streaming ends after max_attempts even if short of candidates."""
+        attempt = CountingAttempts()
+
+        async def consume():
+            return [b async for b in stream_attempts(attempt, 10, 5)]
+
+        self.assertEqual(len(asyncio.run(consume())), 2)
+        self.assertEqual(attempt.calls, 5)
+
+    def test_should_stop_ends_generation(self):
+        """Test that a should_stop callback ends generation early."""
+        attempt = CountingAttempts()
+
+        async def consume():
+            return [b async for b in stream_attempts(attempt, 10, 100,
+                                                     should_stop=lambda: attempt.calls >= 4)]
+
+        self.assertEqual(len(asyncio.run(consume())), 2)
+        self.assertEqual(attempt.calls, 4)
+
+    def test_consumer_cancellation_stops_generation(self):
+        """Test that breaking out of the stream stops further attempts."""
+        release = threading.Event()
+        calls = []
+
+        def attempt():
+            calls.append(1)
+            if len(calls) > 1:
+                release.wait(timeout=5)
+            return {"sequence": "BINDER"}
+
+        async def consume():
+            stream = stream_attempts(attempt, 100, 100)
+            async for binder in stream:
+                break
+            await stream.aclose()
+            release.set()
+            await asyncio.sleep(0.05)
+
+        asyncio.run(consume())
+        self.assertLessEqual(len(calls), 2)
+
+    def test_attempt_errors_propagate(self):
+        """Test that exceptions raised by an attempt reach the consumer."""
+        def attempt():
+            raise ValueError("model failure")
+
+        async def consume():
+            return [b async for b in stream_attempts(attempt, 1, 1)]
+
+        with self.assertRaises(ValueError):
+            asyncio.run(consume())
+
+    def test_on_finish_runs_before_iteration_ends(self):
+        """Test that the finish callback sees the final stats before the consumer does."""
+        attempt = CountingAttempts()
+        stats = {}
+
+        def finish():
+            stats["finished_after"] = stats["attempts"]
+
+        async def consume():
+            return [b async for b in stream_attempts(attempt, 2, 100, stats, on_finish=finish)]
+
+        asyncio.run(consume())
+        self.assertEqual(stats["finished_after"], 4)
+
+    def test_generators_stream_with_telemetry(self):
+        """Test that agenerate_binders reports telemetry and writes a run summary."""
+        for generator_class in (AntibodyGenerator, RevisedAntibodyGenerator):
+            with tempfile.TemporaryDirectory() as temp_dir:
+                path = os.path.join(temp_dir, 'metrics.jsonl')
+                generator = generator_class.__new__(generator_class)
+                generator.oversampler = AdaptiveOversampler()
+                generator.telemetry = GenerationTelemetry(path)
+                generator.speculative_decoder = None
+                generator.telemetry.record_stage('validation')  # Left over from an earlier run
+
+                def attempt_binder(target_motif, vh=None, vl=None, generator=generator):
+                    generator.telemetry.record_stage('validation')
+                    return {"sequence": target_motif}
+
+                generator._attempt_binder = attempt_binder
+                stats = {}
+
+                async def consume():
+                    return [b async for b in generator.agenerate_binders(
+                        {'cleaned_sequence': 'MKTAYIAK'}, 3, stats)]
+
+                self.assertEqual(len(asyncio.run(consume())), 3)
+                self.assertEqual(stats["telemetry"]["funnel"]["validation"], {'evaluated': 3, 'passed': 3})
+                with open(path) as f:
+                    events = [json.loads(line) for line in f]
+                self.assertEqual(events[-1]["event"], "run_summary")
+
+
+if __name__ == '__main__':
+    unittest.main()
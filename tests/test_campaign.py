@@ -0,0 +1,103 @@
+"""
+Unit tests for resumable generation campaigns.
+"""
+
+import json
+import os
+import random
+import shutil
+import tempfile
+import unittest
+import torch
+from modules.campaign import CampaignCheckpoint
+from modules.generate_binders import AntibodyGenerator
+from modules.generation_telemetry import GenerationTelemetry
+from modules.oversampling import AdaptiveOversampler
+
+
+class Crash(Exception):
+    pass
+
+
+class StubGenerator(AntibodyGenerator):
+    """AntibodyGenerator with random attempts in place of ProtGPT2 sampling."""
+
+    def __init__(self, crash_at=None):
+        self.oversampler = AdaptiveOversampler()
+        self.telemetry = GenerationTelemetry()
+        self.seen_filter = None
+        self.speculative_decoder = None
+        self.crash_at = crash_at
+        self.calls = 0
+
+    def _attempt_binder(self, target_motif, vh=None, vl=None):
+        self.calls += 1
+        if self.calls == self.crash_at:
+            raise Crash()
+        self.oversampler.record('IGHV3-23*01', 3, random.randint(0, 3))
+        if random.random() < 0.4:
+            return None
+        return {"sequence": target_motif + ''.join(random.choices('ACDEFGHIKLMNPQRSTVWY', k=8)),
+                "validation_score": round(float(torch.rand(1)), 6)}
+
+
+class TestCampaign(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.log = os.path.join(self.temp_dir, 'campaign.jsonl')
+        self.context = {'cleaned_sequence': 'MVLSPADKTN'}
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def run_campaign(self, generator, path):
+        return generator.generate_binders(self.context, 12, checkpoint=CampaignCheckpoint(path, seed=3, every=2))
+
+    def test_resume_matches_uninterrupted_run(self):
+        """Test that a crashed campaign resumes to the same binders without regenerating them."""
+        reference = self.run_campaign(StubGenerator(), os.path.join(self.temp_dir, 'reference.jsonl'))
+
+        with self.assertRaises(Crash):
+            self.run_campaign(StubGenerator(crash_at=11), self.log)
+        with open(self.log) as f:
+            accepted_before_crash = sum(1 for line in f if json.loads(line).get('binder'))
+        self.assertGreater(accepted_before_crash, 0)
+
+        resumed = StubGenerator()
+        result = self.run_campaign(resumed, self.log)
+        self.assertEqual(result["generated_binders"], reference["generated_binders"])
+        self.assertEqual(result["stats"]["attempts"], reference["stats"]["attempts"])
+        self.assertEqual(result["stats"]["oversampling"], reference["stats"]["oversampling"])
+        self.assertEqual(result["stats"]["campaign"]["resumed_binders"], accepted_before_crash)
+        self.assertEqual(resumed.calls, reference["stats"]["attempts"] - result["stats"]["campaign"]["resumed_attempts"])
+
+        # The log is compacted into the normal output shape
+        self.assertFalse(os.path.exists(self.log))
+        with open(os.path.join(self.temp_dir, 'campaign.json')) as f:
+            self.assertEqual(json.load(f)["generated_binders"], reference["generated_binders"])
+
+    def test_torn_record_is_dropped(self):
+        """Test that a partially written last record is ignored and truncated."""
+        with self.assertRaises(Crash):
+            self.run_campaign(StubGenerator(crash_at=11), self.log)
+        with open(self.log) as f:
+            records = f.read().splitlines()
+        with open(self.log, 'a') as f:
+            f.write('{"attempts": 99, "seed"')
+
+        checkpoint = CampaignCheckpoint(self.log)
+        binders, attempts = checkpoint.resume(self.context, 12, AdaptiveOversampler())
+        self.assertEqual(attempts, json.loads(records[-1])["attempts"])
+        self.assertEqual(len(binders), sum(1 for line in records[1:] if json.loads(line)["binder"]))
+        with open(self.log) as f:
+            self.assertEqual(f.read().splitlines(), records)
+
+    def test_rejects_other_campaign(self):
+        """Test that a log is not resumed for a different target or quota."""
+        CampaignCheckpoint(self.log).resume(self.context, 12, AdaptiveOversampler())
+        with self.assertRaises(ValueError):
+            CampaignCheckpoint(self.log).resume(self.context, 20, AdaptiveOversampler())
+
+
+if __name__ == '__main__':
+    unittest.main()
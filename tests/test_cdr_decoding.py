@@ -0,0 +1,88 @@
+"""
+Unit tests for CDR decoding helpers.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import torch
+from modules.cdr_decoding import (
+    token_residue_counts, amino_acid_token_mask, non_amino_acid_token_ids, CDRLengthStoppingCriteria
+)
+
+
+class StubTokenizer:
+    """Minimal tokenizer exposing the interface used by the decoding helpers."""
+
+    def __init__(self, vocab, name_or_path='', eos_token_id=None):
+        self.vocab = vocab
+        self.name_or_path = name_or_path
+        self.eos_token_id = eos_token_id
+
+    def __len__(self):
+        return len(self.vocab)
+
+    def batch_decode(self, sequences, skip_special_tokens=True):
+        return [''.join(self.vocab[i] for i in seq) for seq in sequences]
+
+
+class TestCDRDecoding(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures."""
+        self.tokenizer = StubTokenizer(['<eos>', 'QVQ', ' ', 'GS', '<CDR>', 'K'])
+
+    def test_token_residue_counts(self):
+        """Test per-token residue counting."""
+        counts = token_residue_counts(self.tokenizer)
+        self.assertEqual(counts.tolist(), [0, 3, 0, 2, 3, 1])
+        # Cached per tokenizer
+        self.assertIs(counts, token_residue_counts(self.tokenizer))
+
+    def test_stopping_per_row(self):
+        """Test that rows stop independently once they reach the CDR length."""
+        counts = torch.tensor([0, 3, 0, 2, 0, 1])
+        criteria = CDRLengthStoppingCriteria(counts, prompt_length=2, max_residues=5)
+
+        input_ids = torch.tensor([
+            [4, 4, 1, 3, 0],   # 5 residues after the prompt
+            [4, 4, 1, 2, 5],   # 4 residues after the prompt
+            [1, 1, 5, 5, 2],   # prompt residues are not counted
+        ])
+        done = criteria(input_ids, None)
+        self.assertEqual(done.tolist(), [True, False, False])
+
+    def test_out_of_vocab_ids(self):
+        """Test that ids beyond the tokenizer vocabulary count as no residues."""
+        counts = torch.tensor([0, 3])
+        criteria = CDRLengthStoppingCriteria(counts, prompt_length=0, max_residues=3)
+        done = criteria(torch.tensor([[7, 9], [1, 9]]), None)
+        self.assertEqual(done.tolist(), [False, True])
+
+    def test_amino_acid_token_mask(self):
+        """Test that only pure amino acid tokens are allowed in a CDR."""
+        tokenizer = StubTokenizer(['<eos>', 'QVQ', ' ', 'GS', '<CDR>', 'K'], eos_token_id=0)
+        self.assertEqual(amino_acid_token_mask(tokenizer).tolist(), [False, True, False, True, False, True])
+        # End of sequence stays allowed so samples can finish early
+        self.assertEqual(non_amino_acid_token_ids(tokenizer), [2, 4])
+
+    def test_mask_cached_on_disk(self):
+        """Test that the mask is written once and reused by later tokenizers."""
+        temp_dir = tempfile.mkdtemp()
+        try:
+            vocab = ['<eos>', 'QVQ', ' ', 'GS', '<CDR>', 'K']
+            mask = amino_acid_token_mask(StubTokenizer(vocab, name_or_path=temp_dir))
+            self.assertEqual(len(os.listdir(temp_dir)), 1)
+
+            class NoDecodeTokenizer(StubTokenizer):
+                def batch_decode(self, sequences, skip_special_tokens=True):
+                    raise AssertionError("mask should be loaded from disk")
+
+            cached = amino_acid_token_mask(NoDecodeTokenizer(vocab, name_or_path=temp_dir))
+            self.assertEqual(cached.tolist(), mask.tolist())
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
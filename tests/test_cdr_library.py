@@ -0,0 +1,102 @@
+"""
+Unit tests for the CDR library and combinatorial assembly.
+"""
+
+import os
+import tempfile
+import unittest
+from modules.cdr_library import CDRLibrary, CombinatorialAssembler
+
+TEMPLATES = {
+    'VH': {
+        'IGHV3-23*01': {
+            'FR1': 'EVQLLESGGGLVQPGGSLRLSCAASGFTFS',
+            'FR2': 'WVRQAPGKGLEWVS',
+            'FR3': 'RFTISRDNSKNTLYLQMNSLRAEDTAVYYCAR',
+            'FR4': 'WGQGTLVTVSS'
+        }
+    },
+    'VL': {
+        'IGKV1-39*01': {
+            'FR1': 'DIQMTQSPSSLSASVGDRVTITC',
+            'FR2': 'WYQQKPGKAPKLLIY',
+            'FR3': 'GVPSRFSGSGSGTDFTLTISSLQPEDFATYYC',
+            'FR4': 'FGQGTKVEIK'
+        }
+    }
+}
+
+
+class TestCDRLibrary(unittest.TestCase):
+    def setUp(self):
+        """Set up a library with a few CDRs per slot."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'cdrs.sqlite')
+        self.library = CDRLibrary(self.path)
+
+        records = []
+        for chain, template in [('VH', 'IGHV3-23*01'), ('VL', 'IGKV1-39*01')]:
+            for position in (1, 2, 3):
+                for variant in ('AYWMS', 'GFTDY', 'RNYLA'):
+                    records.append({
+                        'sequence': f"{variant}{chain}{position}",
+                        'chain': chain,
+                        'position': position,
+                        'template': template,
+                        'context': 'MVLSPADKTN',
+                        'metrics': {'length': 8}
+                    })
+        self.library.add_many(records)
+
+    def tearDown(self):
+        self.library.close()
+        os.unlink(self.path)
+        os.rmdir(self.temp_dir)
+
+    def test_store_and_query(self):
+        """Test persistence, indexing by slot and deduplication on insert."""
+        self.library.add('AYWMSVH1', 'VH', 1, 'IGHV3-23*01', 'MVLSPADKTN', {'length': 8})
+        self.assertEqual(self.library.count(), 18)
+        self.assertEqual(self.library.count('VH'), 9)
+
+        records = self.library.query('VH', 1, 'IGHV3-23*01')
+        self.assertEqual(len(records), 3)
+        self.assertEqual(records[0]['metrics'], {'length': 8})
+        self.assertEqual(records[0]['times_seen'], 2)
+
+        reopened = CDRLibrary(self.path)
+        self.assertEqual(reopened.templates('VL'), ['IGKV1-39*01'])
+        reopened.close()
+
+    def test_invalid_slot(self):
+        """Test that invalid chains and positions are rejected."""
+        with self.assertRaises(ValueError):
+            self.library.add('AYWMS', 'VK', 1, 'IGKV1-39*01')
+
+    def test_combinatorial_assembly(self):
+        """Test unique candidate assembly with diversity sampling."""
+        assembler = CombinatorialAssembler(self.library, TEMPLATES, seed=7)
+        candidates = assembler.assemble(20)
+
+        sequences = [c['sequence'] for c in candidates]
+        self.assertEqual(len(sequences), 20)
+        self.assertEqual(len(set(sequences)), 20)
+
+        first = candidates[0]
+        self.assertTrue(first['sequence'].startswith('EVQLLESGGGLVQPGGSLRLSCAASGFTFS' + first['heavy_cdrs'][0]))
+        self.assertTrue(first['sequence'].endswith(first['light_cdrs'][2] + 'FGQGTKVEIK'))
+
+        # Every heavy CDR1 variant is used when sampling with a reuse penalty
+        self.assertEqual(len({c['heavy_cdrs'][0] for c in candidates}), 3)
+
+    def test_assembly_respects_exclusions_and_context(self):
+        """Test that excluded sequences and other contexts are skipped."""
+        assembler = CombinatorialAssembler(self.library, TEMPLATES, seed=1)
+        first = assembler.assemble(5)
+        again = assembler.assemble(5, exclude={c['sequence'] for c in first})
+        self.assertFalse({c['sequence'] for c in first} & {c['sequence'] for c in again})
+        self.assertEqual(assembler.assemble(5, context='OTHER'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
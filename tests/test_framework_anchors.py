@@ -0,0 +1,120 @@
+"""
+Unit tests for framework anchor based CDR extraction.
+"""
+
+import random
+import unittest
+import numpy as np
+from modules.framework_anchors import PAD, FrameworkAnchorIndex, _myers_distances
+from modules.germline_templates import TemplateLibrary
+from modules.reference_index import AMINO_ACIDS, encode
+from modules.sequence_validator import TherapeuticAntibodyValidator
+
+
+def best_match_distances(pattern, text):
+    """Semi-global edit distance of pattern matches ending at each text position."""
+    previous = list(range(len(pattern) + 1))
+    distances = []
+    for char in text:
+        current = [0]
+        for i, residue in enumerate(pattern, 1):
+            current.append(min(previous[i] + 1, current[i - 1] + 1, previous[i - 1] + (residue != char)))
+        distances.append(current[-1])
+        previous = current
+    return distances
+
+
+def mutate_interior(region, rng, edits):
+    """Substitutions and at most one indel away from the region ends."""
+    residues = list(region)
+    for _ in range(edits):
+        position = rng.randint(3, len(residues) - 4)
+        residues[position] = rng.choice(AMINO_ACIDS.replace(residues[position], ''))
+    if edits > 1:
+        position = rng.randint(3, len(residues) - 4)
+        if rng.random() < 0.5:
+            del residues[position]
+        else:
+            residues.insert(position, rng.choice(AMINO_ACIDS))
+    return ''.join(residues)
+
+
+class TestFrameworkAnchors(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(0)
+        self.library = TemplateLibrary.load()
+        self.index = FrameworkAnchorIndex.from_library(self.library)
+
+    def random_cdr(self, low, high):
+        return ''.join(self.rng.choices(AMINO_ACIDS, k=self.rng.randint(low, high)))
+
+    def build_chain(self, template, edits=0):
+        """Chain from a template's frameworks and random CDRs, with the CDRs it should yield."""
+        cdrs = [self.random_cdr(5, 10), self.random_cdr(7, 17), self.random_cdr(8, 15)]
+        frameworks = [mutate_interior(template.frameworks[f'FR{i}'], self.rng, edits) if edits else
+                      template.frameworks[f'FR{i}'] for i in range(1, 5)]
+        sequence = frameworks[0] + cdrs[0] + frameworks[1] + cdrs[1] + frameworks[2] + cdrs[2] + frameworks[3]
+        return sequence, {'cdr1': cdrs[0], 'cdr2': cdrs[1], 'cdr3': cdrs[2]}
+
+    def test_myers_matches_dynamic_programming(self):
+        """Test that bit-parallel distances equal the edit distance recurrence."""
+        patterns = [''.join(self.rng.choices('ACDE', k=n)) for n in (1, 5, 17, 64)]
+        texts = [''.join(self.rng.choices('ACDE', k=n)) for n in (0, 3, 40, 90)]
+        peq = np.zeros((PAD + 1, len(patterns)), dtype=np.uint64)
+        for column, pattern in enumerate(patterns):
+            for i, code in enumerate(encode(pattern)):
+                peq[code, column] |= np.uint64(1) << np.uint64(i)
+        codes = np.full((len(texts), 90), PAD, dtype=np.intp)
+        for row, text in enumerate(texts):
+            codes[row, :len(text)] = encode(text)
+
+        distances = _myers_distances(codes, peq, np.array([len(p) for p in patterns]))
+        for row, text in enumerate(texts):
+            for column, pattern in enumerate(patterns):
+                self.assertEqual(distances[row, column, :len(text)].tolist(), best_match_distances(pattern, text))
+
+    def test_extracts_cdrs_for_every_template(self):
+        """Test exact CDR recovery and chain detection on chains built from each germline template."""
+        for chain in ('VH', 'VL'):
+            for template in self.library.chain_templates(chain):
+                for edits in (0, 2):
+                    sequence, expected = self.build_chain(template, edits)
+                    entry = self.index.extract([sequence])[0]
+                    self.assertEqual(entry['chain'], chain)
+                    self.assertEqual({name: entry[name] for name in expected}, expected)
+
+    def test_batch_equals_single_extraction(self):
+        """Test that batched extraction equals one-by-one extraction."""
+        templates = self.library.chain_templates('VH') + self.library.chain_templates('VL')
+        sequences = [self.build_chain(self.rng.choice(templates), self.rng.choice([0, 1, 2]))[0] for _ in range(40)]
+        sequences += ['', 'ACDEFGHIK']
+        batched = self.index.extract(sequences, batch_size=7)
+        self.assertEqual(batched, [self.index.extract([sequence])[0] for sequence in sequences])
+        self.assertEqual(batched[-2]['cdr1'], '')
+        self.assertFalse(any(region['found'] for region in batched[-1]['frameworks'].values()))
+
+    def test_validator_uses_all_templates(self):
+        """Test that the validator extracts CDRs beyond the IGHV3 framework."""
+        validator = TherapeuticAntibodyValidator()
+        adalimumab = validator.antibodies[0]['sequence']
+        self.assertEqual(validator.extract_cdrs(adalimumab['heavy_chain'], 'heavy_chain'),
+                         {'cdr1': 'DYAMH', 'cdr2': 'AITWNSGHIDYADSVEG', 'cdr3': 'VSYLSTASSLDY'})
+        self.assertEqual(validator.extract_cdrs(adalimumab['light_chain']),
+                         {'cdr1': 'RASQGIRNYLA', 'cdr2': 'AASTLQS', 'cdr3': 'QRYNRAPYT'})
+        sequence, expected = self.build_chain(self.library['IGHV1-69*01'], edits=2)
+        self.assertEqual(validator.extract_cdrs(sequence, 'heavy_chain'), expected)
+
+    def test_bundled_references_have_all_cdrs(self):
+        """Test that every CDR of the bundled therapeutics is identified, mouse V genes included."""
+        validator = TherapeuticAntibodyValidator()
+        for antibody in validator.antibodies:
+            results = validator.validate_sequence_metrics(antibody['sequence'])
+            self.assertFalse([w for w in results['warnings'] if w.startswith('Could not identify')],
+                             antibody['name'])
+        rituximab = next(ab for ab in validator.antibodies if ab['name'] == 'Rituximab')
+        self.assertEqual(validator.extract_cdrs(rituximab['sequence']['light_chain'], 'light_chain'),
+                         {'cdr1': 'RASSSVSYIH', 'cdr2': 'ATSNLAS', 'cdr3': 'QQWTSNPPT'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+"""
+Unit tests for the core-partitioned generation scheduler.
+"""
+
+import unittest
+from modules.generation_scheduler import (
+    WorkerPool, available_cores, candidate_worker_counts, generate_targets, memory_worker_limit,
+    partition_cores, select_worker_count
+)
+from modules.parallel_generation import derive_seeds, run_shard
+from tests.test_parallel_generation import RandomGenerator
+
+FAKE_GENERATOR = 'tests.test_parallel_generation:RandomGenerator'
+
+
+class FailingGenerator(RandomGenerator):
+    """Generator stand-in that fails on targets marked as failing."""
+
+    def generate_binders(self, fusion_context, num_candidates=10):
+        if fusion_context.get('fail'):
+            raise ValueError("generation failed")
+        return super().generate_binders(fusion_context, num_candidates)
+
+
+class TestCorePartitioning(unittest.TestCase):
+    def test_partition_cores(self):
+        """Test that core sets are disjoint, contiguous and cover every core."""
+        sets = partition_cores(list(range(10)), 4)
+        self.assertEqual(sets, [[0, 1, 2], [3, 4, 5], [6, 7], [8, 9]])
+        self.assertEqual(partition_cores([4, 5], 1), [[4, 5]])
+        with self.assertRaises(ValueError):
+            partition_cores([0, 1], 3)
+
+    def test_candidate_worker_counts(self):
+        """Test that calibration tries powers of two and the full core count."""
+        self.assertEqual(candidate_worker_counts(1), [1])
+        self.assertEqual(candidate_worker_counts(8), [1, 2, 4, 8])
+        self.assertEqual(candidate_worker_counts(12), [1, 2, 4, 8, 12])
+        self.assertEqual(candidate_worker_counts(64, max_workers=6), [1, 2, 4, 6])
+
+    def test_select_worker_count(self):
+        """Test that the fewest workers within tolerance of the best throughput win."""
+        self.assertEqual(select_worker_count({1: 10.0, 2: 19.0, 4: 30.0, 8: 31.0}), 4)
+        self.assertEqual(select_worker_count({1: 10.0, 2: 19.0, 4: 30.0, 8: 40.0}), 8)
+        self.assertEqual(select_worker_count({1: 10.0, 2: 9.0}), 1)
+
+    def test_memory_worker_limit(self):
+        """Test that the worker limit follows available memory per worker."""
+        gib = 1 << 30
+        self.assertEqual(memory_worker_limit(2 * gib, available=20 * gib), 8)
+        self.assertEqual(memory_worker_limit(8 * gib, available=4 * gib), 1)
+        self.assertIsNone(memory_worker_limit(0, available=4 * gib))
+
+
+class TestWorkerPool(unittest.TestCase):
+    def test_load_failure_raises(self):
+        """Test that a worker that cannot load its generator fails the pool instead of hanging it."""
+        with self.assertRaisesRegex(RuntimeError, "failed to load"):
+            WorkerPool('tests.nonexistent_module:factory', [available_cores()[:1]], poll_interval=0.1)
+
+    def test_task_failure_cancels_queued_tasks(self):
+        """Test that a failing task is reported and the remaining queued tasks are skipped."""
+        tasks = [({'cleaned_sequence': 'MVLS', 'fail': True}, 1, 0)] + [({'cleaned_sequence': 'GSHM'}, 1, 0)] * 20
+        with WorkerPool('tests.test_generation_scheduler:FailingGenerator', [available_cores()[:1]],
+                        poll_interval=0.1) as pool:
+            self.assertGreater(pool.worker_memory, 0)
+            with self.assertRaisesRegex(RuntimeError, "generation failed"):
+                pool.run(tasks)
+            with self.assertRaisesRegex(RuntimeError, "cancelled"):
+                pool.run(tasks[1:])
+
+
+class TestGenerateTargets(unittest.TestCase):
+    def test_matches_seeded_shards(self):
+        """Test that worker results equal in-process shards with the derived seeds."""
+        targets = [{'cleaned_sequence': 'MVLSPADKTN'}, {'cleaned_sequence': 'GSHMKT'}]
+        result = generate_targets(targets, num_candidates=2, workers=1, seed=5,
+                                  kind=FAKE_GENERATOR, cores=available_cores()[:1])
+
+        generator = RandomGenerator()
+        for target, seed, entry in zip(targets, derive_seeds(5, 2), result["targets"]):
+            expected = run_shard(generator, target, 2, seed)
+            self.assertEqual(entry["generated_binders"], expected["generated_binders"])
+            self.assertEqual(entry["seed"], seed)
+        self.assertEqual(result["stats"]["workers"], 1)
+        self.assertEqual(result["stats"]["targets_per_worker"], [2])
+
+    def test_calibration_selects_worker_count(self):
+        """Test that automatic worker selection runs a calibration on the first target."""
+        targets = [{'cleaned_sequence': 'MVLSPADKTN'}]
+        result = generate_targets(targets, num_candidates=1, workers='auto',
+                                  kind=FAKE_GENERATOR, cores=available_cores()[:1])
+        calibration = result["stats"]["calibration"]
+        self.assertEqual(list(calibration["throughput"]), [1])
+        self.assertEqual(calibration["workers"], 1)
+
+    def test_no_targets(self):
+        """Test that an empty target list returns an empty result without calibrating."""
+        result = generate_targets([], workers='auto', kind=FAKE_GENERATOR)
+        self.assertEqual(result["targets"], [])
+        self.assertEqual(result["stats"]["workers"], 0)
+        self.assertIsNone(result["stats"]["calibration"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,179 @@
+"""
+Unit tests for the generation service micro-batcher.
+"""
+
+import threading
+import unittest
+import torch
+from modules.generation_service import GenerationClient, GenerationService, MicroBatcher
+from modules.generation_telemetry import GenerationTelemetry
+from modules.oversampling import AdaptiveOversampler
+
+
+class StubTokenizer:
+    """Tokenizer stub that left-pads prompts of single-character tokens."""
+
+    pad_token_id = 0
+
+    def __init__(self):
+        self.padding_side = "right"
+
+    def __len__(self):
+        return 128
+
+    def batch_decode(self, sequences, skip_special_tokens=True):
+        return [''.join(chr(i) for i in seq if i) for seq in sequences]
+
+    def __call__(self, prompts, return_tensors="pt", padding=True):
+        width = max(len(p) for p in prompts)
+        ids = [[0] * (width - len(p)) + [ord(ch) for ch in p] for p in prompts]
+        mask = [[0] * (width - len(p)) + [1] * len(p) for p in prompts]
+        return {"input_ids": torch.tensor(ids), "attention_mask": torch.tensor(mask)}
+
+
+class RecordingModel:
+    """Model stub that appends each row's index and records batch sizes."""
+
+    device = torch.device("cpu")
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def generate(self, input_ids, attention_mask=None, **kwargs):
+        self.batch_sizes.append(input_ids.shape[0])
+        rows = torch.arange(input_ids.shape[0]).unsqueeze(1)
+        return torch.cat([input_ids, rows], dim=1)
+
+
+class TestMicroBatcher(unittest.TestCase):
+    def setUp(self):
+        """Set up a batcher around the recording model."""
+        self.model = RecordingModel()
+        self.batcher = MicroBatcher(self.model, StubTokenizer(), max_batch_size=16, max_wait_ms=200)
+
+    def tearDown(self):
+        self.batcher.close()
+
+    def _submit_concurrently(self, jobs):
+        results = [None] * len(jobs)
+
+        def submit(i, prompt, count, kwargs):
+            results[i] = self.batcher.generate(prompt, count, kwargs, 20)
+
+        threads = [threading.Thread(target=submit, args=(i, *job)) for i, job in enumerate(jobs)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_jobs_share_a_batch(self):
+        """Test that compatible concurrent jobs are merged and split back per job."""
+        kwargs = {"do_sample": True, "top_k": 20}
+        results = self._submit_concurrently([("AB", 3, kwargs), ("CDE", 2, kwargs)])
+
+        self.assertEqual(self.model.batch_sizes, [5])
+        self.assertEqual([len(r) for r in results], [3, 2])
+        # Every row is left padded to the longest prompt
+        self.assertEqual({out.shape[0] for r in results for out in r}, {4})
+        prompts = {chr(int(r[0][-2])) for r in results}
+        self.assertEqual(prompts, {"B", "E"})
+
+    def test_incompatible_jobs_run_separately(self):
+        """Test that jobs with different sampling parameters are not merged."""
+        self._submit_concurrently([("AB", 2, {"top_k": 20}), ("CD", 2, {"top_k": 40})])
+        self.assertEqual(sorted(self.model.batch_sizes), [2, 2])
+        self.assertEqual(self.batcher.stats["jobs"], 2)
+
+    def test_left_padding_does_not_change_shared_tokenizer(self):
+        """Test that the batcher left-pads with its own tokenizer copy."""
+        tokenizer = StubTokenizer()
+        batcher = MicroBatcher(self.model, tokenizer)
+        batcher.close()
+        self.assertEqual(batcher.tokenizer.padding_side, "left")
+        self.assertEqual(tokenizer.padding_side, "right")
+
+
+class InterleavingGenerator:
+    """Generator stub whose concurrent runs alternate attempts through a barrier."""
+
+    model = None
+    tokenizer = None
+    speculative_decoder = None
+
+    def __init__(self, barrier):
+        self.barrier = barrier
+        self.batcher = None
+        self.oversampler = AdaptiveOversampler(window=4)
+        self.telemetry = GenerationTelemetry()
+
+    def generate_binders(self, fusion_context, num_candidates=10):
+        if fusion_context.get("fail"):
+            raise RuntimeError("model failure")
+        self.oversampler.start_run()
+        self.telemetry.start_run()
+        accept = fusion_context["accept"]
+        for _ in range(4):
+            self.barrier.wait()
+            self.oversampler.record("IGHV3-23*01", 1, int(accept))
+            self.oversampler.record_attempt(accept)
+            self.telemetry.record_stage("validation", None if accept else "validation_score")
+        return {"generated_binders": [], "stats": {
+            "collapsed": self.oversampler.yield_collapsed(),
+            "telemetry": self.telemetry.finish_run()
+        }}
+
+
+class TestGenerationService(unittest.TestCase):
+    def setUp(self):
+        """Serve the interleaving stub on a free port."""
+        self.generator = InterleavingGenerator(threading.Barrier(2, timeout=10))
+        self.service = GenerationService(self.generator, "revised", port=0)
+        self.thread = threading.Thread(target=self.service.serve_forever, daemon=True)
+        self.thread.start()
+        host, port = self.service.server.server_address[:2]
+        self.client = GenerationClient(f"http://{host}:{port}", timeout=30)
+
+    def tearDown(self):
+        self.service.shutdown()
+        self.thread.join()
+
+    def test_concurrent_requests_keep_their_own_run_state(self):
+        """Test that interleaved requests report only their own yield window and telemetry."""
+        results = {}
+
+        def request(accept):
+            results[accept] = self.client.generate_binders({"accept": accept}, 4)["stats"]
+
+        threads = [threading.Thread(target=request, args=(accept,)) for accept in (True, False)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertFalse(results[True]["collapsed"])
+        self.assertTrue(results[False]["collapsed"])
+        self.assertEqual(results[True]["telemetry"]["funnel"]["validation"], {"evaluated": 4, "passed": 4})
+        self.assertEqual(results[False]["telemetry"]["rejections"], {"validation_score": 4})
+        # Acceptance rates learned by both requests are kept by the served generator
+        summary = self.generator.oversampler.summary()["IGHV3-23*01"]
+        self.assertEqual((summary["sampled"], summary["accepted"]), (8, 4))
+
+    def test_error_status(self):
+        """Test that malformed requests are rejected and generation failures reported as such."""
+        with self.assertRaisesRegex(RuntimeError, "Invalid request"):
+            self.client.generate_binders(None, 4)
+        with self.assertRaisesRegex(RuntimeError, "model failure"):
+            self.client.generate_binders({"fail": True}, 4)
+
+
+class TestGenerationClient(unittest.TestCase):
+    def test_unreachable_service(self):
+        """Test that an unreachable service is reported as unavailable."""
+        client = GenerationClient("http://127.0.0.1:9")
+        self.assertIsNone(client.health())
+        self.assertFalse(client.is_available("revised"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+"""
+Unit tests for generation telemetry.
+"""
+
+import json
+import os
+import tempfile
+import unittest
+import torch
+from modules.generation_telemetry import GenerationTelemetry, generated_token_count
+
+
+class TestGenerationTelemetry(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'metrics.jsonl')
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        os.rmdir(self.temp_dir)
+
+    def test_generated_token_count(self):
+        """Test that prompt and padding tokens are excluded from the count."""
+        outputs = torch.tensor([
+            [0, 5, 6, 7, 8, 9],   # left padded prompt of 3, two new tokens
+            [5, 6, 7, 8, 0, 0],   # one new token, then padding
+        ])
+        self.assertEqual(generated_token_count(outputs, 3, 0), 3)
+        self.assertEqual(generated_token_count(list(outputs), 3, None), 6)
+
+    def test_funnel_and_rejections(self):
+        """Test per-stage counts, the rejection histogram and throughput."""
+        telemetry = GenerationTelemetry()
+        telemetry.record_forward(0.5, 40, 8)
+        telemetry.record_forward(0.5, 60, 8)
+        for reason in [None, 'length', 'homopolymer', 'length', None]:
+            telemetry.record_stage('cdr_quality', reason)
+        telemetry.record_stage('validation', 'validation_score')
+        with telemetry.timed('validation'):
+            pass
+
+        summary = telemetry.summary()
+        self.assertEqual(summary['forward_passes'], 2)
+        self.assertEqual(summary['generated_tokens'], 100)
+        self.assertEqual(summary['tokens_per_second'], 100.0)
+        self.assertEqual(summary['funnel']['cdr_quality'], {'evaluated': 5, 'passed': 2})
+        self.assertEqual(summary['rejections'], {'length': 2, 'homopolymer': 1, 'validation_score': 1})
+        self.assertIn('validation', summary['timings'])
+
+        telemetry.start_run()
+        self.assertEqual(telemetry.summary()['funnel'], {})
+
+    def test_jsonl_stream(self):
+        """Test that forward passes and run summaries are appended as JSON lines."""
+        telemetry = GenerationTelemetry(self.path)
+        telemetry.record_forward(0.1, 10, 2)
+        telemetry.record_stage('cdr_quality', 'composition')
+        telemetry.finish_run()
+
+        with open(self.path) as f:
+            events = [json.loads(line) for line in f]
+        self.assertEqual([e['event'] for e in events], ['forward', 'run_summary'])
+        self.assertEqual(events[0]['tokens'], 10)
+        self.assertEqual(events[1]['rejections'], {'composition': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
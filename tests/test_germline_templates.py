@@ -0,0 +1,116 @@
+"""
+Unit tests for the germline template library.
+"""
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from collections import Counter
+from modules.germline_templates import (
+    AliasTable, GermlineTemplate, TemplateLibrary, parse_imgt_fasta
+)
+
+IGHV3_23_GAPPED = ("EVQLLESGG.GLVQPGGSLRLSCAASGFTF....SSYAMSWVRQAPGKGLEWVSAISGS..GGSTYYADSVK."
+                   "GRFTISRDNSKNTLYLQMNSLRAEDTAVYYCAK")
+
+
+class CountingTokenizer:
+    """Character tokenizer that counts how often it is called."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, text, add_special_tokens=True):
+        self.calls += 1
+        return {"input_ids": [ord(ch) for ch in text]}
+
+
+class TestTemplateLibrary(unittest.TestCase):
+    def setUp(self):
+        """Set up the bundled library and a weighted synthetic one."""
+        self.library = TemplateLibrary.load()
+        frameworks = dict(FR1='QVQ', FR2='WVR', FR3='RVT', FR4='WGQ')
+        self.weighted = TemplateLibrary([
+            GermlineTemplate('IGHV1-2*01', 'VH', 'IGHV1', weight=1.0, **frameworks),
+            GermlineTemplate('IGHV1-3*01', 'VH', 'IGHV1', weight=3.0, **frameworks),
+            GermlineTemplate('IGHV3-7*01', 'VH', 'IGHV3', weight=6.0, **frameworks),
+        ])
+
+    def test_bundled_templates(self):
+        """Test that the bundled data file is indexed by chain and family."""
+        self.assertEqual(len(self.library), 5)
+        self.assertEqual(self.library.families('VH'), ['IGHV1', 'IGHV3'])
+        self.assertEqual(self.library.families('VL'), ['IGKV1', 'IGKV3', 'IGLV1'])
+        template = self.library['IGHV3-23*01']
+        self.assertEqual(template.prompt_prefix, template.FR1 + 'X' * 10 + template.FR2)
+        self.assertEqual(self.library.as_dict()['VL']['IGKV1-39*01']['FR4'], 'FGQGTKVEIK')
+
+    def test_weighted_sampling(self):
+        """Test that sampling follows template weights and respects families."""
+        rng = random.Random(0)
+        counts = Counter(self.weighted.sample('VH', rng=rng).name for _ in range(20000))
+        self.assertAlmostEqual(counts['IGHV1-2*01'] / 20000, 0.1, delta=0.015)
+        self.assertAlmostEqual(counts['IGHV3-7*01'] / 20000, 0.6, delta=0.015)
+
+        family = Counter(self.weighted.sample('VH', 'IGHV1', rng=rng).name for _ in range(4000))
+        self.assertEqual(set(family), {'IGHV1-2*01', 'IGHV1-3*01'})
+        self.assertAlmostEqual(family['IGHV1-3*01'] / 4000, 0.75, delta=0.03)
+
+        with self.assertRaises(KeyError):
+            self.weighted.sample('VL')
+
+    def test_alias_table_rejects_empty_weights(self):
+        """Test that alias tables need a positive weight."""
+        with self.assertRaises(ValueError):
+            AliasTable([0.0, 0.0])
+
+    def test_prefix_ids_cached(self):
+        """Test that prompt prefixes are tokenized once per tokenizer."""
+        tokenizer = CountingTokenizer()
+        first = self.library.prefix_ids('IGHV1-69*01', tokenizer)
+        again = self.library.prefix_ids('IGHV1-69*01', tokenizer)
+        self.assertIs(first, again)
+        self.assertEqual(tokenizer.calls, 1)
+        self.assertEqual(len(first), len(self.library['IGHV1-69*01'].prompt_prefix))
+
+    def test_save_and_load(self):
+        """Test that saved libraries round-trip."""
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, 'templates.json')
+            self.weighted.save(path)
+            loaded = TemplateLibrary.load(path)
+            self.assertEqual(loaded['IGHV3-7*01'], self.weighted['IGHV3-7*01'])
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+class TestImgtImport(unittest.TestCase):
+    def test_parse_gapped_fasta(self):
+        """Test that frameworks are cut at IMGT positions and entries are filtered."""
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, 'imgt.fasta')
+            with open(path, 'w') as f:
+                f.write(f">M99660|IGHV3-23*01|Homo sapiens|F|V-REGION|\n{IGHV3_23_GAPPED[:60]}\n"
+                        f"{IGHV3_23_GAPPED[60:]}\n")
+                f.write(f">X00001|IGHV3-23*02|Homo sapiens|ORF|V-REGION|\n{IGHV3_23_GAPPED}\n")
+                f.write(f">X00002|IGHV3-23*01|Mus musculus|F|V-REGION|\n{IGHV3_23_GAPPED}\n")
+                f.write(">X00003|IGHD1-1*01|Homo sapiens|F|D-REGION|\nGTTGT\n")
+            templates = parse_imgt_fasta(path)
+        finally:
+            shutil.rmtree(temp_dir)
+
+        self.assertEqual(len(templates), 1)
+        template = templates[0]
+        self.assertEqual((template.chain, template.family), ('VH', 'IGHV3'))
+        self.assertEqual(template.FR1, 'EVQLLESGGGLVQPGGSLRLSCAAS')
+        self.assertEqual(template.FR2, 'MSWVRQAPGKGLEWVSA')
+        self.assertEqual(template.FR3, 'YYADSVKGRFTISRDNSKNTLYLQMNSLRAEDTAVYYC')
+        self.assertEqual(template.FR4, 'WGQGTLVTVSS')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+"""
+Unit tests for the k-mer inverted index prefilter.
+"""
+
+import os
+import random
+import tempfile
+import time
+import unittest
+from modules.antibody_validator import AntibodyValidator
+from modules.kmer_index import AntibodyKmerPrefilter, KmerIndex
+from modules.reference_index import AntibodyReferenceIndex, ReferenceIndex
+from tests.test_reference_index import mutate
+
+
+class TestKmerIndex(unittest.TestCase):
+    def setUp(self):
+        """Set up a panel of mutated therapeutics and queries derived from it."""
+        rng = random.Random(2)
+        base = AntibodyValidator().antibodies
+        self.panel = []
+        for i in range(400):
+            antibody = base[i % len(base)]
+            self.panel.append({
+                'name': f"ref{i}", 'target': antibody['target'], 'antibody_type': antibody['antibody_type'],
+                'sequence': {chain: mutate(seq, rng, 0.1) for chain, seq in antibody['sequence'].items()}
+            })
+        self.queries = [
+            {chain: mutate(seq, rng, 0.1) for chain, seq in rng.choice(self.panel)['sequence'].items()}
+            for _ in range(40)
+        ]
+        self.exact = AntibodyReferenceIndex(self.panel)
+
+    def test_postings_match_brute_force(self):
+        """Test that shared k-mer counts equal a direct set intersection."""
+        sequences = ['ACDEFGHIK', 'ACDXEFG', 'KLMACD', 'AC', '']
+        index = KmerIndex.build(ReferenceIndex(sequences), k=3, chunk_size=2)
+        for query in ['ACDEFG', 'XACDK', 'KLM', '']:
+            kmers = {query[i:i + 3] for i in range(len(query) - 2) if 'X' not in query[i:i + 3]}
+            expected = [len(kmers & {ref[i:i + 3] for i in range(len(ref) - 2)}) for ref in sequences]
+            self.assertEqual(index.shared_counts(query).tolist(), expected)
+
+    def test_recall_against_brute_force(self):
+        """Test that prefiltered search finds nearly every hit of the exhaustive search."""
+        prefiltered = AntibodyReferenceIndex(self.panel)
+        prefiltered.prefilter = AntibodyKmerPrefilter.build(prefiltered, min_shared=0.3)
+
+        expected = [self.exact.find_similar(query, 0.7) for query in self.queries]
+        actual = [prefiltered.find_similar(query, 0.7) for query in self.queries]
+        found = sum(len(hits) for hits in actual)
+        total = sum(len(hits) for hits in expected)
+        self.assertGreater(total, len(self.queries))
+        self.assertGreaterEqual(found / total, 0.95)
+        for hits, reference in zip(actual, expected):
+            # Candidates are scored exactly, so every reported hit is a true hit
+            self.assertTrue(all(hit in reference for hit in hits))
+
+        candidates = [len(prefiltered.prefilter.candidates(query)) for query in self.queries]
+        self.assertLess(sum(candidates) / len(candidates), 0.5 * len(self.panel))
+        self.assertEqual(prefiltered.top_k(self.queries, 3, 0.7), self.exact.top_k(self.queries, 3, 0.7))
+
+    def test_save_and_load(self):
+        """Test that a saved index loads memory-mapped, quickly and with the same candidates."""
+        prefilter = AntibodyKmerPrefilter.build(self.exact)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'prefilter')
+            prefilter.save(path)
+            start = time.perf_counter()
+            loaded = AntibodyKmerPrefilter.load(path, self.exact)
+            self.assertLess(time.perf_counter() - start, 0.5)
+            for query in self.queries[:10]:
+                self.assertEqual(loaded.candidates(query).tolist(), prefilter.candidates(query).tolist())
+
+            with self.assertRaises(ValueError):
+                AntibodyKmerPrefilter.load(path, AntibodyReferenceIndex(self.panel[:-1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
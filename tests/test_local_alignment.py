@@ -0,0 +1,101 @@
+"""
+Unit tests for banded Smith-Waterman alignment scoring.
+"""
+
+import random
+import unittest
+from Bio import Align
+from Bio.Align import substitution_matrices
+from modules.antibody_validator import AntibodyValidator
+from modules.local_alignment import LocalAligner, smith_waterman_batch
+from modules.reference_index import AMINO_ACIDS
+from modules.sequence_validator import TherapeuticAntibodyValidator
+
+
+def indel_mutate(sequence, rng, rate=0.05):
+    """Point mutations, deletions and short insertions."""
+    residues = []
+    for aa in sequence:
+        roll = rng.random()
+        if roll < rate:
+            continue
+        if roll < 2 * rate:
+            aa = rng.choice(AMINO_ACIDS)
+        elif roll < 2.5 * rate:
+            residues.extend(rng.choices(AMINO_ACIDS, k=rng.randint(1, 3)))
+        residues.append(aa)
+    return ''.join(residues)
+
+
+class TestLocalAlignment(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(0)
+        self.reference_aligner = Align.PairwiseAligner(
+            mode='local', substitution_matrix=substitution_matrices.load('BLOSUM62'),
+            open_gap_score=-11, extend_gap_score=-1
+        )
+        self.antibodies = AntibodyValidator().antibodies
+
+    def expected(self, queries, references):
+        return [int(self.reference_aligner.score(q, r)) if q and r else 0 for q, r in zip(queries, references)]
+
+    def test_unbanded_matches_biopython(self):
+        """Test that full alignment scores equal Biopython's local aligner on random pairs."""
+        queries = [''.join(self.rng.choices(AMINO_ACIDS + 'X', k=self.rng.randint(0, 60))) for _ in range(100)]
+        references = [indel_mutate(q, self.rng, 0.1) if self.rng.random() < 0.6
+                      else ''.join(self.rng.choices(AMINO_ACIDS, k=self.rng.randint(1, 60))) for q in queries]
+        self.assertEqual(smith_waterman_batch(queries, references, bandwidth=None).tolist(),
+                         self.expected(queries, references))
+
+    def test_banded_matches_biopython_on_antibodies(self):
+        """Test that the band does not change scores of antibody chains with short indels."""
+        queries, references = [], []
+        for _ in range(60):
+            chains = self.rng.choice(self.antibodies)['sequence']
+            chain = chains[self.rng.choice(['heavy_chain', 'light_chain'])]
+            queries.append(indel_mutate(chain, self.rng))
+            references.append(chain)
+        expected = self.expected(queries, references)
+        self.assertEqual(smith_waterman_batch(queries, references, bandwidth=16).tolist(), expected)
+        # A band too narrow for the indels can only lose score
+        narrow = smith_waterman_batch(queries, references, bandwidth=0).tolist()
+        self.assertTrue(all(n <= e for n, e in zip(narrow, expected)))
+
+    def test_indel_keeps_similarity(self):
+        """Test that a single insertion barely affects alignment similarity, unlike the prefix score."""
+        validator = AntibodyValidator()
+        aligned = AntibodyValidator(similarity='alignment')
+        chain = self.antibodies[0]['sequence']['heavy_chain']
+        shifted = chain[:10] + 'G' + chain[10:]
+        self.assertLess(validator.calculate_similarity(shifted, chain), 0.5)
+        self.assertGreater(aligned.calculate_similarity(shifted, chain), 0.9)
+        self.assertEqual(aligned.calculate_similarity(chain, chain), 1.0)
+
+    def test_memoized_scores(self):
+        """Test that repeated pairs are served from the memo."""
+        aligner = LocalAligner(batch_size=4, cache_size=3)
+        pairs = [('ACDEFG', 'ACDFG'), ('KLMNP', 'KLMNP'), ('ACDEFG', 'ACDFG'), ('WYV', 'AAA'), ('HIK', 'HIK')]
+        first = aligner.scores(pairs).tolist()
+        self.assertEqual(first, self.expected(*zip(*pairs)))
+        self.assertEqual(len(aligner._cache), 3)
+        self.assertEqual(aligner.scores(pairs).tolist(), first)
+
+    def test_validators_use_alignment_backend(self):
+        """Test that both validators search references with the alignment backend."""
+        query = {chain: indel_mutate(seq, self.rng) for chain, seq in self.antibodies[2]['sequence'].items()}
+        prefix = AntibodyValidator().find_similar_antibodies(query, threshold=0.0)[0]
+        for validator_class in (AntibodyValidator, TherapeuticAntibodyValidator):
+            validator = validator_class(similarity='alignment')
+            hits = validator.find_similar_antibodies(query, threshold=0.5)
+            self.assertEqual(hits[0]['name'], self.antibodies[2]['name'])
+            self.assertGreater(hits[0]['similarity_score'], prefix['similarity_score'] + 0.2)
+            with self.assertRaises(ValueError):
+                validator_class(similarity='blast')
+
+        index = AntibodyValidator(similarity='alignment').reference_index
+        self.assertEqual(index.top_k([query], k=2, query_chunk=1, reference_chunk=2),
+                         [index.find_similar(query, 0.0)[:2]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+"""
+Unit tests for offline model snapshots.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import torch
+from tokenizers import Tokenizer
+from tokenizers.models import WordLevel
+from tokenizers.pre_tokenizers import Split
+from transformers import GPT2Config, GPT2LMHeadModel, PreTrainedTokenizerFast
+from modules.model_cache import load_model, load_tokenizer, manifest_entry, snapshot, verify_snapshot
+
+RESIDUES = "ACDEFGHIKLMNPQRSTVWY"
+
+
+class TestModelCache(unittest.TestCase):
+    def setUp(self):
+        """Save a small model and tokenizer to stand in for a hub checkpoint."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.source = os.path.join(self.temp_dir, 'source')
+        self.manifest = os.path.join(self.temp_dir, 'models', 'manifest.json')
+
+        torch.manual_seed(0)
+        self.model = GPT2LMHeadModel(GPT2Config(
+            vocab_size=len(RESIDUES) + 1, n_positions=64, n_embd=16, n_layer=2, n_head=2
+        )).eval()
+        self.model.save_pretrained(self.source)
+
+        vocab = {"<unk>": 0, **{aa: i + 1 for i, aa in enumerate(RESIDUES)}}
+        backend = Tokenizer(WordLevel(vocab, unk_token="<unk>"))
+        backend.pre_tokenizer = Split("", "isolated")
+        PreTrainedTokenizerFast(tokenizer_object=backend, unk_token="<unk>").save_pretrained(self.source)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_snapshot_round_trip(self):
+        """Test that a snapshot loads with identical weights and tokenization."""
+        entry = snapshot(self.source, path=self.manifest)
+        self.assertIn('model.safetensors', entry['weights'])
+        self.assertTrue(entry['tokenizer_files'])
+        self.assertEqual(manifest_entry(self.source, self.manifest)['config'], 'config.json')
+
+        # Loading must not touch the original checkpoint
+        shutil.rmtree(self.source)
+        tokenizer = load_tokenizer(self.source, self.manifest)
+        model = load_model(self.source, self.manifest)
+
+        input_ids = torch.tensor([tokenizer("MVLSPADKTN")["input_ids"]])
+        self.assertEqual(input_ids.shape[1], 10)
+        with torch.no_grad():
+            torch.testing.assert_close(model(input_ids).logits, self.model(input_ids).logits)
+        self.assertFalse(any(p.is_meta for p in model.parameters()))
+
+    def test_verify_detects_modified_files(self):
+        """Test that hash verification reports changed snapshot files."""
+        snapshot(self.source, path=self.manifest)
+        snapshot_dir = manifest_entry(self.source, self.manifest)['path']
+        self.assertEqual(verify_snapshot(self.source, self.manifest), [])
+
+        with open(os.path.join(snapshot_dir, 'model.safetensors'), 'ab') as f:
+            f.write(b'\0')
+        self.assertEqual(verify_snapshot(self.source, self.manifest), ['model.safetensors'])
+        self.assertEqual(verify_snapshot('unknown/model', self.manifest), ['unknown/model'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+"""
+Parity tests for the ONNX Runtime generation engine.
+"""
+
+import importlib.util
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import torch
+from transformers import GPT2Config, GPT2LMHeadModel
+from transformers.generation import (
+    NoRepeatNGramLogitsProcessor, RepetitionPenaltyLogitsProcessor, SuppressTokensLogitsProcessor,
+    TemperatureLogitsWarper, TopKLogitsWarper, TopPLogitsWarper
+)
+from modules.onnx_engine import NoRepeatNgram, process_logits
+
+HAS_ONNX = all(importlib.util.find_spec(name) for name in ('onnxruntime', 'onnxscript'))
+
+
+class TestLogitsProcessing(unittest.TestCase):
+    def test_matches_huggingface_processors(self):
+        """Test that sampling distributions match the Hugging Face processors."""
+        rng = np.random.default_rng(0)
+        logits = rng.normal(size=(4, 30)).astype(np.float32) * 3
+        sequences = rng.integers(0, 30, size=(4, 12))
+        suppress_tokens = [2, 5, 11, 17]
+
+        processors = [
+            RepetitionPenaltyLogitsProcessor(1.3), NoRepeatNGramLogitsProcessor(2),
+            SuppressTokensLogitsProcessor(suppress_tokens), TemperatureLogitsWarper(0.7), TopKLogitsWarper(20), TopPLogitsWarper(0.85)
+        ]
+        expected = torch.tensor(logits)
+        for processor in processors:
+            expected = processor(torch.tensor(sequences), expected)
+
+        actual = process_logits(
+            logits, sequences, temperature=0.7, top_k=20, top_p=0.85, repetition_penalty=1.3,
+            ngram_ban=NoRepeatNgram(2, sequences), suppress_tokens=np.array(suppress_tokens)
+        )
+        np.testing.assert_array_equal(np.isinf(actual), torch.isinf(expected).numpy())
+        np.testing.assert_allclose(
+            torch.softmax(torch.tensor(actual), -1).numpy(), torch.softmax(expected, -1).numpy(), atol=1e-6
+        )
+
+
+@unittest.skipUnless(HAS_ONNX, "onnxruntime and onnxscript are required for the ONNX engine")
+class TestOnnxEngine(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """Export a small randomly initialised GPT-2 once for all tests."""
+        from modules.onnx_engine import OnnxGenerationEngine, export_onnx
+
+        torch.manual_seed(0)
+        cls.model = GPT2LMHeadModel(GPT2Config(
+            vocab_size=32, n_positions=128, n_embd=16, n_layer=2, n_head=2, eos_token_id=0
+        )).eval()
+        cls.model_dir = tempfile.mkdtemp()
+        export_onnx(cls.model, cls.model_dir)
+        cls.engine = OnnxGenerationEngine(cls.model_dir)
+        cls.prompt = torch.tensor([[5, 9, 3, 17, 22, 8, 11]])
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.model_dir)
+
+    def test_forward_matches_pytorch(self):
+        """Test next-token logits with and without past key/values."""
+        logits, past = self.engine.forward(self.prompt.numpy(), self.engine._empty_past(), 0)
+        with torch.no_grad():
+            expected = self.model(self.prompt, use_cache=True)
+        np.testing.assert_allclose(logits, expected.logits.numpy(), atol=1e-5)
+
+        step_logits, _ = self.engine.forward(np.array([[4]]), past, self.prompt.shape[1])
+        with torch.no_grad():
+            full = self.model(torch.cat([self.prompt, torch.tensor([[4]])], dim=1)).logits
+        np.testing.assert_allclose(step_logits[:, -1], full[:, -1].numpy(), atol=1e-5)
+
+    def test_greedy_generation_matches_pytorch(self):
+        """Test that greedy decoding with penalties produces the same tokens."""
+        kwargs = dict(do_sample=False, max_new_tokens=12, repetition_penalty=1.3, no_repeat_ngram_size=2)
+        with torch.no_grad():
+            expected = self.model.generate(self.prompt, pad_token_id=0, **kwargs)
+        actual = self.engine.generate(self.prompt.numpy(), 1, pad_token_id=0, **kwargs)
+        np.testing.assert_array_equal(actual, expected.numpy())
+
+    def test_sampling_stops_rows_independently(self):
+        """Test residue-based stopping, padding and reproducible sampling."""
+        residue_counts = np.ones(32, dtype=np.int64)
+        np.random.seed(3)
+        first = self.engine.generate(self.prompt, 6, max_new_tokens=10, top_k=8, pad_token_id=31,
+                                     max_residues=4, residue_counts=residue_counts)
+        np.random.seed(3)
+        again = self.engine.generate(self.prompt, 6, max_new_tokens=10, top_k=8, pad_token_id=31,
+                                     max_residues=4, residue_counts=residue_counts)
+
+        np.testing.assert_array_equal(first, again)
+        self.assertEqual(first.shape[0], 6)
+        self.assertLessEqual(first.shape[1], self.prompt.shape[1] + 4)
+        np.testing.assert_array_equal(first[:, :self.prompt.shape[1]], np.repeat(self.prompt.numpy(), 6, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
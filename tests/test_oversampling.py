@@ -0,0 +1,84 @@
+"""
+Unit tests for adaptive oversampling control.
+"""
+
+import unittest
+from modules.oversampling import AdaptiveOversampler
+
+
+class TestAdaptiveOversampler(unittest.TestCase):
+    def setUp(self):
+        """Set up a controller with the default prior."""
+        self.oversampler = AdaptiveOversampler(prior_rate=0.5, window=5, min_marginal_yield=0.2)
+
+    def test_sample_size_tracks_acceptance_rate(self):
+        """Test that templates with higher acceptance rates get fewer samples."""
+        prior_samples = self.oversampler.num_samples('IGHV3-23*01', 3)
+        self.assertGreater(prior_samples, 3)
+
+        self.oversampler.record('IGHV3-23*01', 100, 95)
+        self.oversampler.record('IGHV1-69*01', 100, 10, {'homopolymer': 60, 'length': 30})
+
+        good = self.oversampler.num_samples('IGHV3-23*01', 3)
+        poor = self.oversampler.num_samples('IGHV1-69*01', 3)
+        self.assertLess(good, prior_samples)
+        self.assertEqual(good, 3)
+        self.assertGreater(poor, prior_samples)
+        self.assertLessEqual(poor, 3 * self.oversampler.max_factor)
+
+        summary = self.oversampler.summary()
+        self.assertEqual(summary['IGHV1-69*01']['rejections'], {'homopolymer': 60, 'length': 30})
+        self.assertEqual(summary['IGHV3-23*01']['accepted'], 95)
+
+    def test_yield_collapse(self):
+        """Test that collapse is only signalled after a full window of failures."""
+        self.oversampler.start_run()
+        for _ in range(4):
+            self.oversampler.record_attempt(False)
+        self.assertFalse(self.oversampler.yield_collapsed())
+
+        self.oversampler.record_attempt(False)
+        self.assertTrue(self.oversampler.yield_collapsed())
+
+        self.oversampler.record_attempt(True)
+        self.assertFalse(self.oversampler.yield_collapsed())
+
+        self.oversampler.start_run()
+        self.assertFalse(self.oversampler.yield_collapsed())
+        self.assertEqual(self.oversampler.max_attempts(4), 40)
+
+    def test_state_round_trip(self):
+        """Test that saved state restores counts and recent binder outcomes."""
+        self.oversampler.record('IGHV3-23*01', 10, 4, {'length': 6})
+        for accepted in (False, False, False, False):
+            self.oversampler.record_attempt(accepted)
+
+        restored = AdaptiveOversampler(window=5)
+        restored.load_state(self.oversampler.state())
+        self.assertEqual(restored.summary(), self.oversampler.summary())
+        restored.record_attempt(False)
+        self.assertTrue(restored.yield_collapsed())
+
+    def test_forks_keep_separate_windows(self):
+        """Test that forks have their own yield windows and merge only their new counts."""
+        self.oversampler.record('IGHV3-23*01', 10, 4, {'length': 6})
+        first, second = self.oversampler.fork(), self.oversampler.fork()
+        for _ in range(5):
+            first.record_attempt(False)
+        second.start_run()
+        self.assertTrue(first.yield_collapsed())
+        self.assertFalse(second.yield_collapsed())
+
+        first.record('IGHV3-23*01', 5, 1, {'length': 4})
+        second.record('IGKV1-39*01', 3, 3)
+        self.oversampler.merge(first)
+        self.oversampler.merge(second)
+        summary = self.oversampler.summary()
+        self.assertEqual((summary['IGHV3-23*01']['sampled'], summary['IGHV3-23*01']['accepted']), (15, 5))
+        self.assertEqual(summary['IGHV3-23*01']['rejections'], {'length': 10})
+        self.assertEqual(summary['IGKV1-39*01']['sampled'], 3)
+        self.assertFalse(self.oversampler.yield_collapsed())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+"""
+Unit tests for template prompt prefix caching.
+"""
+
+import unittest
+import torch
+from transformers import GPT2Config, GPT2LMHeadModel
+from modules.prompt_cache import PromptPrefixCache
+
+ALPHABET = " <>ACDEFGHIKLMNPQRSTVWXY"
+
+
+class CharTokenizer:
+    """Character-level tokenizer exposing the interface used by the cache."""
+
+    def __call__(self, text, return_tensors="pt", add_special_tokens=True, **kwargs):
+        return {"input_ids": torch.tensor([[ALPHABET.index(ch) for ch in text]])}
+
+
+class TestPromptPrefixCache(unittest.TestCase):
+    def setUp(self):
+        """Set up a small randomly initialised model."""
+        torch.manual_seed(0)
+        self.model = GPT2LMHeadModel(GPT2Config(
+            vocab_size=len(ALPHABET), n_positions=128, n_embd=16, n_layer=2, n_head=2
+        )).eval()
+        self.tokenizer = CharTokenizer()
+        self.cache = PromptPrefixCache()
+        self.prefix = "QVQLVQSGAEVKKPGXXXXWVRQ"
+        self.suffix = " TARGET <CDR>"
+
+    def test_cached_generation_matches_full_prompt(self):
+        """Test that greedy decoding from the cached prefix matches the full prompt."""
+        full_ids = self.tokenizer(self.prefix + self.suffix)["input_ids"]
+        expected = self.model.generate(
+            full_ids, attention_mask=torch.ones_like(full_ids),
+            do_sample=False, max_new_tokens=6, pad_token_id=0
+        )
+
+        inputs = self.cache.prepare_inputs(
+            self.model, self.tokenizer, "IGHV1-69*01", self.prefix, self.suffix, 2
+        )
+        outputs = self.model.generate(**inputs, do_sample=False, max_new_tokens=6, pad_token_id=0)
+
+        self.assertEqual(outputs.shape[0], 2)
+        self.assertTrue(torch.equal(outputs[0], expected[0]))
+        self.assertTrue(torch.equal(outputs[1], expected[0]))
+
+    def test_cache_reuse_and_invalidation(self):
+        """Test that entries are reused per template and dropped when the model changes."""
+        ids, first = self.cache.get(self.model, self.tokenizer, "IGHV1-69*01", self.prefix)
+        _, again = self.cache.get(self.model, self.tokenizer, "IGHV1-69*01", self.prefix)
+        self.assertIs(first, again)
+
+        # Generation must not extend the cached prefix in place
+        inputs = self.cache.prepare_inputs(
+            self.model, self.tokenizer, "IGHV1-69*01", self.prefix, self.suffix, 1
+        )
+        self.model.generate(**inputs, do_sample=False, max_new_tokens=3, pad_token_id=0)
+        self.assertEqual(first.get_seq_length(), ids.shape[1])
+
+        other_model = GPT2LMHeadModel(self.model.config).eval()
+        _, rebuilt = self.cache.get(other_model, self.tokenizer, "IGHV1-69*01", self.prefix)
+        self.assertIsNot(first, rebuilt)
+        self.assertEqual(len(self.cache), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
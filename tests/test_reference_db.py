@@ -0,0 +1,81 @@
+"""
+Unit tests for the compiled reference database.
+"""
+
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import unittest
+import numpy as np
+from modules.antibody_validator import AntibodyValidator
+from modules.reference_db import ReferenceDatabase, build_reference_db
+from modules.similarity_service import DEFAULT_REFERENCE_FILE, get_similarity_service
+from tests.test_reference_index import mutate
+
+
+class TestReferenceDatabase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        with open(DEFAULT_REFERENCE_FILE) as f:
+            self.data = json.load(f)
+        self.path = os.path.join(self.temp_dir, 'therapeutic_antibodies.refdb')
+        build_reference_db(self.data, self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_round_trip(self):
+        """Test that the database reproduces the JSON antibodies and locates their CDRs."""
+        db = ReferenceDatabase(self.path)
+        self.assertEqual(list(db.antibodies), self.data['therapeutic_antibodies'])
+        self.assertEqual(db.antibodies[-1], self.data['therapeutic_antibodies'][-1])
+        self.assertEqual(db.validation_metrics, self.data['validation_metrics'])
+        for chain in ('heavy', 'light'):
+            for antibody, spans in zip(self.data['therapeutic_antibodies'], db.cdr_spans(chain)):
+                sequence = antibody['sequence'][f'{chain}_chain']
+                for (start, end), name in zip(spans, ('cdr1', 'cdr2', 'cdr3')):
+                    self.assertEqual(sequence[start:end], antibody['cdr_regions'][chain][name])
+
+    def test_validator_reads_database(self):
+        """Test that a validator on the database finds the same similar antibodies as on the JSON."""
+        rng = random.Random(0)
+        from_json, from_db = AntibodyValidator(), AntibodyValidator(self.path)
+        self.assertIs(from_db.reference_index, get_similarity_service(self.path).index)
+        for antibody in self.data['therapeutic_antibodies']:
+            query = {chain: mutate(seq, rng, 0.1) for chain, seq in antibody['sequence'].items()}
+            self.assertEqual(from_db.find_similar_antibodies(query, 0.0), from_json.find_similar_antibodies(query, 0.0))
+        assembled = antibody['sequence']['heavy_chain'] + antibody['sequence']['light_chain']
+        self.assertEqual(get_similarity_service(self.path).best_score(assembled), 1.0)
+
+    def test_open_is_independent_of_size(self):
+        """Test that opening maps sections without reading or copying them."""
+        rng = random.Random(1)
+        base = self.data['therapeutic_antibodies']
+        large = dict(self.data, therapeutic_antibodies=[
+            dict(base[i % len(base)], name=f"ref{i}",
+                 sequence={chain: mutate(seq, rng, 0.1) for chain, seq in base[i % len(base)]['sequence'].items()})
+            for i in range(20000)
+        ])
+        large_path = os.path.join(self.temp_dir, 'large.refdb')
+        build_reference_db(large, large_path)
+
+        start = time.perf_counter()
+        db = ReferenceDatabase(large_path)
+        self.assertLess(time.perf_counter() - start, 0.05)
+        for array in db.sections.values():
+            self.assertFalse(array.flags.owndata or array.flags.writeable)
+        self.assertEqual(db.antibodies[12345]['sequence'], large['therapeutic_antibodies'][12345]['sequence'])
+        np.testing.assert_array_equal(db.sections['heavy_lengths'][:3],
+                                      [len(ab['sequence']['heavy_chain']) for ab in large['therapeutic_antibodies'][:3]])
+
+    def test_rejects_other_files(self):
+        """Test that files that are not reference databases fail to open."""
+        with self.assertRaises(ValueError):
+            ReferenceDatabase(DEFAULT_REFERENCE_FILE)
+
+
+if __name__ == '__main__':
+    unittest.main()
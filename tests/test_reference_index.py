@@ -0,0 +1,132 @@
+"""
+Unit tests for the vectorized reference similarity index.
+"""
+
+import random
+import unittest
+from modules.antibody_validator import AntibodyValidator, validate_generated_sequences
+from modules.kmer_index import AntibodyKmerPrefilter
+from modules.reference_index import (
+    AMINO_ACIDS, SIMILARITY_MATRIX, AntibodyReferenceIndex, ReferenceIndex, residue_similarity,
+    sequence_similarity
+)
+
+
+def mutate(sequence, rng, rate=0.15):
+    """Point mutations, a random truncation and an occasional extension."""
+    residues = [rng.choice(AMINO_ACIDS) if rng.random() < rate else aa for aa in sequence]
+    residues = residues[:len(residues) - rng.randint(0, 3)]
+    return ''.join(residues) + ''.join(rng.choices(AMINO_ACIDS, k=rng.randint(0, 2)))
+
+
+class TestReferenceIndex(unittest.TestCase):
+    def setUp(self):
+        self.validator = AntibodyValidator()
+        self.rng = random.Random(0)
+
+    def test_lookup_matrix(self):
+        """Test that the lookup matrix encodes the residue similarity rule."""
+        self.assertEqual(SIMILARITY_MATRIX.shape, (21, 21))
+        for i, aa1 in enumerate(AMINO_ACIDS):
+            for j, aa2 in enumerate(AMINO_ACIDS):
+                self.assertEqual(SIMILARITY_MATRIX[i, j], residue_similarity(aa1, aa2))
+        self.assertFalse(SIMILARITY_MATRIX[20].any() or SIMILARITY_MATRIX[:, 20].any())
+
+    def test_matches_pairwise_scores(self):
+        """Test that batch scores equal the per-pair scores for every reference."""
+        references = ['ACDEFGHIKL', 'MNPQRSTVWYACD', 'AC', 'KRHDE', '']
+        index = ReferenceIndex(references)
+        queries = ['ACDEFGHIKL', 'ILVMFYW', 'A', '', 'MNPQRSTVWYACDEFGH', 'ACXBZ', 'xx']
+        for query in queries:
+            expected = [sequence_similarity(query, ref) for ref in references]
+            self.assertEqual(index.similarities(query).tolist(), expected)
+
+    def test_find_similar_matches_validator_scores(self):
+        """Test that find_similar_antibodies equals the per-reference validator loop."""
+        for _ in range(50):
+            template = self.rng.choice(self.validator.antibodies)['sequence']
+            query = {
+                'heavy_chain': mutate(template['heavy_chain'], self.rng),
+                'light_chain': mutate(template['light_chain'], self.rng)
+            }
+            expected = []
+            for antibody in self.validator.antibodies:
+                heavy = self.validator.calculate_similarity(query['heavy_chain'], antibody['sequence']['heavy_chain'])
+                light = self.validator.calculate_similarity(query['light_chain'], antibody['sequence']['light_chain'])
+                expected.append((antibody['name'], round(0.6 * heavy + 0.4 * light, 3),
+                                 round(heavy, 3), round(light, 3)))
+            expected.sort(key=lambda x: x[1], reverse=True)
+
+            actual = self.validator.find_similar_antibodies(query, threshold=0.0)
+            self.assertEqual([(a['name'], a['similarity_score'], a['heavy_chain_similarity'],
+                               a['light_chain_similarity']) for a in actual], expected)
+
+
+class TestBatchRetrieval(unittest.TestCase):
+    def setUp(self):
+        """Set up a reference panel of mutated therapeutics and queries close to it."""
+        rng = random.Random(1)
+        base = AntibodyValidator().antibodies
+        self.panel = []
+        for i in range(23):
+            antibody = base[i % len(base)]
+            self.panel.append({
+                'name': f"ref{i}", 'target': antibody['target'], 'antibody_type': antibody['antibody_type'],
+                'sequence': {chain: mutate(seq, rng, 0.05) if i >= len(base) else seq
+                             for chain, seq in antibody['sequence'].items()}
+            })
+        self.index = AntibodyReferenceIndex(self.panel)
+        self.queries = [
+            {chain: mutate(seq, rng, 0.05) for chain, seq in rng.choice(self.panel)['sequence'].items()}
+            for _ in range(11)
+        ]
+        self.queries.append({'heavy_chain': self.queries[0]['heavy_chain'][:-1] + 'X',
+                             'light_chain': self.queries[0]['light_chain']})
+        self.queries.append(dict(self.panel[3]['sequence']))
+
+    def test_all_hits_match_single_query_search(self):
+        """Test that chunked retrieval of every hit equals find_similar for each query."""
+        expected = [self.index.find_similar(query, 0.5) for query in self.queries]
+        self.assertTrue(any(expected))
+        for query_chunk, reference_chunk in [(256, 4096), (3, 2), (1, 1), (5, 7)]:
+            actual = self.index.top_k(self.queries, None, 0.5, query_chunk, reference_chunk)
+            self.assertEqual(actual, expected)
+
+    def test_top_k_is_chunk_invariant(self):
+        """Test that the best k hits do not depend on the tiling."""
+        reference = self.index.top_k(self.queries, k=3)
+        for query, hits in zip(self.queries, reference):
+            self.assertEqual(len(hits), 3)
+            self.assertEqual(hits, self.index.find_similar(query, 0.0)[:3])
+        self.assertEqual(self.index.top_k(self.queries, 3, query_chunk=2, reference_chunk=3), reference)
+        self.assertEqual(reference[-1][0]['name'], 'ref3')
+
+    def test_top_k_breaks_rounded_ties_by_reference_order(self):
+        """Test that the k cut-off follows the rounded scores, not float noise below them."""
+        rng = random.Random(0)
+
+        def chain(length=None):
+            return ''.join(rng.choices(AMINO_ACIDS[:6], k=length or rng.randint(8, 12)))
+
+        # Small alphabets give many references with equal rounded scores
+        panel = [{'name': f"r{i}", 'target': '', 'antibody_type': '',
+                  'sequence': {'heavy_chain': chain(), 'light_chain': chain()}} for i in range(300)]
+        queries = [{'heavy_chain': chain(10), 'light_chain': chain(10)} for _ in range(50)]
+        index = AntibodyReferenceIndex(panel)
+        expected = [index.find_similar(query, 0.3)[:5] for query in queries]
+
+        self.assertEqual(index.top_k(queries, 5, 0.3, query_chunk=7, reference_chunk=33), expected)
+        index.prefilter = AntibodyKmerPrefilter.build(index, k=1, min_shared=0.0)
+        self.assertEqual(index.top_k(queries, 5, 0.3), expected)
+
+    def test_validate_generated_sequences_uses_batch_hits(self):
+        """Test that batch validation reports the same hits as per-sequence validation."""
+        validator = AntibodyValidator()
+        sequences = [dict(antibody['sequence']) for antibody in validator.antibodies[:3]]
+        results = validate_generated_sequences(sequences, chunk_size=2)
+        for sequence, entry in zip(sequences, results['validated_sequences']):
+            self.assertEqual(entry['validation'], validator.validate_antibody(sequence))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+"""
+Unit tests for the cross-run seen-sequence filter.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from modules.seen_filter import BloomFilter, SeenSequenceFilter
+
+
+class TestSeenSequenceFilter(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'seen.bloom')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_bloom_membership_and_false_positive_rate(self):
+        """Test membership and that the measured false positive rate matches the estimate."""
+        bloom = BloomFilter(capacity=2000, error_rate=0.01)
+        self.assertFalse(bloom.add("CDR0"))
+        for i in range(1, 2000):
+            bloom.add(f"CDR{i}")
+        self.assertTrue(all(f"CDR{i}" in bloom for i in range(2000)))
+        self.assertTrue(bloom.add("CDR5"))
+
+        false_positives = sum(f"OTHER{i}" in bloom for i in range(20000)) / 20000
+        self.assertLess(false_positives, 0.02)
+        self.assertAlmostEqual(bloom.false_positive_rate(), false_positives, delta=0.005)
+        self.assertAlmostEqual(bloom.estimated_items(), 2000, delta=100)
+
+    def test_merge_and_persistence(self):
+        """Test that merged and reloaded filters keep every item."""
+        first, second = BloomFilter(1000), BloomFilter(1000)
+        first.add("GFTFSSYA")
+        second.add("ARDRGYSS")
+        first.merge(second)
+        first.save(self.path)
+
+        loaded = BloomFilter.load(self.path)
+        self.assertIn("GFTFSSYA", loaded)
+        self.assertIn("ARDRGYSS", loaded)
+        self.assertEqual(loaded.items, 2)
+
+        with self.assertRaises(ValueError):
+            first.merge(BloomFilter(10))
+
+    def test_skips_sequences_from_earlier_runs(self):
+        """Test that a later run skips CDRs and binders recorded by an earlier one."""
+        earlier = SeenSequenceFilter(self.path, capacity=1000)
+        self.assertFalse(earlier.seen_cdr("GFTFSSYA"))
+        self.assertFalse(earlier.seen_binder("EVQLVESGGGLVQ"))
+        earlier.save()
+
+        later = SeenSequenceFilter(self.path)
+        self.assertTrue(later.seen_cdr("GFTFSSYA"))
+        self.assertTrue(later.seen_binder("EVQLVESGGGLVQ"))
+        # CDRs and assemblies are tracked separately
+        self.assertFalse(later.seen_binder("GFTFSSYA"))
+
+        summary = later.summary()
+        self.assertEqual(summary["skipped_cdrs"], 1)
+        self.assertEqual(summary["skipped_binders"], 1)
+        self.assertLess(summary["false_positive_rate"], 1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+"""
+Unit tests for the batched realism filters used by SequenceGenerator.
+"""
+
+import random
+import unittest
+from modules.sequence_generator import homopolymer_mask, realism_mask
+
+
+def reference_homopolymer(sequence, max_repeat=4):
+    """Loop-based homopolymer check the vectorized version must match."""
+    for i in range(len(sequence) - max_repeat + 1):
+        if len(set(sequence[i:i + max_repeat])) == 1:
+            return True
+    return False
+
+
+def reference_realism(sequence):
+    """Loop-based realism rules the vectorized version must match."""
+    rules = {
+        'proline_patterns': len([i for i in range(len(sequence)-1) if sequence[i:i+2] == 'PP']) <= 2,
+        'charged_spacing': not any(all(aa in 'KR' for aa in sequence[i:i+4]) for i in range(len(sequence)-3)),
+        'hydrophobic_balance': 0.2 <= len([aa for aa in sequence if aa in 'AILMFWV'])/len(sequence) <= 0.6,
+        'glycine_spacing': not any(all(aa == 'G' for aa in sequence[i:i+3]) for i in range(len(sequence)-2)),
+        'cysteine_pairs': sequence.count('C') % 2 == 0,
+        'charged_distribution': all(sequence[i:i+5].count('K') + sequence[i:i+5].count('R') <= 3
+                                    for i in range(len(sequence)-4))
+    }
+    return all(rules.values())
+
+
+class TestRealismFilters(unittest.TestCase):
+    def setUp(self):
+        """Set up random sequences biased towards the patterns being checked."""
+        rng = random.Random(0)
+        alphabet = 'AILMFWVKRGPCDEST'
+        self.sequences = [
+            ''.join(rng.choice(alphabet[:rng.randint(4, len(alphabet))]) for _ in range(rng.randint(1, 40)))
+            for _ in range(500)
+        ]
+        self.sequences += ['KRKR', 'GGG', 'PPAPPAPP', 'AAAA', 'KRAKRAKR', 'A\nIL']
+
+    def test_homopolymer_matches_reference(self):
+        """Test that the batched homopolymer check matches the per-sequence loop."""
+        for max_repeat in (2, 3, 4):
+            flags = homopolymer_mask(self.sequences, max_repeat)
+            expected = [reference_homopolymer(seq, max_repeat) for seq in self.sequences]
+            self.assertEqual(flags.tolist(), expected)
+
+    def test_realism_matches_reference(self):
+        """Test that the batched realism rules match the per-sequence loop."""
+        flags = realism_mask(self.sequences)
+        expected = [reference_realism(seq) for seq in self.sequences]
+        self.assertEqual(flags.tolist(), expected)
+        self.assertTrue(any(expected))
+
+    def test_empty_sequences_fail(self):
+        """Test that empty decodes are rejected instead of raising."""
+        self.assertEqual(realism_mask(['', 'AILKST']).tolist(), [False, True])
+
+
+if __name__ == '__main__':
+    unittest.main()
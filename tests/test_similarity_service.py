@@ -0,0 +1,97 @@
+"""
+Unit tests for the shared reference similarity service.
+"""
+
+import random
+import unittest
+from unittest import mock
+from modules.antibody_validator import AntibodyValidator
+from modules.generate_binders import AntibodyGenerator
+from modules.germline_templates import TemplateLibrary
+from modules.reference_index import AMINO_ACIDS
+from modules.revised.antibody_generator import AntibodyGenerator as RevisedAntibodyGenerator
+from modules.sequence_validator import TherapeuticAntibodyValidator
+from modules.similarity_service import get_similarity_service
+
+
+class TestSimilarityService(unittest.TestCase):
+    def setUp(self):
+        self.service = get_similarity_service()
+        self.antibody = self.service.antibodies[1]['sequence']
+
+    def test_shared_per_process_and_backend(self):
+        """Test that validators share one loaded dataset and index per backend."""
+        self.assertIs(get_similarity_service(), self.service)
+        self.assertIsNot(get_similarity_service(backend='alignment'), self.service)
+        first, second = AntibodyValidator(), TherapeuticAntibodyValidator()
+        self.assertIs(first.validation_data, second.validation_data)
+        self.assertIs(first.reference_index, self.service.index)
+        self.assertIs(second.reference_index, self.service.index)
+        with self.assertRaises(ValueError):
+            get_similarity_service(backend='blast')
+
+    def test_scores_chain_pairs_and_assembled_sequences(self):
+        """Test best scores of chain pairs and of VH+VL strings against the chain-split references."""
+        query = {'heavy_chain': self.antibody['heavy_chain'][:-2], 'light_chain': self.antibody['light_chain']}
+        self.assertEqual(round(self.service.best_score(query), 3),
+                         self.service.find_similar(query, 0.0)[0]['similarity_score'])
+
+        assembled = self.antibody['heavy_chain'] + self.antibody['light_chain']
+        self.assertEqual(self.service.best_score(assembled), 1.0)
+        shifted = assembled[:30] + 'G' + assembled[30:]
+        expected = max(self.service.chain_similarity(shifted, ab['sequence']['heavy_chain'] +
+                                                     ab['sequence']['light_chain'])
+                       for ab in self.service.antibodies)
+        self.assertEqual(self.service.best_score(shifted), expected)
+
+    def test_memoized_per_candidate(self):
+        """Test that a repeated candidate is not scored again."""
+        service = get_similarity_service(backend='alignment')
+        candidate = self.antibody['heavy_chain'] + 'GGGGS' + self.antibody['light_chain']
+        score = service.best_score(candidate)
+        with mock.patch.object(service.paired, 'similarities', side_effect=AssertionError):
+            self.assertEqual(service.best_score(candidate), score)
+
+    def test_generators_score_through_service(self):
+        """Test that both generators validate assembled antibodies with the shared service."""
+        assembled = self.antibody['heavy_chain'] + self.antibody['light_chain']
+        for generator_class in (AntibodyGenerator, RevisedAntibodyGenerator):
+            generator = generator_class.__new__(generator_class)
+            generator.similarity_service = get_similarity_service(backend='alignment')
+            self.assertEqual(generator._validate_sequence(assembled), 1.0)
+            generator.similarity_service = None
+            self.assertEqual(generator._validate_sequence(assembled), 0.5)
+
+    def test_assembled_candidates_reach_acceptance_threshold(self):
+        """Test that template-built candidates with therapeutic CDRs pass and random CDRs do not."""
+        library = TemplateLibrary.load()
+        generator = AntibodyGenerator.__new__(AntibodyGenerator)
+        rng = random.Random(0)
+
+        def assemble(vh, vl, heavy_cdrs, light_cdrs):
+            return generator._assemble_antibody(heavy_cdrs, light_cdrs, library[vh].frameworks,
+                                                library[vl].frameworks)
+
+        def cdrs(antibody, chain):
+            return [antibody['cdr_regions'][chain][name] for name in ('cdr1', 'cdr2', 'cdr3')]
+
+        adalimumab, rituximab = self.service.antibodies[0], self.service.antibodies[3]
+        generator.similarity_service = get_similarity_service(backend='alignment')
+        for vh, vl in [('IGHV3-23*01', 'IGKV1-39*01'), ('IGHV1-69*01', 'IGLV1-44*01')]:
+            score = generator._validate_sequence(assemble(vh, vl, cdrs(adalimumab, 'heavy'),
+                                                          cdrs(adalimumab, 'light')))
+            self.assertGreaterEqual(score, generator._acceptance_threshold())
+        for _ in range(20):
+            random_cdrs = [''.join(rng.choices(AMINO_ACIDS, k=rng.randint(5, 15))) for _ in range(6)]
+            score = generator._validate_sequence(assemble('IGHV3-23*01', 'IGKV1-39*01', random_cdrs[:3],
+                                                          random_cdrs[3:]))
+            self.assertLess(score, generator._acceptance_threshold())
+
+        generator.similarity_service = get_similarity_service(backend='prefix')
+        score = generator._validate_sequence(assemble('IGHV1-69*01', 'IGKV1-39*01', cdrs(rituximab, 'heavy'),
+                                                      cdrs(rituximab, 'light')))
+        self.assertGreaterEqual(score, generator._acceptance_threshold())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+"""
+Unit tests for speculative CDR sampling.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import torch
+from transformers import GPT2Config, GPT2LMHeadModel
+from modules.speculative_decoding import NgramDraftModel, SpeculativeDecoder, training_cdrs
+
+
+def tiny_model(vocab_size, scale=1.0):
+    """Randomly initialised GPT-2 small enough for exact checks."""
+    torch.manual_seed(0)
+    config = GPT2Config(vocab_size=vocab_size, n_positions=64, n_embd=16, n_layer=2, n_head=2,
+                        bos_token_id=0, eos_token_id=0)
+    model = GPT2LMHeadModel(config).eval()
+    with torch.no_grad():
+        model.lm_head.weight.mul_(scale)
+    return model
+
+
+class TestNgramDraftModel(unittest.TestCase):
+    def setUp(self):
+        """Set up a draft model trained on two short sequences."""
+        self.draft = NgramDraftModel(vocab_size=10, order=3).train([[1, 2, 3, 4], [1, 2, 5]], eos_token_id=0)
+
+    def test_distribution(self):
+        """Test that distributions are normalized and follow the training data."""
+        dist = self.draft.distribution([1, 2])
+        self.assertAlmostEqual(dist.sum(), 1.0)
+        self.assertEqual(set(np.flatnonzero(dist)), {0, 1, 2, 3, 4, 5})
+        self.assertGreater(dist[3], dist[1])
+        self.assertEqual(dist[3], dist[5])
+        # Unseen contexts back off to lower orders
+        self.assertAlmostEqual(self.draft.distribution([9, 9]).sum(), 1.0)
+
+    def test_propose(self):
+        """Test that proposals come with the distribution they were sampled from."""
+        np.random.seed(0)
+        tokens, dists = self.draft.propose([], 3)
+        self.assertEqual(len(tokens), 3)
+        for token, dist in zip(tokens, dists):
+            self.assertGreater(dist[token], 0)
+
+    def test_save_and_load(self):
+        """Test that saved models give identical distributions."""
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, 'draft.json')
+            self.draft.save(path)
+            loaded = NgramDraftModel.load(path)
+            np.testing.assert_array_equal(loaded.distribution([1, 2]), self.draft.distribution([1, 2]))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_training_cdrs(self):
+        """Test that CDRs of the therapeutic antibody dataset are collected."""
+        cdrs = training_cdrs()
+        self.assertIn('DDYAMH', cdrs)
+        self.assertTrue(all(cdrs))
+
+
+class TestSpeculativeDecoder(unittest.TestCase):
+    def test_greedy_matches_generate(self):
+        """Test that greedy decoding matches Hugging Face generate token for token."""
+        model = tiny_model(40)
+        np.random.seed(0)
+        draft = NgramDraftModel(40, order=3).train([list(np.random.randint(1, 40, 12)) for _ in range(50)], 0)
+        decoder = SpeculativeDecoder(model, draft, num_draft_tokens=4)
+
+        prompt = torch.tensor([[5, 6, 7, 8, 9, 10]])
+        kwargs = dict(do_sample=False, max_new_tokens=20, repetition_penalty=1.3,
+                      no_repeat_ngram_size=2, suppress_tokens=[3, 4])
+        expected = model.generate(prompt, pad_token_id=0, **kwargs)
+        actual = decoder.generate(prompt, 3, pad_token_id=0, **kwargs)
+        for row in actual:
+            self.assertEqual(row.tolist(), expected[0].tolist())
+        self.assertGreater(decoder.summary()["passes"], 0)
+
+    def test_sampling_keeps_target_distribution(self):
+        """Test that sampled token pairs follow the target model, not the draft."""
+        model = tiny_model(6, scale=4.0)
+        draft = NgramDraftModel(6, order=2).train([[1, 2, 3, 4, 5, 1, 2]])
+        decoder = SpeculativeDecoder(model, draft, num_draft_tokens=3)
+
+        np.random.seed(0)
+        prompt = torch.tensor([[1, 2, 3]])
+        outputs = decoder.generate(prompt, 20000, do_sample=True, top_k=0, temperature=0.8,
+                                   max_new_tokens=2, eos_token_id=99, pad_token_id=0)
+        empirical = np.zeros((6, 6))
+        for first, second in outputs[:, 3:].tolist():
+            empirical[first, second] += 1
+        empirical /= empirical.sum()
+
+        with torch.no_grad():
+            first = torch.softmax(model(prompt).logits[0, -1] / 0.8, -1)
+            exact = torch.stack([
+                first[token] * torch.softmax(model(torch.tensor([[1, 2, 3, token]])).logits[0, -1] / 0.8, -1)
+                for token in range(6)
+            ]).numpy()
+        self.assertLess(np.abs(empirical - exact).sum() / 2, 0.03)
+        self.assertGreater(decoder.summary()["accepted"], 0)
+
+    def test_stops_on_residue_count(self):
+        """Test that rows stop independently once they reach the residue limit."""
+        model = tiny_model(12)
+        draft = NgramDraftModel(12, order=2).train([[1, 2, 3, 4, 5]])
+        decoder = SpeculativeDecoder(model, draft, num_draft_tokens=3)
+
+        np.random.seed(1)
+        residue_counts = np.array([0] + [2] * 11)
+        outputs = decoder.generate([1, 2], 4, do_sample=True, max_new_tokens=30, eos_token_id=99,
+                                   pad_token_id=0, max_residues=7, residue_counts=residue_counts,
+                                   suppress_tokens=[0])
+        for row in outputs[:, 2:].tolist():
+            generated = [token for token in row if token != 0]
+            self.assertEqual(len(generated), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+"""
+Unit tests for budgeted bandit allocation of generation attempts.
+"""
+
+import random
+import unittest
+from modules.generation_telemetry import GenerationTelemetry
+from modules.germline_templates import TemplateLibrary
+from modules.oversampling import AdaptiveOversampler
+from modules.template_bandit import (
+    Arm, BudgetedThompsonSampler, build_arms, generate_binders_budgeted, motif_windows
+)
+
+# Binder acceptance rate per VH template; VL templates do not matter
+VH_YIELD = {'IGHV1-69*01': 0.05, 'IGHV3-23*01': 0.6}
+
+
+class StubGenerator:
+    """Generator stand-in whose acceptance depends on the VH template."""
+
+    def __init__(self, tokens_per_attempt=None):
+        self.template_library = TemplateLibrary.load()
+        self.oversampler = AdaptiveOversampler()
+        self.telemetry = GenerationTelemetry()
+        self.seen_filter = None
+        self.speculative_decoder = None
+        self.tokens_per_attempt = tokens_per_attempt or {}
+
+    def _tracked_attempt(self, target_motif, vh, vl):
+        self.telemetry.record_forward(0.0, self.tokens_per_attempt.get(vh.name, 50), 1)
+        if random.random() < VH_YIELD[vh.name]:
+            return {"sequence": target_motif, "template_vh": vh.name, "template_vl": vl.name}
+        return None
+
+
+class TestBandit(unittest.TestCase):
+    def setUp(self):
+        random.seed(0)
+        self.context = {'cleaned_sequence': 'MVLSPADKTNVKAAWGKVGAHAGEYGAEALERMFLSF'}
+
+    def test_arms_and_windows(self):
+        """Test that arms cover every template pair and context."""
+        library = TemplateLibrary.load()
+        arms = build_arms(library, ['AAA', 'CCC'])
+        self.assertEqual(len(arms), 12)
+        self.assertEqual(len({(arm.vh, arm.vl, arm.context) for arm in arms}), 12)
+        self.assertEqual({arm.vh for arm in build_arms(library, ['AAA'], 'family')}, {'IGHV1', 'IGHV3'})
+        self.assertEqual(motif_windows('A' * 10 + 'C' * 25, width=20, stride=10),
+                         ['A' * 10 + 'C' * 10, 'C' * 20, 'C' * 20])
+        self.assertEqual(motif_windows('ACD'), ['ACD'])
+
+    def test_prefers_cheaper_arm_at_equal_yield(self):
+        """Test that the sampler charges arms for their cost."""
+        arms = [Arm('a', 'x', ''), Arm('b', 'x', '')]
+        bandit = BudgetedThompsonSampler(arms, cost='tokens', rng=random.Random(1))
+        for _ in range(300):
+            arm = bandit.select()
+            bandit.update(arm, random.random() < 0.5, 0.0, 10 if arm.vh == 'a' else 40)
+        self.assertGreater(arms[0].pulls, 3 * arms[1].pulls)
+
+    def test_allocates_attempts_to_high_yield_templates(self):
+        """Test that attempts concentrate on the template that produces binders."""
+        result = generate_binders_budgeted(StubGenerator(), self.context, num_candidates=30)
+        stats = result["stats"]
+        self.assertEqual(stats["stop_reason"], 'target')
+        self.assertEqual(len(result["generated_binders"]), 30)
+
+        pulls = {}
+        for arm in stats["arms"]:
+            pulls[arm["vh"]] = pulls.get(arm["vh"], 0) + arm["pulls"]
+        self.assertGreater(pulls['IGHV3-23*01'], 3 * pulls['IGHV1-69*01'])
+        self.assertEqual(sum(pulls.values()), stats["attempts"])
+
+    def test_stops_when_token_budget_is_spent(self):
+        """Test that the run ends once the token budget is used up."""
+        result = generate_binders_budgeted(StubGenerator(), self.context, num_candidates=1000, tokens=2000,
+                                           contexts=motif_windows(self.context['cleaned_sequence']))
+        stats = result["stats"]
+        self.assertEqual(stats["stop_reason"], 'tokens')
+        self.assertEqual(stats["budget"]["spent_tokens"], 2000)
+        self.assertEqual(stats["attempts"], 40)
+        self.assertEqual(len(stats["arms"]), 18)
+
+
+if __name__ == '__main__':
+    unittest.main()